@@ -45,6 +45,7 @@
 #include "src/SetupPage/CaptivePortal.h"
 #include "src/WiFiServer/WiFiManager.h"
 #include "src/WiFiServer/Cloud.h"
+#include "src/WiFiServer/Backlog.h"
 #include "src/LocalDashboard/StatusLED.h"
 #include "src/HC12_RF/RFProtocol.h"
 #include "src/HC12_RF/OutletManager.h"
@@ -62,6 +63,7 @@ OutletManager  outletManager;
 SerialCLI      serialCLI(outletManager);
 BreakerMonitor breakerMonitor;
 Dashboard      dashboard(outletManager, configStorage, breakerMonitor);
+Backlog        backlog;
 
 // ─── State Machine ──────────────────────────────────────────
 enum class DeviceMode {
@@ -75,6 +77,7 @@ DeviceMode currentMode = DeviceMode::SETUP;
 // ─── Timing ─────────────────────────────────────────────────
 unsigned long lastCloudSend = 0;
 unsigned int  cloudFailCount = 0;    // Tracks consecutive failures to suppress spam
+unsigned long cloudBackoffMs = 0;    // Extra wait before the next cycle (server answered 429)
 unsigned long lastBreakerRead = 0;   // Timer for periodic blocking breaker reads
 const unsigned long BREAKER_READ_INTERVAL = 1500;  // 1.5s — same as dashboard poll
 
@@ -82,6 +85,69 @@ const unsigned long BREAKER_READ_INTERVAL = 1500;  // 1.5s — same as dashboard
 unsigned long lastBackgroundPoll = 0;
 uint8_t       backgroundDeviceIndex = 0;
 
+// Sampling plan from Django: "high" outlets share the fast cycle, "idle"
+// outlets are skipped by the round-robin until IDLE interval has passed
+uint8_t       highDeviceIndex = 0;
+unsigned long lastPolledAt[MAX_OUTLETS] = {0};
+unsigned long idleIntervalMs = 300000;
+
+// ─── Plan Parsing Helpers ───────────────────────────────────
+// Raw contents of a JSON string array, e.g. "FE","FD" for "high":["FE","FD"]
+String jsonArray(const String& json, const String& key) {
+    int start = json.indexOf("\"" + key + "\":[");
+    if (start < 0) return "";
+    start += key.length() + 4;
+    int end = json.indexOf("]", start);
+    return end > start ? json.substring(start, end) : "";
+}
+
+// n-th quoted entry of a raw array ("" when out of range)
+String arrayItem(const String& arr, int n) {
+    int pos = 0;
+    for (int i = 0; ; i++) {
+        int qStart = arr.indexOf("\"", pos);
+        if (qStart < 0) return "";
+        int qEnd = arr.indexOf("\"", qStart + 1);
+        if (qEnd < 0) return "";
+        if (i == n) return arr.substring(qStart + 1, qEnd);
+        pos = qEnd + 1;
+    }
+}
+
+bool arrayHas(const String& arr, const String& hexId) {
+    return arr.indexOf("\"" + hexId + "\"") >= 0;
+}
+
+String hexDeviceId(uint8_t id) {
+    String hex = String(id, HEX);
+    hex.toUpperCase();
+    return id < 0x10 ? "0" + hex : hex;
+}
+
+// Not delivered because of the network or the server (not a 4xx rejection) — keep for backfill.
+// 429: the server shed the request before reading it
+bool shouldBuffer(int res) {
+    return res <= 0 || res == 429 || res >= 500;
+}
+
+// Forward one batch of buffered readings; drops what the server acknowledged
+void forwardBacklog(const String& ccuHex) {
+    int res = cloud.sendBackfill(backlog.buildBatch(ccuHex, BACKFILL_BATCH_SIZE));
+    if (res != 200) return;
+
+    // {"success":true,...,"ack":123}
+    String body = cloud.getLastResponse();
+    body.replace(" ", "");
+    int aStart = body.indexOf("\"ack\":");
+    if (aStart < 0) return;
+    aStart += 6;
+    if (!isDigit(body[aStart])) return;  // "ack":null — nothing usable in the batch
+    int aEnd = aStart;
+    while (aEnd < (int)body.length() && isDigit(body[aEnd])) aEnd++;
+    backlog.acknowledge((uint32_t)strtoul(body.substring(aStart, aEnd).c_str(), NULL, 10));
+    Serial.println("[CLOUD] Backfill sent, " + String(backlog.size()) + " reading(s) left.");
+}
+
 // ─── Factory Reset Check ────────────────────────────────────
 void checkFactoryReset() {
     pinMode(RESET_BTN_PIN, INPUT_PULLUP);
@@ -154,6 +220,7 @@ void enterRunningMode() {
 
     // Initialize cloud communication
     cloud.begin(configStorage.getServerUrl());
+    backlog.begin();
     statusLED.setPattern(LEDPattern::SOLID);
 
     // Check if server is reachable
@@ -162,16 +229,14 @@ void enterRunningMode() {
         
         // Sync device list from Django database
         Serial.println("  Syncing device list from server...");
-        String devJson = cloud.fetchDevices();
+        String devJson = cloud.fetchSyncManifest(hexDeviceId(outletManager.getSenderID()));
         devJson.replace(" ", ""); // Strip spaces for parsing
         
         if (devJson.indexOf("\"success\":true") >= 0) {
-            // Parse device IDs from: {"success":true,"devices":["FE","FD"]}
-            int arrStart = devJson.indexOf("[");
-            int arrEnd = devJson.indexOf("]");
+            // Parse device IDs from: {"success":true,...,"devices":["FE","FD"],"outlets":[...]}
+            String arr = jsonArray(devJson, "devices");
             
-            if (arrStart >= 0 && arrEnd > arrStart) {
-                String arr = devJson.substring(arrStart + 1, arrEnd);
+            if (arr.length() > 0) {
                 int count = 0;
                 
                 while (arr.length() > 0) {
@@ -323,28 +388,24 @@ void loop() {
             }
 
             // Periodic cloud data sync & command fetch
-            if (millis() - lastCloudSend >= CLOUD_SEND_INTERVAL_MS) {
+            if (millis() - lastCloudSend >= CLOUD_SEND_INTERVAL_MS + cloudBackoffMs) {
                 lastCloudSend = millis();
                 bool anyFail = false;
 
-                // 0. Re-sync device list from Django (picks up newly added outlets)
-                String devJson = cloud.fetchDevices();
+                // 0. Re-sync device list from this CCU's manifest (304 when unchanged)
+                String devJson = cloud.fetchSyncManifest(hexDeviceId(outletManager.getSenderID()));
                 devJson.replace(" ", "");
                 if (devJson.indexOf("\"success\":true") >= 0) {
-                    int arrStart = devJson.indexOf("[");
-                    int arrEnd = devJson.indexOf("]");
-                    if (arrStart >= 0 && arrEnd > arrStart) {
-                        String arr = devJson.substring(arrStart + 1, arrEnd);
-                        while (arr.length() > 0) {
-                            int qStart = arr.indexOf("\"");
-                            if (qStart < 0) break;
-                            int qEnd = arr.indexOf("\"", qStart + 1);
-                            if (qEnd < 0) break;
-                            String devId = arr.substring(qStart + 1, qEnd);
-                            uint8_t id = (uint8_t)strtol(devId.c_str(), NULL, 16);
-                            outletManager.selectDevice(id); // No-op if already exists
-                            arr = arr.substring(qEnd + 1);
-                        }
+                    String arr = jsonArray(devJson, "devices");
+                    while (arr.length() > 0) {
+                        int qStart = arr.indexOf("\"");
+                        if (qStart < 0) break;
+                        int qEnd = arr.indexOf("\"", qStart + 1);
+                        if (qEnd < 0) break;
+                        String devId = arr.substring(qStart + 1, qEnd);
+                        uint8_t id = (uint8_t)strtol(devId.c_str(), NULL, 16);
+                        outletManager.selectDevice(id); // No-op if already exists
+                        arr = arr.substring(qEnd + 1);
                     }
                 }
 
@@ -357,23 +418,47 @@ void loop() {
                     breakerPayload += hexId + "\",";
                     
                     // Read live value directly — same source as dashboard
-                    breakerPayload += "\"current_ma\":" + String(breakerMonitor.getMilliAmps()) + "}";
+                    int breakerMa = breakerMonitor.getMilliAmps();
+                    uint32_t seq = backlog.nextSeq();
+                    breakerPayload += "\"current_ma\":" + String(breakerMa);
+                    breakerPayload += backlog.numbering(seq) + "}";
                     
                     int res = cloud.sendBreakerData(breakerPayload);
                     if (res != 200 && res != 201) anyFail = true;
+                    if (shouldBuffer(res)) backlog.addBreaker(seq, breakerMa);
                 }
 
-                // 2. Fetch focused device from Django
-                String focusJson = cloud.fetchFocusDevice();
-                focusJson.replace(" ", "");
+                // 2. Fetch this CCU's sampling plan from Django (304 when unchanged)
+                String ccuHex = hexDeviceId(outletManager.getSenderID());
+                String planJson = cloud.fetchSamplingPlan(ccuHex);
+                planJson.replace(" ", "");
+                String highList = jsonArray(planJson, "high");
+                String idleList = jsonArray(planJson, "idle");
                 String focusedId = "";
-                
-                // Parse: {"success":true,"device_id":"03"} or {"success":true,"device_id":null}
-                if (focusJson.indexOf("\"device_id\":\"") >= 0) {
-                    int idStart = focusJson.indexOf("\"device_id\":\"") + 13;
-                    int idEnd = focusJson.indexOf("\"", idStart);
-                    if (idEnd > idStart) {
-                        focusedId = focusJson.substring(idStart, idEnd);
+
+                if (planJson.indexOf("\"success\":true") >= 0) {
+                    int idleAt = planJson.indexOf("\"idle_interval_ms\":");
+                    if (idleAt >= 0) idleIntervalMs = planJson.substring(idleAt + 19).toInt();
+
+                    // High-rate outlets take turns on the fast cycle
+                    focusedId = arrayItem(highList, highDeviceIndex);
+                    if (focusedId.length() == 0) {
+                        highDeviceIndex = 0;
+                        focusedId = arrayItem(highList, 0);
+                    }
+                    highDeviceIndex++;
+                } else {
+                    // Older server without a sampling plan: fall back to the single focus
+                    String focusJson = cloud.fetchFocusDevice(ccuHex);
+                    focusJson.replace(" ", "");
+                    // Parse: {"success":true,"device_id":"03"} or {"success":true,"device_id":null}
+                    if (focusJson.indexOf("\"device_id\":\"") >= 0) {
+                        int idStart = focusJson.indexOf("\"device_id\":\"") + 13;
+                        int idEnd = focusJson.indexOf("\"", idStart);
+                        if (idEnd > idStart) {
+                            focusedId = focusJson.substring(idStart, idEnd);
+                            highList = "\"" + focusedId + "\"";
+                        }
                     }
                 }
 
@@ -393,6 +478,7 @@ void loop() {
                     if (devIdx >= 0) {
                         OutletDevice& dev = outletManager.getDevice(devIdx);
                         outletManager.selectDevice(dev.getDeviceId());
+                        lastPolledAt[devIdx] = millis();
                         
                         // Flush stale RX data
                         while(outletManager.getHC12().available()) {
@@ -419,10 +505,14 @@ void loop() {
                         payload += "\"relay_a\":" + String(dev.getRelayA() == 1 ? "true" : "false") + ",";
                         payload += "\"relay_b\":" + String(dev.getRelayB() == 1 ? "true" : "false") + ",";
                         bool isOverload = (dev.getCurrentA() == 65535 || dev.getCurrentB() == 65535);
-                        payload += "\"is_overload\":" + String(isOverload ? "true" : "false") + "}";
+                        payload += "\"is_overload\":" + String(isOverload ? "true" : "false") + ",";
+                        // Numbered, so a retried POST is not recorded twice
+                        uint32_t seq = backlog.nextSeq();
+                        payload += "\"ccu_id\":\"" + ccuHex + "\"" + backlog.numbering(seq) + "}";
                         
                         int res = cloud.sendSensorData(payload);
                         if (res != 200 && res != 201) anyFail = true;
+                        if (shouldBuffer(res)) backlog.addSensor(seq, dev.getDeviceId(), max(0, dev.getCurrentA()), max(0, dev.getCurrentB()), isOverload);
 
                         // Fetch commands only for the focused device
                         String devIdStr = String(dev.getDeviceId(), HEX);
@@ -506,16 +596,24 @@ void loop() {
                             backgroundDeviceIndex = 0;
                         }
 
-                        OutletDevice& bgDev = outletManager.getDevice(backgroundDeviceIndex);
+                        uint8_t bgIdx = backgroundDeviceIndex;
+                        OutletDevice& bgDev = outletManager.getDevice(bgIdx);
                         backgroundDeviceIndex++;  // Advance for next cycle
 
-                        // Skip the focused device (it's already polled every 2s)
-                        if (bgDev.getDeviceId() == focusId && focusId != 0) {
+                        // Skip high-rate devices (already polled on the fast cycle)
+                        String bgHex = hexDeviceId(bgDev.getDeviceId());
+                        if ((bgDev.getDeviceId() == focusId && focusId != 0) || arrayHas(highList, bgHex)) {
+                            continue;
+                        }
+                        // Idle devices (nobody watching) only once per idle interval
+                        if (arrayHas(idleList, bgHex) && lastPolledAt[bgIdx] != 0
+                            && millis() - lastPolledAt[bgIdx] < idleIntervalMs) {
                             continue;
                         }
 
-                        // Found a non-focused device — poll it
+                        // Found a device that is due — poll it
                         outletManager.selectDevice(bgDev.getDeviceId());
+                        lastPolledAt[bgIdx] = millis();
 
                         // Flush stale RX data
                         while(outletManager.getHC12().available()) {
@@ -541,10 +639,13 @@ void loop() {
                         bgPayload += "\"relay_a\":" + String(bgDev.getRelayA() == 1 ? "true" : "false") + ",";
                         bgPayload += "\"relay_b\":" + String(bgDev.getRelayB() == 1 ? "true" : "false") + ",";
                         bool bgOverload = (bgDev.getCurrentA() == 65535 || bgDev.getCurrentB() == 65535);
-                        bgPayload += "\"is_overload\":" + String(bgOverload ? "true" : "false") + "}";
+                        bgPayload += "\"is_overload\":" + String(bgOverload ? "true" : "false") + ",";
+                        uint32_t bgSeq = backlog.nextSeq();
+                        bgPayload += "\"ccu_id\":\"" + ccuHex + "\"" + backlog.numbering(bgSeq) + "}";
 
                         int bgRes = cloud.sendSensorData(bgPayload);
                         if (bgRes != 200 && bgRes != 201) anyFail = true;
+                        if (shouldBuffer(bgRes)) backlog.addSensor(bgSeq, bgDev.getDeviceId(), max(0, bgDev.getCurrentA()), max(0, bgDev.getCurrentB()), bgOverload);
 
                         // Also fetch & execute pending commands for this device
                         String bgDevIdStr = String(bgDev.getDeviceId(), HEX);
@@ -609,6 +710,17 @@ void loop() {
                     }
                 }
 
+                // Server answering again — forward what was buffered meanwhile
+                if (!anyFail && !backlog.isEmpty()) {
+                    forwardBacklog(hexDeviceId(outletManager.getSenderID()));
+                }
+
+                // Rate limited: honour Retry-After before the next cycle
+                cloudBackoffMs = cloud.takeRetryAfterMs();
+                if (cloudBackoffMs > 0) {
+                    Serial.println("[CLOUD] Rate limited, backing off " + String(cloudBackoffMs) + " ms.");
+                }
+
                 // Connection monitoring
                 if (!anyFail) {
                     if (cloudFailCount > 0) {
@@ -59,5 +59,7 @@
 #define CLOUD_SEND_INTERVAL_MS  2000      // How often to send data to server
 #define HTTP_TIMEOUT_MS         5000      // HTTP request timeout
 #define BACKGROUND_POLL_INTERVAL_MS  30000  // Poll non-focused outlets every 30s
+#define BACKLOG_CAPACITY        1000      // Readings kept while the server is unreachable (~20 bytes each)
+#define BACKFILL_BATCH_SIZE     50        // Backlog readings forwarded per cycle once the server answers
 
 #endif // CONFIG_H
@@ -43,6 +43,7 @@ void Dashboard::begin() {
 
     // External API (called by Django server)
     _server.on("/api/ext/relay",     HTTP_POST, [this]() { _handleExtRelay(); });
+    _server.on("/api/ext/relay-bulk", HTTP_POST, [this]() { _handleExtRelayBulk(); });
     _server.on("/api/ext/threshold", HTTP_POST, [this]() { _handleExtThreshold(); });
     _server.on("/api/ext/ping",      HTTP_GET,  [this]() { _handleExtPing(); });
 
@@ -586,6 +587,69 @@ void Dashboard::_handleExtThreshold() {
     _server.send(200, "application/json", "{\"success\":true}");
 }
 
+static void _appendFailed(String &failed, const String &item) {
+    if (failed.length() > 0) failed += ",";
+    failed += "\"";
+    failed += item;
+    failed += "\"";
+}
+
+// Several relay commands in one request: commands=FE:a:relay_off,FE:b:relay_off,...
+void Dashboard::_handleExtRelayBulk() {
+    String list = _server.arg("commands");
+    if (list.length() == 0) {
+        _server.send(400, "application/json", "{\"success\":false,\"error\":\"commands required\"}");
+        return;
+    }
+
+    int executed = 0;
+    String failed = "";
+    int pos = 0;
+    while (pos < (int)list.length()) {
+        int end = list.indexOf(',', pos);
+        if (end < 0) end = list.length();
+        String item = list.substring(pos, end);
+        pos = end + 1;
+
+        int c1 = item.indexOf(':');
+        int c2 = item.indexOf(':', c1 + 1);
+        if (c1 < 0 || c2 < 0) {
+            _appendFailed(failed, item);
+            continue;
+        }
+        String deviceIdStr = item.substring(0, c1);
+        String socketStr   = item.substring(c1 + 1, c2);
+        String command     = item.substring(c2 + 1);
+
+        uint8_t targetId = (uint8_t)strtol(deviceIdStr.c_str(), NULL, 16);
+        uint8_t sock = (socketStr == "b" || socketStr == "B" || socketStr == "2") ? SOCKET_B : SOCKET_A;
+        _manager.selectDevice(targetId);
+
+        if (command == "relay_on") {
+            _manager.relayOn(sock);
+        } else if (command == "relay_off") {
+            _manager.relayOff(sock);
+        } else {
+            _appendFailed(failed, item);
+            continue;
+        }
+
+        // Pump RF receiver briefly between commands to catch the PIC ACK
+        unsigned long start = millis();
+        while (millis() - start < 150) {
+            _manager.update();
+        }
+        executed++;
+    }
+
+    Serial.print("[EXT] bulk: ");
+    Serial.print(executed);
+    Serial.println(" command(s) sent");
+
+    _server.send(200, "application/json",
+        "{\"success\":true,\"executed\":" + String(executed) + ",\"failed\":[" + failed + "]}");
+}
+
 void Dashboard::_handleExtPing() {
     String json = "{\"alive\":true,\"uptime_ms\":" + String(millis()) + "}";
     _server.send(200, "application/json", json);
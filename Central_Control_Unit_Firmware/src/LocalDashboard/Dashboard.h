@@ -74,6 +74,7 @@ private:
 
     // ─── External API (called by Django server) ──
     void _handleExtRelay();             // POST /api/ext/relay
+    void _handleExtRelayBulk();         // POST /api/ext/relay-bulk?commands=FE:a:relay_off,...
     void _handleExtThreshold();         // POST /api/ext/threshold
     void _handleExtPing();              // GET  /api/ext/ping
 
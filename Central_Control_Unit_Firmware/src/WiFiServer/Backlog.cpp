@@ -0,0 +1,91 @@
+/*
+ * Backlog.cpp
+ * ------------
+ * Implementation of the store-and-forward reading buffer.
+ */
+
+#include "Backlog.h"
+
+Backlog::Backlog()
+    : _head(0),
+      _count(0),
+      _nextSeq(0),
+      _bootId(0) {}
+
+void Backlog::begin() {
+    _bootId = esp_random();
+    Serial.println("[Backlog] Boot ID " + String(_bootId));
+}
+
+uint32_t Backlog::nextSeq() {
+    return _nextSeq++;
+}
+
+String Backlog::numbering(uint32_t seq) const {
+    return ",\"boot_id\":" + String(_bootId) + ",\"seq\":" + String(seq);
+}
+
+BacklogEntry& Backlog::_push(uint32_t seq) {
+    if (_count == BACKLOG_CAPACITY) {
+        // Full — drop the oldest reading
+        _head = (_head + 1) % BACKLOG_CAPACITY;
+        _count--;
+    }
+    BacklogEntry& entry = _entries[(_head + _count) % BACKLOG_CAPACITY];
+    _count++;
+    entry.seq = seq;
+    entry.takenAt = millis();
+    return entry;
+}
+
+void Backlog::addSensor(uint32_t seq, uint8_t deviceId, uint16_t currentA, uint16_t currentB, bool isOverload) {
+    BacklogEntry& entry = _push(seq);
+    entry.isBreaker = false;
+    entry.deviceId = deviceId;
+    entry.currentA = currentA;
+    entry.currentB = currentB;
+    entry.isOverload = isOverload;
+}
+
+void Backlog::addBreaker(uint32_t seq, uint32_t currentMa) {
+    BacklogEntry& entry = _push(seq);
+    entry.isBreaker = true;
+    entry.deviceId = 0;
+    entry.currentA = currentMa;
+    entry.currentB = 0;
+    entry.isOverload = false;
+}
+
+bool Backlog::isEmpty() const   { return _count == 0; }
+uint16_t Backlog::size() const  { return _count; }
+
+String Backlog::buildBatch(const String& ccuId, uint16_t maxItems) const {
+    uint32_t now = millis();
+    String json = "{\"ccu_id\":\"" + ccuId + "\",\"boot_id\":" + String(_bootId) + ",\"readings\":[";
+    uint16_t n = min(maxItems, _count);
+    for (uint16_t i = 0; i < n; i++) {
+        const BacklogEntry& e = _entries[(_head + i) % BACKLOG_CAPACITY];
+        if (i > 0) json += ",";
+        json += "{\"seq\":" + String(e.seq) + ",\"age_ms\":" + String(now - e.takenAt);
+        if (e.isBreaker) {
+            json += ",\"current_ma\":" + String(e.currentA) + "}";
+        } else {
+            String hexId = String(e.deviceId, HEX);
+            hexId.toUpperCase();
+            if (e.deviceId < 0x10) hexId = "0" + hexId;
+            json += ",\"device_id\":\"" + hexId + "\"";
+            json += ",\"current_a\":" + String(e.currentA);
+            json += ",\"current_b\":" + String(e.currentB);
+            json += ",\"is_overload\":" + String(e.isOverload ? "true" : "false") + "}";
+        }
+    }
+    json += "]}";
+    return json;
+}
+
+void Backlog::acknowledge(uint32_t ack) {
+    while (_count > 0 && _entries[_head].seq <= ack) {
+        _head = (_head + 1) % BACKLOG_CAPACITY;
+        _count--;
+    }
+}
@@ -0,0 +1,64 @@
+/*
+ * Backlog.h
+ * ----------
+ * Store-and-forward buffer for readings the server did not accept live
+ * (WiFi down, server cold-starting). Every reading sent gets a sequence
+ * number (counted from 0 per boot, with a random boot ID) before its live
+ * POST, so a retry or a later backfill of the same reading is recognised
+ * by the server. Buffered readings keep that number and the millis() they
+ * were taken at; the buffer is forwarded oldest first to POST /api/backfill/
+ * once the server answers again. When full, the oldest reading is dropped.
+ */
+
+#ifndef BACKLOG_H
+#define BACKLOG_H
+
+#include <Arduino.h>
+#include "../../Config.h"
+
+struct BacklogEntry {
+    uint32_t seq;
+    uint32_t takenAt;      // millis() when read
+    uint8_t  deviceId;     // Outlet hex ID; ignored for breaker readings
+    bool     isBreaker;
+    bool     isOverload;
+    uint32_t currentA;     // Breaker: current_ma
+    uint16_t currentB;
+};
+
+class Backlog {
+public:
+    Backlog();
+
+    // Pick a random boot ID (call once at boot)
+    void begin();
+
+    // Sequence number for the next reading sent live
+    uint32_t nextSeq();
+    // ,"boot_id":..,"seq":.. fields for a live payload
+    String numbering(uint32_t seq) const;
+
+    // Buffer a reading whose live send (numbered `seq`) failed
+    void addSensor(uint32_t seq, uint8_t deviceId, uint16_t currentA, uint16_t currentB, bool isOverload);
+    void addBreaker(uint32_t seq, uint32_t currentMa);
+
+    bool isEmpty() const;
+    uint16_t size() const;
+
+    // JSON body for /api/backfill/ with the oldest `maxItems` readings
+    String buildBatch(const String& ccuId, uint16_t maxItems) const;
+
+    // Drop every reading up to and including sequence number `ack`
+    void acknowledge(uint32_t ack);
+
+private:
+    BacklogEntry _entries[BACKLOG_CAPACITY];
+    uint16_t     _head;    // Oldest entry
+    uint16_t     _count;
+    uint32_t     _nextSeq;
+    uint32_t     _bootId;
+
+    BacklogEntry& _push(uint32_t seq);
+};
+
+#endif // BACKLOG_H
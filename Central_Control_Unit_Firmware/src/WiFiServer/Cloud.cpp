@@ -9,7 +9,14 @@
 Cloud::Cloud()
     : _serverUrl(""),
       _lastResponseCode(0),
-      _lastResponse("") {}
+      _lastResponse(""),
+      _focusVersion(""),
+      _focusBody(""),
+      _planVersion(""),
+      _planBody(""),
+      _syncEtag(""),
+      _syncBody(""),
+      _retryAfterMs(0) {}
 
 void Cloud::begin(const String& serverUrl) {
     _serverUrl = serverUrl;
@@ -23,38 +30,30 @@ void Cloud::begin(const String& serverUrl) {
 }
 
 int Cloud::sendSensorData(const String& jsonPayload) {
-    if (_serverUrl.length() == 0 || WiFi.status() != WL_CONNECTED) {
-        return -1;
-    }
+    return _post("/api/data/", jsonPayload);
+}
 
-    HTTPClient http;
-    String endpoint = _serverUrl + "/api/data/";
-    
-    http.begin(endpoint);
-    http.addHeader("Content-Type", "application/json");
-    http.setTimeout(HTTP_TIMEOUT_MS);
+int Cloud::sendBreakerData(const String& jsonPayload) {
+    return _post("/api/breaker-data/", jsonPayload);
+}
 
-    _lastResponseCode = http.POST(jsonPayload);
-    if (_lastResponseCode > 0) {
-        _lastResponse = http.getString();
-    } else {
-        _lastResponse = http.errorToString(_lastResponseCode);
-    }
-    http.end();
-    return _lastResponseCode;
+int Cloud::sendBackfill(const String& jsonPayload) {
+    return _post("/api/backfill/", jsonPayload);
 }
 
-int Cloud::sendBreakerData(const String& jsonPayload) {
+int Cloud::_post(const String& path, const String& jsonPayload) {
     if (_serverUrl.length() == 0 || WiFi.status() != WL_CONNECTED) {
         return -1;
     }
 
     HTTPClient http;
-    String endpoint = _serverUrl + "/api/breaker-data/";
+    String endpoint = _serverUrl + path;
     
     http.begin(endpoint);
     http.addHeader("Content-Type", "application/json");
     http.setTimeout(HTTP_TIMEOUT_MS);
+    const char* headerKeys[] = {"Retry-After"};
+    http.collectHeaders(headerKeys, 1);
 
     _lastResponseCode = http.POST(jsonPayload);
     if (_lastResponseCode > 0) {
@@ -62,10 +61,21 @@ int Cloud::sendBreakerData(const String& jsonPayload) {
     } else {
         _lastResponse = http.errorToString(_lastResponseCode);
     }
+    if (_lastResponseCode == 429) {
+        // Server is shedding this CCU's requests — remember how long to back off
+        unsigned long waitMs = http.header("Retry-After").toInt() * 1000UL;
+        if (waitMs > _retryAfterMs) _retryAfterMs = waitMs;
+    }
     http.end();
     return _lastResponseCode;
 }
 
+unsigned long Cloud::takeRetryAfterMs() {
+    unsigned long waitMs = _retryAfterMs;
+    _retryAfterMs = 0;
+    return waitMs;
+}
+
 String Cloud::fetchCommands(const String& deviceId) {
     if (_serverUrl.length() == 0 || WiFi.status() != WL_CONNECTED) {
         return "";
@@ -91,54 +101,92 @@ String Cloud::fetchCommands(const String& deviceId) {
     return responseBody;
 }
 
-String Cloud::fetchDevices() {
+String Cloud::fetchSyncManifest(const String& ccuId) {
     if (_serverUrl.length() == 0 || WiFi.status() != WL_CONNECTED) {
         return "";
     }
 
     HTTPClient http;
-    String endpoint = _serverUrl + "/api/devices/";
+    String endpoint = _serverUrl + "/api/sync/?ccu_id=" + ccuId;
     
     http.begin(endpoint);
     http.setTimeout(HTTP_TIMEOUT_MS);
+    const char* headerKeys[] = {"ETag"};
+    http.collectHeaders(headerKeys, 1);
+    if (_syncEtag.length() > 0) {
+        http.addHeader("If-None-Match", _syncEtag);
+    }
 
     _lastResponseCode = http.GET();
-    String responseBody = "";
     
     if (_lastResponseCode == 200) {
-        responseBody = http.getString();
+        _syncBody = http.getString();
+        _syncEtag = http.header("ETag");
+    } else if (_lastResponseCode == 304) {
+        // Unchanged — reuse the cached manifest
     } else if (_lastResponseCode > 0) {
         _lastResponse = http.getString();
+        _syncEtag = "";
+        _syncBody = "";
     } else {
         _lastResponse = http.errorToString(_lastResponseCode);
+        _syncEtag = "";
+        _syncBody = "";
     }
     http.end();
-    return responseBody;
+    return _syncBody;
 }
 
-String Cloud::fetchFocusDevice() {
+String Cloud::fetchFocusDevice(const String& ccuId) {
+    return _fetchVersioned("/api/focus/?ccu_id=" + ccuId, _focusVersion, _focusBody);
+}
+
+String Cloud::fetchSamplingPlan(const String& ccuId) {
+    return _fetchVersioned("/api/sampling-plan/?ccu_id=" + ccuId, _planVersion, _planBody);
+}
+
+// GET with the last seen "version"; on 304 (unchanged) the cached body is returned.
+String Cloud::_fetchVersioned(const String& path, String& version, String& cached) {
     if (_serverUrl.length() == 0 || WiFi.status() != WL_CONNECTED) {
         return "";
     }
 
     HTTPClient http;
-    String endpoint = _serverUrl + "/api/focus/";
+    String endpoint = _serverUrl + path;
+    if (version.length() > 0) {
+        endpoint += "&version=" + version;
+    }
     
     http.begin(endpoint);
     http.setTimeout(HTTP_TIMEOUT_MS);
 
     _lastResponseCode = http.GET();
-    String responseBody = "";
     
     if (_lastResponseCode == 200) {
-        responseBody = http.getString();
+        cached = http.getString();
+        // Remember the version: {"success":true,...,"version":1718000000000,...}
+        String body = cached;
+        body.replace(" ", "");
+        int vStart = body.indexOf("\"version\":");
+        if (vStart >= 0) {
+            vStart += 10;
+            int vEnd = vStart;
+            while (vEnd < (int)body.length() && isDigit(body[vEnd])) vEnd++;
+            version = body.substring(vStart, vEnd);
+        }
+    } else if (_lastResponseCode == 304) {
+        // Unchanged — reuse the cached answer
     } else if (_lastResponseCode > 0) {
         _lastResponse = http.getString();
+        version = "";
+        cached = "";
     } else {
         _lastResponse = http.errorToString(_lastResponseCode);
+        version = "";
+        cached = "";
     }
     http.end();
-    return responseBody;
+    return cached;
 }
 
 bool Cloud::isReachable() {
@@ -25,14 +25,26 @@ public:
     // Send JSON data to server via POST (Main Breaker)
     int sendBreakerData(const String& jsonPayload);
 
+    // Forward buffered readings to /api/backfill/ (see Backlog)
+    int sendBackfill(const String& jsonPayload);
+
     // Fetch pending commands for a specific device (GET request)
     String fetchCommands(const String& deviceId);
 
-    // Fetch registered device list from server (GET request)
-    String fetchDevices();
+    // Fetch this CCU's sync manifest (its outlets, relay states, thresholds,
+    // focus). Sends If-None-Match; on 304 (unchanged) returns the cached body.
+    String fetchSyncManifest(const String& ccuId);
+
+    // Fetch this CCU's focused device from server (GET request).
+    // Sends the last version seen; on 304 (unchanged) returns the cached answer.
+    String fetchFocusDevice(const String& ccuId);
+
+    // Fetch this CCU's sampling plan (which outlets to read fast / in the
+    // background / rarely). Same version + 304 caching as fetchFocusDevice.
+    String fetchSamplingPlan(const String& ccuId);
 
-    // Fetch the currently focused device from server (GET request)
-    String fetchFocusDevice();
+    // Longest Retry-After (ms) of the 429 answers since the last call, then reset
+    unsigned long takeRetryAfterMs();
 
     // Check if server is reachable (GET request)
     bool isReachable();
@@ -50,6 +62,17 @@ private:
     String _serverUrl;
     int    _lastResponseCode;
     String _lastResponse;
+    String _focusVersion;   // Version of the cached focus answer ("" = none yet)
+    String _focusBody;      // Last 200 body from /api/focus/
+    String _planVersion;
+    String _planBody;       // Last 200 body from /api/sampling-plan/
+    String _syncEtag;
+    String _syncBody;       // Last 200 body from /api/sync/
+    unsigned long _retryAfterMs;
+
+    int _post(const String& path, const String& jsonPayload);
+
+    String _fetchVersioned(const String& path, String& version, String& cached);
 };
 
 #endif // CLOUD_H
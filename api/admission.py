@@ -0,0 +1,128 @@
+"""
+Admission control for the CCU ingest endpoints.
+
+A CCU stuck posting in a tight loop would otherwise take the Daphne worker
+and the database connections from every other tenant. Each device gets a
+token bucket per endpoint: sensor data per outlet, breaker data and backfill
+per CCU. A request without a token is answered 429 with Retry-After before
+the view runs — no database work.
+
+The firmware's cycle (CLOUD_SEND_INTERVAL_MS = 2s in Config.h) sends at
+most one reading per outlet, one breaker reading and one backfill batch per
+cycle, i.e. 0.5/s each. The default rates allow twice that, and
+ADMISSION_BURST requests at once for retries after a timeout.
+
+Process-local like the other in-memory ingest state: with several workers
+each enforces the rate on the requests it receives.
+"""
+import json
+import math
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from decouple import config
+from django.http import JsonResponse
+
+from .focus import normalize_ccu_id
+
+ADMISSION_ENABLED = config('ADMISSION_ENABLED', default=True, cast=bool)
+CYCLE_SECONDS = 2.0     # CLOUD_SEND_INTERVAL_MS (firmware)
+OUTLET_RATE = config('ADMISSION_OUTLET_RATE', default=2 / CYCLE_SECONDS, cast=float)
+CCU_RATE = config('ADMISSION_CCU_RATE', default=2 / CYCLE_SECONDS, cast=float)
+BURST = config('ADMISSION_BURST', default=10, cast=int)
+# Idle buckets (full again) are dropped once there are this many
+MAX_BUCKETS = 4096
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, now):
+        self.tokens = float(BURST)
+        self.updated = now
+
+
+_buckets = {}           # (kind, device id) → _Bucket
+_admitted = Counter()   # 'outlet FE' / 'breaker 01' → requests let through
+_shed = Counter()       # same keys → requests answered 429
+_lock = threading.Lock()
+
+
+def _prune(now):
+    """Caller holds _lock."""
+    idle = [key for key, bucket in _buckets.items()
+            if bucket.tokens + (now - bucket.updated) * _rate(key[0]) >= BURST]
+    for key in idle:
+        del _buckets[key]
+
+
+def _rate(kind):
+    return OUTLET_RATE if kind == 'outlet' else CCU_RATE
+
+
+def take(kind, device_id):
+    """Spend a token of the device's bucket. Returns 0 if admitted, else seconds to wait."""
+    key = (kind, device_id)
+    rate = _rate(kind)
+    now = time.monotonic()
+    with _lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            if len(_buckets) >= MAX_BUCKETS:
+                _prune(now)
+            bucket = _buckets[key] = _Bucket(now)
+        bucket.tokens = min(BURST, bucket.tokens + (now - bucket.updated) * rate)
+        bucket.updated = now
+        name = f'{kind} {device_id}'
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            _admitted[name] += 1
+            return 0
+        _shed[name] += 1
+        return (1 - bucket.tokens) / rate
+
+
+def stats():
+    with _lock:
+        return {
+            'enabled': ADMISSION_ENABLED,
+            'outlet_rate': OUTLET_RATE,
+            'ccu_rate': CCU_RATE,
+            'burst': BURST,
+            'admitted': sum(_admitted.values()),
+            'shed': sum(_shed.values()),
+            'devices': {name: {'admitted': _admitted[name], 'shed': count}
+                        for name, count in _shed.most_common()},
+        }
+
+
+def _device_id(request, kind):
+    try:
+        data = json.loads(request.body)
+        if kind == 'outlet':
+            return str(data['device_id']).upper()
+        return normalize_ccu_id(data['ccu_id'])
+    except (ValueError, KeyError, TypeError):
+        return None     # The view answers 400
+
+
+def admitted(kind):
+    """Shed a device's requests above its rate: kind 'outlet' (keyed by device_id), 'breaker' or 'backfill' (ccu_id)."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            device_id = _device_id(request, kind) if ADMISSION_ENABLED else None
+            if device_id is not None:
+                wait = take(kind, device_id)
+                if wait:
+                    response = JsonResponse({
+                        'success': False,
+                        'message': 'Too many requests from this device'
+                    }, status=429)
+                    response['Retry-After'] = str(math.ceil(wait))
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,99 @@
+"""
+Store-and-forward backfill from the CCU.
+
+When a live send fails (Wi-Fi down, server cold-starting on Render) the CCU
+keeps the reading with its age and a sequence number — counted from 0 at
+every boot, with a random boot_id — and posts the backlog to /api/backfill/
+once the server answers again. By then the readings are history, so they are
+only recorded: SensorData / MainBreakerReading rows (compressed per device,
+see outlets.history), telemetry chunks and energy. Alerts, WebSocket pushes,
+liveness and the sampling plan stay with the live readings. Each device's
+readings are conditioned as one batch (outlets.conditioning).
+
+Live and backfilled readings share the CCU's sequence numbers, so a reading
+is recorded once however often it arrives. The backlog is forwarded in seq
+order, so readings at or below the CCU's backfill_seq (its highest
+backfilled seq for the boot, kept on the CCU row) were sent in an earlier
+batch. Others are dropped if their seq is in the CCU's idempotency window
+(api.idempotency — the live POST was handled but its answer lost) or is
+already stored as a row (same, from before a server restart). The rows
+carry a unique (device, boot_id, seq) constraint as well.
+"""
+from collections import defaultdict
+
+from outlets import conditioning, energy, history, telemetry
+from outlets.models import MainBreakerReading, SensorData
+
+from . import idempotency
+
+
+def _stored_seqs(ccu_id, boot_id, outlets, seqs):
+    """Sequence numbers of this boot already persisted as rows."""
+    stored = set(SensorData.objects.filter(outlet__in=outlets, boot_id=boot_id, seq__in=seqs)
+                 .values_list('seq', flat=True))
+    stored.update(MainBreakerReading.objects.filter(ccu_id=ccu_id, boot_id=boot_id, seq__in=seqs)
+                  .values_list('seq', flat=True))
+    return stored
+
+
+def _advance(ccu, boot_id, mark, readings):
+    """Move the CCU's backfill watermark past this batch."""
+    highest = max((r['seq'] for r in readings), default=-1)
+    if ccu is not None and highest > mark:
+        ccu.backfill_boot_id, ccu.backfill_seq = boot_id, highest
+        ccu.save(update_fields=['backfill_boot_id', 'backfill_seq'])
+
+
+def ingest(ccu_id, ccu, boot_id, readings):
+    """
+    Record past readings of one CCU. Each reading is a dict with seq,
+    timestamp and either outlet, current_a, current_b, is_overload or
+    current_ma (main breaker). Returns (recorded, duplicates).
+    """
+    mark = ccu.backfill_seq if ccu is not None and ccu.backfill_boot_id == boot_id else -1
+    fresh = [r for r in readings if r['seq'] > mark and not idempotency.seen(ccu_id, boot_id, r['seq'])]
+    if fresh:
+        stored = _stored_seqs(ccu_id, boot_id, {r['outlet'] for r in fresh if r.get('outlet')},
+                              [r['seq'] for r in fresh])
+        fresh = [r for r in fresh if r['seq'] not in stored]
+    if not fresh:
+        _advance(ccu, boot_id, mark, readings)
+        return 0, len(readings)
+
+    by_outlet = defaultdict(list)
+    breaker = []
+    for r in sorted(fresh, key=lambda r: r['timestamp']):
+        if r.get('outlet') is not None:
+            by_outlet[r['outlet']].append(r)
+        else:
+            breaker.append(r)
+
+    rows = []
+    for outlet, samples in by_outlet.items():
+        current_a, current_b = conditioning.outlet_batch(outlet, [r['current_a'] for r in samples],
+                                                         [r['current_b'] for r in samples])
+        for r, a, b in zip(samples, current_a.tolist(), current_b.tolist()):
+            r['current_a'], r['current_b'] = a, b
+        rows += history.backfill_outlet_rows(outlet, boot_id, [
+            (r['timestamp'], r['current_a'], r['current_b'], r['is_overload'], r['seq']) for r in samples
+        ])
+        energy.record_outlet_backfill(outlet, [(r['timestamp'], r['current_a'], r['current_b']) for r in samples])
+        for r in samples:
+            telemetry.record_outlet_reading(outlet, r['current_a'], r['current_b'], r['is_overload'], r['timestamp'])
+    if rows:
+        SensorData.objects.bulk_create(rows, ignore_conflicts=True)
+
+    if breaker:
+        current_ma = conditioning.breaker_batch(ccu, [r['current_ma'] for r in breaker])
+        for r, ma in zip(breaker, current_ma.tolist()):
+            r['current_ma'] = ma
+        rows = history.backfill_breaker_rows(ccu_id, ccu, boot_id,
+                                             [(r['timestamp'], r['current_ma'], r['seq']) for r in breaker])
+        MainBreakerReading.objects.bulk_create(rows, ignore_conflicts=True)
+        energy.record_breaker_backfill(ccu, [(r['timestamp'], r['current_ma']) for r in breaker])
+        for r in breaker:
+            telemetry.record_breaker_reading(ccu, r['current_ma'], r['timestamp'])
+
+    idempotency.mark(ccu_id, boot_id, [r['seq'] for r in fresh])
+    _advance(ccu, boot_id, mark, readings)
+    return len(fresh), len(readings) - len(fresh)
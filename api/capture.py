@@ -0,0 +1,173 @@
+"""
+Capture of the CCU-facing traffic, for replay (`manage.py replay_capture`).
+
+When CAPTURE_ENABLED is set, CaptureMiddleware records every request a CCU
+makes — the ingest POSTs and the command / sync / plan / focus polls — with
+its arrival time, client IP, body, status and server time. Records are
+gzip-compressed JSON lines in CAPTURE_DIR: a new file is started every
+CAPTURE_MAX_MB (compressed) and only the newest CAPTURE_KEEP_FILES are kept.
+
+Writing happens on a background thread; the request only queues a dict.
+The middleware is not installed at all when capture is off.
+"""
+import atexit
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+# (method, path prefix) of the requests a CCU makes
+CCU_ENDPOINTS = (
+    ('POST', '/api/data/'),
+    ('POST', '/api/breaker-data/'),
+    ('POST', '/api/backfill/'),
+    ('GET', '/api/commands/'),
+    ('GET', '/api/devices/'),
+    ('GET', '/api/sync/'),
+    ('GET', '/api/sampling-plan/'),
+    ('GET', '/api/focus/'),
+)
+FILE_PATTERN = 'capture-*.jsonl.gz'
+
+_queue = queue.SimpleQueue()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def is_ccu_request(method, path):
+    return any(method == m and path.startswith(prefix) for m, prefix in CCU_ENDPOINTS)
+
+
+def capture_files(directory=None):
+    """Capture files in CAPTURE_DIR, oldest first."""
+    return sorted(glob.glob(os.path.join(directory or settings.CAPTURE_DIR, FILE_PATTERN)))
+
+
+def read_records(paths):
+    """Records of capture files in order. A file still being written (no gzip trailer) is read up to its end."""
+    for path in paths:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue    # Cut off mid-line
+            except EOFError:
+                continue
+
+
+class _Writer(threading.Thread):
+    """Drains the queue into the current capture file; rotates and prunes files."""
+
+    def __init__(self):
+        super().__init__(name='capture-writer', daemon=True)
+        self.directory = settings.CAPTURE_DIR
+        self.max_bytes = settings.CAPTURE_MAX_MB * 1024 * 1024
+        self.keep = settings.CAPTURE_KEEP_FILES
+        self.raw = None
+        self.file = None
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        name = time.strftime('capture-%Y%m%d-%H%M%S', time.gmtime()) + f'-{os.getpid()}.jsonl.gz'
+        self.raw = open(os.path.join(self.directory, name), 'wb')
+        self.file = gzip.GzipFile(fileobj=self.raw, mode='wb')
+        for old in capture_files(self.directory)[:-self.keep]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+            self.raw.close()
+            self.file = self.raw = None
+
+    def run(self):
+        while True:
+            record = _queue.get()
+            if record is None:
+                break
+            if self.file is None:
+                self._open()
+            self.file.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+            # Write out whatever else is waiting, then sync-flush so the file is readable
+            while not _queue.empty():
+                record = _queue.get()
+                if record is None:
+                    self._close()
+                    return
+                self.file.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+            self.file.flush()
+            if self.raw.tell() >= self.max_bytes:
+                self._close()
+        self._close()
+
+
+def _ensure_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _Writer()
+            _writer.start()
+            atexit.register(_stop)
+
+
+def _stop():
+    _queue.put(None)
+    _writer.join(timeout=5)
+
+
+def _record(request, response, started, elapsed):
+    _queue.put({
+        't': int(started * 1000),                       # Arrival, epoch ms
+        'method': request.method,
+        'path': request.get_full_path(),
+        'ip': request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')[0].strip()
+        or request.META.get('REMOTE_ADDR'),
+        'body': request.body.decode('utf-8', errors='replace') if request.method == 'POST' else '',
+        'status': response.status_code,
+        'ms': round(elapsed * 1000, 2),                 # Server time in production
+    })
+
+
+class CaptureMiddleware:
+    """Record CCU requests to the capture file (only installed with CAPTURE_ENABLED)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CAPTURE_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        _ensure_writer()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not is_ccu_request(request.method, request.path):
+            return self.get_response(request)
+        started, clock = time.time(), time.perf_counter()
+        response = self.get_response(request)
+        _record(request, response, started, time.perf_counter() - clock)
+        return response
+
+    async def __acall__(self, request):
+        if not is_ccu_request(request.method, request.path):
+            return await self.get_response(request)
+        started, clock = time.time(), time.perf_counter()
+        response = await self.get_response(request)
+        _record(request, response, started, time.perf_counter() - clock)
+        return response
@@ -0,0 +1,62 @@
+"""
+Direct HTTP communication with a CCU's local web server (ESP32).
+
+Used when the CCU has been seen recently enough to be reachable on its
+last known LAN IP; callers fall back to PendingCommand polling otherwise.
+"""
+from datetime import timedelta
+
+import requests as http_requests
+from django.utils import timezone
+
+# How recent the CCU must have been seen to attempt direct HTTP
+DIRECT_CMD_TIMEOUT = timedelta(seconds=30)
+DIRECT_CMD_HTTP_TIMEOUT = 3  # seconds
+
+
+def is_reachable(ccu):
+    """True if a direct request to this CCU is worth attempting."""
+    return bool(ccu and ccu.ip_address and ccu.last_seen
+                and timezone.now() - ccu.last_seen < DIRECT_CMD_TIMEOUT)
+
+
+def send_command(ip, device_id, command, socket='', value=None):
+    """
+    Send a command directly to the ESP32's local web server.
+    Returns (success: bool, response_data: dict or None).
+    """
+    try:
+        url = f'http://{ip}/api/ext/relay'
+        payload = {
+            'device_id': device_id,
+            'command': command,
+            'socket': socket,
+        }
+        if value is not None:
+            payload['value'] = str(value)
+
+        resp = http_requests.post(url, data=payload, timeout=DIRECT_CMD_HTTP_TIMEOUT)
+        if resp.status_code == 200:
+            return True, resp.json()
+        return False, None
+    except Exception:
+        return False, None
+
+
+def send_bulk(ip, commands):
+    """
+    Send several relay commands to one CCU in a single request.
+    commands: [(device_id, socket, command)]. Returns (success, response_data).
+    """
+    try:
+        url = f'http://{ip}/api/ext/relay-bulk'
+        payload = {'commands': ','.join(f'{d}:{s}:{c}' for d, s, c in commands)}
+        # The CCU pumps the RF link ~150 ms per command before answering
+        timeout = DIRECT_CMD_HTTP_TIMEOUT + 0.2 * len(commands)
+        resp = http_requests.post(url, data=payload, timeout=timeout)
+        if resp.status_code == 200:
+            data = resp.json()
+            return not data.get('failed'), data
+        return False, None
+    except Exception:
+        return False, None
@@ -0,0 +1,58 @@
+"""
+Relay commands for many outlets at once.
+
+Commands are grouped per CCU and sent in one direct request each (CCUs in
+parallel); whatever a CCU does not confirm is queued as PendingCommand rows
+in a single bulk_create. Used by the bulk command endpoint and by load
+shedding.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db.models import Q
+
+from outlets.models import Outlet, PendingCommand
+from . import sync
+from .ccu_client import is_reachable, send_bulk
+
+RELAY_COMMANDS = ('relay_on', 'relay_off')
+
+
+def dispatch_relay_commands(items):
+    """
+    items: [(outlet, socket, command)] with outlet.ccu loaded.
+    Returns {'direct': n, 'queued': n, 'ccus': n}.
+    """
+    by_ccu = defaultdict(list)
+    for outlet, socket, command in items:
+        by_ccu[outlet.ccu].append((outlet, socket, command))
+
+    def send(ccu):
+        if not is_reachable(ccu):
+            return ccu, False
+        ok, _ = send_bulk(ccu.ip_address, [(o.device_id, s, c) for o, s, c in by_ccu[ccu]])
+        return ccu, ok
+
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(by_ccu)))) as pool:
+        results = dict(pool.map(send, list(by_ccu)))
+
+    queued = [item for ccu, ccu_items in by_ccu.items() if not results[ccu] for item in ccu_items]
+    if queued:
+        # A newer relay command supersedes any still waiting for the same socket
+        stale = Q()
+        for outlet, socket, _ in queued:
+            stale |= Q(outlet=outlet, socket=socket)
+        PendingCommand.objects.filter(stale, command__in=RELAY_COMMANDS, is_executed=False).delete()
+        PendingCommand.objects.bulk_create([
+            PendingCommand(outlet=outlet, command=command, socket=socket) for outlet, socket, command in queued
+        ])
+
+    # Record the new relay states (speculatively for queued commands, like queue_command)
+    updates = defaultdict(list)
+    for outlet, socket, command in items:
+        updates[(f'relay_{socket}', command == 'relay_on')].append(outlet.pk)
+    for (field, state), pks in updates.items():
+        Outlet.objects.filter(pk__in=pks).update(**{field: state})
+    sync.bump(*(ccu.ccu_id for ccu in by_ccu if ccu is not None))  # update() sends no signals
+
+    return {'direct': len(items) - len(queued), 'queued': len(queued), 'ccus': len(by_ccu)}
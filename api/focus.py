@@ -0,0 +1,111 @@
+"""
+Per-CCU focus device, served from memory.
+
+Each CCU's focused outlet is held in memory with a version stamp, keyed by
+ccu_id. Changes are written through to CentralControlUnit.focused_device so
+they survive a restart; reads never touch the database after the first
+lookup of a CCU.
+
+The CCU polls GET /api/focus/?ccu_id=01&version=<last seen>: an unchanged
+focus is answered with 304 and no body. A client that can afford to hold a
+request open adds &wait=<seconds> and is answered as soon as the focus
+changes (long-poll). Waiters are asyncio events woken from whichever thread
+made the change.
+
+State is process-local (one Daphne process); versions are millisecond
+timestamps so a CCU never mistakes a post-restart version for its own.
+"""
+import asyncio
+import threading
+import time
+
+from outlets.models import CentralControlUnit
+from . import sync
+
+MAX_WAIT_SECONDS = 25
+
+
+class _Focus:
+    __slots__ = ('device_id', 'version', 'waiters')
+
+    def __init__(self, device_id):
+        self.device_id = device_id or None
+        self.version = _new_version()
+        self.waiters = set()    # (loop, asyncio.Event) of pending long-polls
+
+
+_focus = {}     # ccu_id → _Focus
+_lock = threading.Lock()
+_last_version = 0
+
+
+def _new_version():
+    global _last_version
+    _last_version = max(_last_version + 1, int(time.time() * 1000))
+    return _last_version
+
+
+def normalize_ccu_id(ccu_id):
+    return str(ccu_id).upper().zfill(2)     # '1' → '01' to match registered format
+
+
+def _entry(ccu_id):
+    """The CCU's focus, loading it from the database on first use."""
+    with _lock:
+        entry = _focus.get(ccu_id)
+    if entry is not None:
+        return entry
+    ccu = CentralControlUnit.objects.filter(ccu_id=ccu_id).first()
+    focused = ccu.focused_device if ccu else ''
+    with _lock:
+        return _focus.setdefault(ccu_id, _Focus(focused))
+
+
+def peek(ccu_id):
+    """(device_id or None, version) if the CCU is already in memory, else None."""
+    with _lock:
+        entry = _focus.get(ccu_id)
+        return (entry.device_id, entry.version) if entry else None
+
+
+def get(ccu_id):
+    """(device_id or None, version)."""
+    entry = _entry(ccu_id)
+    with _lock:
+        return entry.device_id, entry.version
+
+
+def set_focus(ccu, device_id):
+    """Focus device_id (None to clear) on a CCU: memory first, then the database."""
+    entry = _entry(ccu.ccu_id)
+    with _lock:
+        if entry.device_id == (device_id or None):
+            return entry.version
+        entry.device_id = device_id or None
+        entry.version = _new_version()
+        waiters, entry.waiters = entry.waiters, set()
+    for loop, event in waiters:
+        loop.call_soon_threadsafe(event.set)
+    CentralControlUnit.objects.filter(pk=ccu.pk).update(focused_device=device_id or '')
+    sync.bump(ccu.ccu_id)
+    return entry.version
+
+
+async def wait_for_change(ccu_id, version, timeout):
+    """Wait until the CCU's focus version differs from `version` (or timeout)."""
+    entry = _focus.get(ccu_id)
+    if entry is None:
+        return
+    event = asyncio.Event()
+    waiter = (asyncio.get_running_loop(), event)
+    with _lock:
+        if entry.version != version:
+            return
+        entry.waiters.add(waiter)
+    try:
+        await asyncio.wait_for(event.wait(), min(timeout, MAX_WAIT_SECONDS))
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        with _lock:
+            entry.waiters.discard(waiter)
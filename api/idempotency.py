@@ -0,0 +1,199 @@
+"""
+Idempotent CCU ingest.
+
+The CCU numbers every reading it sends (seq, counted from 0 at every boot,
+with a random boot_id — see the firmware's Backlog). When its HTTP timeout
+expires after the server already handled a POST, the retry carries the same
+(ccu_id, boot_id, seq); @idempotent answers it with the cached response of
+the first delivery, so no second Alert / EventLog / SensorData row is made.
+
+Each CCU has a window of its last WINDOW_SIZE sequence numbers in memory.
+Backfilled readings (api.backfill) are marked in the same window, so a
+reading delivered live is not recorded again from the backlog. A new
+boot_id starts a new window. Requests without seq (older firmware) pass
+through untouched.
+
+stats() counts duplicates (answered from the window), out-of-order
+deliveries (seq below the highest seen, not a duplicate) and retries that
+arrived while the first delivery was still being processed.
+"""
+import json
+import threading
+from collections import Counter, OrderedDict
+from functools import wraps
+
+from decouple import config
+from django.http import HttpResponse, JsonResponse
+
+WINDOW_SIZE = config('IDEMPOTENCY_WINDOW', default=1024, cast=int)
+# A retry that arrives while the first delivery is still running waits this long
+IN_FLIGHT_WAIT_SECONDS = 5
+_ALREADY_RECORDED = json.dumps({'success': True, 'message': 'Already recorded'}).encode()
+
+
+class _Entry:
+    """One delivery: done once its response is cached, or once it failed (content stays None)."""
+    __slots__ = ('done', 'status', 'content', 'content_type')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.status = None
+        self.content = None
+        self.content_type = None
+
+
+class _Window:
+    __slots__ = ('boot_id', 'entries', 'highest')
+
+    def __init__(self, boot_id):
+        self.boot_id = boot_id
+        self.entries = OrderedDict()    # seq → _Entry, oldest first
+        self.highest = -1
+
+
+_windows = {}           # ccu_id → _Window
+_counts = Counter()     # 'requests' / 'duplicates' / 'out_of_order' / 'in_flight'
+_per_ccu = {}           # ccu_id → Counter of 'duplicates' / 'out_of_order'
+_lock = threading.Lock()
+
+
+def _window(ccu_id, boot_id):
+    """Caller holds _lock."""
+    window = _windows.get(ccu_id)
+    if window is None or window.boot_id != boot_id:
+        window = _windows[ccu_id] = _Window(boot_id)   # CCU rebooted
+    return window
+
+
+def _count(ccu_id, name):
+    """Caller holds _lock."""
+    _counts[name] += 1
+    _per_ccu.setdefault(ccu_id, Counter())[name] += 1
+
+
+def _add(window, seq, entry):
+    """Caller holds _lock."""
+    window.entries[seq] = entry
+    while len(window.entries) > WINDOW_SIZE:
+        window.entries.popitem(last=False)
+
+
+def begin(ccu_id, boot_id, seq):
+    """
+    Register a delivery. Returns (entry, is_new): a new entry to fill with
+    finish(), or the entry of the earlier delivery of the same reading.
+    """
+    with _lock:
+        _counts['requests'] += 1
+        window = _window(ccu_id, boot_id)
+        entry = window.entries.get(seq)
+        if entry is not None:
+            _count(ccu_id, 'duplicates')
+            return entry, False
+        if seq < window.highest:
+            _count(ccu_id, 'out_of_order')
+        window.highest = max(window.highest, seq)
+        entry = _Entry()
+        _add(window, seq, entry)
+        return entry, True
+
+
+def finish(entry, response):
+    """Cache the response of a delivery and release retries waiting on it."""
+    entry.status = response.status_code
+    entry.content = response.content
+    entry.content_type = response.get('Content-Type')
+    entry.done.set()
+
+
+def forget(ccu_id, boot_id, seq, entry):
+    """Drop a delivery that failed, so a retry is processed again."""
+    with _lock:
+        window = _windows.get(ccu_id)
+        if window is not None and window.boot_id == boot_id and window.entries.get(seq) is entry:
+            del window.entries[seq]
+    entry.done.set()
+
+
+def seen(ccu_id, boot_id, seq):
+    with _lock:
+        window = _windows.get(ccu_id)
+        return window is not None and window.boot_id == boot_id and seq in window.entries
+
+
+def mark(ccu_id, boot_id, seqs):
+    """Record sequence numbers handled outside a live request (backfill)."""
+    with _lock:
+        window = _window(ccu_id, boot_id)
+        for seq in seqs:
+            entry = _Entry()
+            entry.status, entry.content, entry.content_type = 200, _ALREADY_RECORDED, 'application/json'
+            entry.done.set()
+            _add(window, seq, entry)
+            window.highest = max(window.highest, seq)
+
+
+def stats():
+    with _lock:
+        return {
+            **{name: _counts[name] for name in ('requests', 'duplicates', 'out_of_order', 'in_flight')},
+            'window_size': WINDOW_SIZE,
+            'ccus': {ccu_id: dict(counts) for ccu_id, counts in _per_ccu.items()},
+        }
+
+
+def numbering(data):
+    """(boot_id, seq) of an ingest payload, or (None, None) if it is not numbered."""
+    try:
+        boot_id, seq = int(data['boot_id']), int(data['seq'])
+    except (KeyError, TypeError, ValueError):
+        return None, None
+    return (boot_id, seq) if boot_id >= 0 and seq >= 0 else (None, None)
+
+
+def _delivery_key(request):
+    """(ccu_id, boot_id, seq) of an ingest POST, or None if it is not numbered."""
+    try:
+        data = json.loads(request.body)
+        ccu_id = str(data['ccu_id']).upper().zfill(2)
+    except (ValueError, KeyError, TypeError):
+        return None
+    boot_id, seq = numbering(data)
+    return None if seq is None else (ccu_id, boot_id, seq)
+
+
+def idempotent(view):
+    """Answer re-deliveries of a numbered ingest POST from the cached first response."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = _delivery_key(request)
+        if key is None:
+            return view(request, *args, **kwargs)
+
+        entry, is_new = begin(*key)
+        if not is_new:
+            if not entry.done.is_set():
+                with _lock:
+                    _counts['in_flight'] += 1
+                entry.done.wait(IN_FLIGHT_WAIT_SECONDS)
+            if entry.content is None:
+                # First delivery still running or failed: 5xx, so the CCU keeps it for backfill
+                return JsonResponse({
+                    'success': False,
+                    'message': 'An earlier delivery of this reading has not completed'
+                }, status=503)
+            response = HttpResponse(entry.content, status=entry.status, content_type=entry.content_type)
+            response['X-Idempotent-Replay'] = 'true'
+            return response
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            forget(*key, entry)
+            raise
+        if response.status_code >= 500:
+            forget(*key, entry)     # Not (fully) processed: let the retry run
+        else:
+            finish(entry, response)
+        return response
+    return wrapper
@@ -0,0 +1,77 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from outlets.models import Outlet, SensorData
+
+
+def _summary(samples_ms):
+    samples_ms = sorted(samples_ms)
+    n = len(samples_ms)
+    return {
+        'mean': sum(samples_ms) / n,
+        'p50': samples_ms[n // 2],
+        'p95': samples_ms[min(n - 1, int(n * 0.95))],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the connection setup cost on the ingest read path: a fresh database '
+        'connection per request versus a reused one (what DB_POOL saves).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--device-id', default=None,
+                            help='Outlet to look up (defaults to the first registered outlet)')
+
+    def handle(self, *args, **options):
+        iterations = max(1, options['iterations'])
+        device_id = options['device_id'] or Outlet.objects.values_list('device_id', flat=True).first()
+
+        def ingest_reads():
+            # The same reads receive_sensor_data does before deciding to write
+            if device_id is None:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                return
+            outlet = Outlet.objects.select_related('ccu').filter(device_id=device_id).first()
+            SensorData.objects.filter(outlet=outlet).first()
+
+        db = settings.DATABASES['default']
+        pooled = 'pool' in db.get('OPTIONS', {})
+        self.stdout.write(
+            f'Mode: {"psycopg pool" if pooled else "CONN_MAX_AGE=" + str(db.get("CONN_MAX_AGE"))}, '
+            f'host={db.get("HOST")}, outlet={device_id or "-"}, iterations={iterations}'
+        )
+
+        # Per-request connection: what every request paid with CONN_MAX_AGE=0.
+        # Under DB_POOL, close() hands the connection back to the pool instead.
+        per_request = []
+        for _ in range(iterations):
+            connection.close()
+            start = time.perf_counter()
+            ingest_reads()
+            per_request.append((time.perf_counter() - start) * 1000)
+
+        # Reused connection: persistent or already checked out
+        ingest_reads()
+        reused = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            ingest_reads()
+            reused.append((time.perf_counter() - start) * 1000)
+        connection.close()
+
+        cold, warm = _summary(per_request), _summary(reused)
+        label = 'pool checkout' if pooled else 'new connection'
+        self.stdout.write(f'{"":<28}{"mean ms":>10}{"p50 ms":>10}{"p95 ms":>10}')
+        for name, stats in ((label + ' per request', cold), ('reused connection', warm)):
+            self.stdout.write(f'{name:<28}{stats["mean"]:>10.2f}{stats["p50"]:>10.2f}{stats["p95"]:>10.2f}')
+
+        saved = cold['mean'] - warm['mean']
+        share = 100.0 * saved / cold['mean'] if cold['mean'] else 0.0
+        self.stdout.write(f'Connection setup removed from ingest reads: {saved:.2f} ms/request ({share:.0f}%)')
@@ -0,0 +1,183 @@
+import json
+import time
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, resolve
+
+from api import admission, capture, shedding
+from outlets import energy, telemetry
+from outlets.models import (Alert, EnergyRollup, EventLog, MainBreakerReading, PendingCommand, SensorData,
+                            TelemetryChunk)
+
+# Tables whose row counts are compared before / after the replay
+STATE_MODELS = (SensorData, MainBreakerReading, Alert, EventLog, PendingCommand, EnergyRollup, TelemetryChunk)
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _endpoint(path):
+    try:
+        return resolve(path.split('?')[0]).url_name
+    except Resolver404:
+        return 'unknown'
+
+
+def _row_counts():
+    return {model.__name__: model.objects.count() for model in STATE_MODELS}
+
+
+class Command(BaseCommand):
+    help = ('Re-drive captured CCU traffic (api.capture) against this instance and report latency, '
+            'query counts and database row changes per endpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*',
+                            help='Capture files (defaults to every file in settings.CAPTURE_DIR)')
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help='Replay speed: 1 = as captured, 10 = ten times faster, 0 = as fast as possible')
+        parser.add_argument('--limit', type=int, default=0, help='Replay only the first N requests')
+        parser.add_argument('--keep', action='store_true',
+                            help='Commit every request like production does (by default the replay runs in '
+                                 'one transaction that is rolled back)')
+        parser.add_argument('--no-admission', action='store_true',
+                            help='Turn off per-device rate limiting (useful above 1x)')
+        parser.add_argument('--with-shedding', action='store_true',
+                            help='Let load shedding dispatch relay commands (off by default: it would '
+                                 'contact the CCUs at the captured addresses)')
+        parser.add_argument('--save', help='Write the report as JSON to this file')
+        parser.add_argument('--compare', help='Report JSON of an earlier run to compare against')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or capture.capture_files()
+        if not paths:
+            raise CommandError(f'No capture files in {settings.CAPTURE_DIR}')
+        try:
+            records = sorted(capture.read_records(paths), key=lambda r: r['t'])
+        except OSError as e:
+            raise CommandError(f'Cannot read capture: {e}')
+        if options['limit']:
+            records = records[:options['limit']]
+        if not records:
+            raise CommandError('The capture has no requests.')
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                raise CommandError(f'Cannot read report {options["compare"]}: {e}')
+
+        if options['no_admission']:
+            admission.ADMISSION_ENABLED = False
+        if not options['with_shedding']:
+            shedding.SHEDDING_ENABLED = False
+
+        speed = options['speed']
+        host = next((h for h in settings.ALLOWED_HOSTS if h and h != '*' and not h.startswith('.')), 'localhost')
+        self.stdout.write(f'Replaying {len(records)} requests from {len(paths)} file(s) '
+                          f'at {"max speed" if speed <= 0 else f"{speed:g}x"}'
+                          f'{"" if options["keep"] else " (changes rolled back)"}')
+
+        with override_settings(CAPTURE_ENABLED=False):     # Don't capture the replay itself
+            client = Client(HTTP_HOST=host)
+            with nullcontext() if options['keep'] else transaction.atomic():
+                before = _row_counts()
+                results, wall = self._replay(client, records, speed)
+                energy.flush()
+                telemetry.flush()
+                rows = {name: count - before[name] for name, count in _row_counts().items()}
+                if not options['keep']:
+                    transaction.set_rollback(True)
+
+        report = self._report(records, results, rows, speed, wall)
+        self._print(report, baseline)
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'\nReport saved to {options["save"]}')
+
+    def _replay(self, client, records, speed):
+        """[(record, status, ms, queries)] and the wall-clock seconds the replay took."""
+        results = []
+        first = records[0]['t']
+        started = time.perf_counter()
+        for record in records:
+            if speed > 0:
+                delay = (record['t'] - first) / 1000 / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            with CaptureQueriesContext(connection) as queries:
+                clock = time.perf_counter()
+                response = client.generic(record['method'], record['path'], record.get('body', ''),
+                                          content_type='application/json', REMOTE_ADDR=record.get('ip') or '127.0.0.1')
+                elapsed = (time.perf_counter() - clock) * 1000
+            results.append((record, response.status_code, elapsed, len(queries)))
+        return results, time.perf_counter() - started
+
+    def _report(self, records, results, rows, speed, wall):
+        by_endpoint = defaultdict(list)
+        for record, status, ms, queries in results:
+            by_endpoint[_endpoint(record['path'])].append((record, status, ms, queries))
+
+        endpoints = {}
+        for name, items in sorted(by_endpoint.items()):
+            latencies = sorted(ms for _, _, ms, _ in items)
+            captured = sorted(r['ms'] for r, _, _, _ in items if 'ms' in r)
+            queries = [q for _, _, _, q in items]
+            endpoints[name] = {
+                'count': len(items),
+                'status': dict(Counter(str(status) for _, status, _, _ in items)),
+                'p50_ms': round(_percentile(latencies, 50), 2),
+                'p95_ms': round(_percentile(latencies, 95), 2),
+                'max_ms': round(latencies[-1], 2),
+                'queries_mean': round(sum(queries) / len(queries), 2),
+                'queries_max': max(queries),
+                'captured_p50_ms': round(_percentile(captured, 50), 2) if captured else None,
+                'status_changed': sum(1 for r, status, _, _ in items if r.get('status') not in (None, status)),
+            }
+        return {
+            'requests': len(records),
+            'speed': speed,
+            'captured_seconds': round((records[-1]['t'] - records[0]['t']) / 1000, 1),
+            'wall_seconds': round(wall, 1),
+            'endpoints': endpoints,
+            'rows': rows,
+        }
+
+    def _print(self, report, baseline):
+        old = baseline['endpoints'] if baseline else {}
+        self.stdout.write(f'\n{"endpoint":<24}{"count":>7}{"p50 ms":>9}{"p95 ms":>9}{"max ms":>9}'
+                          f'{"queries":>9}{"prod p50":>10}  status')
+        for name, e in report['endpoints'].items():
+            prod = f'{e["captured_p50_ms"]:.2f}' if e['captured_p50_ms'] is not None else '-'
+            status = ' '.join(f'{code}×{n}' for code, n in sorted(e['status'].items()))
+            if e['status_changed']:
+                status += f' ({e["status_changed"]} differ from capture)'
+            self.stdout.write(f'{name:<24}{e["count"]:>7}{e["p50_ms"]:>9.2f}{e["p95_ms"]:>9.2f}'
+                              f'{e["max_ms"]:>9.2f}{e["queries_mean"]:>9.2f}{prod:>10}  {status}')
+            if name in old:
+                b = old[name]
+                self.stdout.write(f'{"  vs baseline":<24}{"":>7}{e["p50_ms"] - b["p50_ms"]:>+9.2f}'
+                                  f'{e["p95_ms"] - b["p95_ms"]:>+9.2f}{e["max_ms"] - b["max_ms"]:>+9.2f}'
+                                  f'{e["queries_mean"] - b["queries_mean"]:>+9.2f}')
+
+        self.stdout.write(f'\nRows added ({report["requests"]} requests, {report["captured_seconds"]}s captured, '
+                          f'{report["wall_seconds"]}s replayed):')
+        old_rows = baseline['rows'] if baseline else {}
+        for name, delta in report['rows'].items():
+            line = f'  {name:<22}{delta:>8}'
+            if name in old_rows and old_rows[name] != delta:
+                line += f'   baseline {old_rows[name]} ({delta - old_rows[name]:+d})'
+            self.stdout.write(line)
@@ -0,0 +1,81 @@
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = 'Summarize span latencies from the OTLP/JSON trace file written by api.tracing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=None,
+                            help='Trace file (defaults to settings.TRACE_FILE)')
+
+    def handle(self, *args, **options):
+        path = options['path'] or settings.TRACE_FILE
+        try:
+            with open(path, encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError as e:
+            raise CommandError(f'Cannot read trace file {path}: {e}')
+
+        durations = defaultdict(list)    # span name → [ms]
+        roots = {}                        # trace_id → root span
+        deliveries = []                   # consumer spans
+
+        for line in lines:
+            try:
+                batch = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            for resource in batch.get('resourceSpans', []):
+                for scope in resource.get('scopeSpans', []):
+                    for span in scope.get('spans', []):
+                        start = int(span['startTimeUnixNano'])
+                        end = int(span['endTimeUnixNano'])
+                        durations[span['name']].append((end - start) / 1e6)
+                        if 'parentSpanId' not in span:
+                            roots[span['traceId']] = span
+                        elif span.get('kind') == 5:
+                            deliveries.append(span)
+
+        if not durations:
+            self.stdout.write('No spans recorded.')
+            return
+
+        root_total = sum(
+            (int(r['endTimeUnixNano']) - int(r['startTimeUnixNano'])) / 1e6 for r in roots.values()
+        )
+
+        self.stdout.write(f'{"span":<24}{"count":>8}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"max ms":>10}{"share":>8}')
+        for name, values in sorted(durations.items(), key=lambda kv: -sum(kv[1])):
+            values.sort()
+            share = f'{100.0 * sum(values) / root_total:.0f}%' if root_total else '-'
+            self.stdout.write(
+                f'{name:<24}{len(values):>8}'
+                f'{_percentile(values, 50):>10.2f}{_percentile(values, 95):>10.2f}'
+                f'{_percentile(values, 99):>10.2f}{values[-1]:>10.2f}{share:>8}'
+            )
+
+        # Sensor-to-screen: from the ingest view starting to the WebSocket frame being sent
+        end_to_end = sorted(
+            (int(d['endTimeUnixNano']) - int(roots[d['traceId']]['startTimeUnixNano'])) / 1e6
+            for d in deliveries if d['traceId'] in roots
+        )
+        if end_to_end:
+            self.stdout.write('')
+            self.stdout.write(
+                f'sensor-to-screen ({len(end_to_end)} frames): '
+                f'p50 {_percentile(end_to_end, 50):.2f} ms, '
+                f'p95 {_percentile(end_to_end, 95):.2f} ms, '
+                f'p99 {_percentile(end_to_end, 99):.2f} ms, '
+                f'max {end_to_end[-1]:.2f} ms'
+            )
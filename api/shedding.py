@@ -0,0 +1,120 @@
+"""
+Server-side main breaker protection with prioritized load shedding.
+
+Every breaker sample is checked against CentralControlUnit.breaker_threshold
+with hysteresis: the CCU trips when the load exceeds the threshold and only
+re-arms once it falls below RELEASE_RATIO × threshold. On a trip, outlets
+with shed_priority > 0 are cut in priority order (1 first) until the
+estimated excess is covered, using the live per-outlet loads from
+outlets.reconcile. If the load is still above the threshold
+ESCALATE_SECONDS later, the next outlet in line is cut.
+
+Relay-off commands go out on a background pool so the ingest request is
+not held up; all sockets of a decision are sent to the CCU in one bulk
+request (api.commands) and fall back to PendingCommand. Decision-to-dispatch latency is recorded in
+the LOAD_SHED EventLog entry. Relays are never switched back on
+automatically.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from decouple import config
+from django.db import close_old_connections
+
+from outlets import reconcile
+from outlets.models import EventLog, Outlet
+from .commands import dispatch_relay_commands
+
+SHEDDING_ENABLED = config('LOAD_SHEDDING_ENABLED', default=True, cast=bool)
+RELEASE_RATIO = 0.9
+ESCALATE_SECONDS = config('LOAD_SHEDDING_ESCALATE_SECONDS', default=10, cast=float)
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='load-shed')
+
+
+class _BreakerState:
+    __slots__ = ('tripped', 'shed', 'last_shed_at')
+
+    def __init__(self):
+        self.tripped = False
+        self.shed = set()       # outlet pks cut during the current trip
+        self.last_shed_at = None
+
+
+_states = {}
+_lock = threading.Lock()
+
+
+def evaluate(ccu, current_ma, timestamp):
+    """
+    Check one breaker sample. Returns the outlets being shed (possibly empty);
+    their relay-off commands are already on their way when this returns.
+    """
+    if not SHEDDING_ENABLED or ccu is None or ccu.breaker_threshold <= 0:
+        return []
+    decided_at = time.perf_counter()
+    threshold = ccu.breaker_threshold
+
+    with _lock:
+        state = _states.setdefault(ccu.pk, _BreakerState())
+        if current_ma < threshold * RELEASE_RATIO:
+            if state.tripped:
+                state.tripped, state.shed, state.last_shed_at = False, set(), None
+            return []
+        if current_ma <= threshold:
+            return []   # Inside the hysteresis band
+        if state.tripped and (timestamp - state.last_shed_at).total_seconds() < ESCALATE_SECONDS:
+            return []   # Give the last cut time to show up in the readings
+        escalation = state.tripped
+        state.tripped = True
+        state.last_shed_at = timestamp
+        already_shed = set(state.shed)
+
+    candidates = [
+        o for o in Outlet.objects.filter(ccu=ccu, shed_priority__gt=0).order_by('shed_priority', 'pk')
+        if o.pk not in already_shed and (o.relay_a or o.relay_b)
+    ]
+    if not candidates:
+        return []
+
+    # Cut until the live loads of the chosen outlets cover the excess;
+    # on escalation (the first cut was not enough) take one more outlet.
+    loads = reconcile.outlet_loads(ccu, timestamp)
+    excess = current_ma - threshold * RELEASE_RATIO
+    chosen, covered = [], 0
+    for outlet in candidates:
+        chosen.append(outlet)
+        covered += loads.get(outlet.pk, 0)
+        if escalation or covered >= excess:
+            break
+
+    with _lock:
+        state.shed.update(o.pk for o in chosen)
+
+    _executor.submit(_shed, ccu, chosen, current_ma, threshold, decided_at)
+    return chosen
+
+
+def _shed(ccu, outlets, current_ma, threshold, decided_at):
+    """Cut both sockets of the chosen outlets (runs on the shedding pool)."""
+    try:
+        for outlet in outlets:
+            outlet.ccu = ccu
+        result = dispatch_relay_commands([(o, socket, 'relay_off') for o in outlets for socket in ('a', 'b')])
+        latency_ms = (time.perf_counter() - decided_at) * 1000
+        method = 'direct' if not result['queued'] else 'queued'
+
+        EventLog.objects.bulk_create([
+            EventLog(
+                user_id=outlet.user_id,
+                source='SERVER',
+                action_type='LOAD_SHED',
+                target_device=f'0x{outlet.device_id}',
+                details=(f'Main breaker at {current_ma}mA (limit {threshold}mA): cut {outlet.name} '
+                         f'(priority {outlet.shed_priority}) — dispatched in {latency_ms:.0f} ms ({method})'),
+            )
+            for outlet in outlets
+        ])
+    finally:
+        close_old_connections()
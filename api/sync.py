@@ -0,0 +1,119 @@
+"""
+Versioned per-CCU sync manifest.
+
+Everything a CCU needs to mirror — its outlets with relay states and
+thresholds, its breaker threshold and its focus device — in one document
+with one version number per CCU. The version is bumped by model signals
+(connected in ApiConfig.ready) and by the code paths that write with
+QuerySet.update(), which sends no signals. Saves that only touch
+bookkeeping fields (ip_address / last_seen on every CCU request) do not
+count as changes.
+
+The CCU sends the ETag of its last manifest in If-None-Match; while the
+version is unchanged the answer is a bodiless 304 decided from memory,
+without a database query. Versions are millisecond timestamps, so they keep
+increasing across restarts.
+"""
+import threading
+import time
+
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from outlets.models import CentralControlUnit, Outlet
+
+# CCU fields written on every contact — not part of the manifest
+_BOOKKEEPING_FIELDS = {'ip_address', 'last_seen', 'focused_device'}
+
+_versions = {}      # ccu_id → current version
+_manifests = {}     # ccu_id → manifest dict built at a version
+_lock = threading.Lock()
+_last_version = 0
+
+
+def _new_version():
+    """Caller holds _lock."""
+    global _last_version
+    _last_version = max(_last_version + 1, int(time.time() * 1000))
+    return _last_version
+
+
+def bump(*ccu_ids):
+    """Mark the manifests of these CCUs as changed."""
+    with _lock:
+        for ccu_id in ccu_ids:
+            if ccu_id:
+                _versions[ccu_id] = _new_version()
+                _manifests.pop(ccu_id, None)
+
+
+def etag(ccu_id):
+    """ETag of the CCU's current manifest, or None if it has not been built yet."""
+    with _lock:
+        manifest = _manifests.get(ccu_id)
+        if manifest is None or manifest['version'] != _versions.get(ccu_id):
+            return None
+        return _etag(ccu_id, manifest['version'])
+
+
+def _etag(ccu_id, version):
+    return f'"{ccu_id}-{version}"'
+
+
+def manifest(ccu_id):
+    """(manifest dict, ETag) for a CCU, built from the database when stale; None if unknown."""
+    with _lock:
+        version = _versions.get(ccu_id)
+        cached = _manifests.get(ccu_id)
+        if cached is not None and cached['version'] == version:
+            return cached, _etag(ccu_id, version)
+
+    ccu = CentralControlUnit.objects.filter(ccu_id=ccu_id).first()
+    if ccu is None:
+        return None
+    with _lock:
+        version = _versions.get(ccu_id) or _versions.setdefault(ccu_id, _new_version())
+    from . import focus     # Imported here: api.focus bumps the manifest on focus changes
+    focused, _ = focus.peek(ccu_id) or focus.get(ccu_id)
+    outlets = list(ccu.outlets.order_by('device_id').values('device_id', 'name', 'relay_a', 'relay_b', 'threshold'))
+    built = {
+        'ccu_id': ccu_id,
+        'version': version,
+        'breaker_threshold': ccu.breaker_threshold,
+        'focused_device': focused,
+        'devices': [o['device_id'] for o in outlets],
+        'outlets': outlets,
+    }
+    with _lock:
+        # A change that landed while building bumped the version; keep it stale
+        if _versions.get(ccu_id) == version:
+            _manifests[ccu_id] = built
+    return built, _etag(ccu_id, version)
+
+
+# ─── Signal handlers ───
+
+def _outlet_pre_save(sender, instance, update_fields=None, **kwargs):
+    # Remember the previous CCU so moving an outlet updates both manifests
+    if instance.pk and (update_fields is None or 'ccu' in update_fields):
+        instance._sync_previous_ccu = (Outlet.objects.filter(pk=instance.pk)
+                                       .values_list('ccu__ccu_id', flat=True).first())
+
+
+def _outlet_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'updated_at'}:
+        return
+    bump(instance.ccu.ccu_id if instance.ccu_id else None, getattr(instance, '_sync_previous_ccu', None))
+
+
+def _ccu_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= _BOOKKEEPING_FIELDS:
+        return
+    bump(instance.ccu_id)
+
+
+def connect_signals():
+    pre_save.connect(_outlet_pre_save, sender=Outlet, dispatch_uid='sync_outlet_pre_save')
+    post_save.connect(_outlet_changed, sender=Outlet, dispatch_uid='sync_outlet_saved')
+    post_delete.connect(_outlet_changed, sender=Outlet, dispatch_uid='sync_outlet_deleted')
+    post_save.connect(_ccu_changed, sender=CentralControlUnit, dispatch_uid='sync_ccu_saved')
+    post_delete.connect(_ccu_changed, sender=CentralControlUnit, dispatch_uid='sync_ccu_deleted')
@@ -1,3 +1,438 @@
-from django.test import TestCase
+import asyncio
+import json
+import math
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.http import JsonResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from outlets import reconcile, telemetry
+
+from . import admission, focus, idempotency, shedding, sync, tracing
+from outlets.models import CentralControlUnit, EventLog, MainBreakerReading, Outlet, PendingCommand, SensorData
+
+
+class BulkCommandTests(TestCase):
+    """POST /api/commands/bulk/ — the CCU has no known IP, so every command is queued."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        cls.ccu = CentralControlUnit.objects.create(user=cls.user, ccu_id='01')
+        cls.device_ids = ['F1', 'F2', 'F3', 'F4', 'F5']
+        for device_id in cls.device_ids:
+            Outlet.objects.create(user=cls.user, ccu=cls.ccu, name=f'Outlet {device_id}', device_id=device_id,
+                                  relay_a=True, relay_b=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self, body):
+        return self.client.post('/api/commands/bulk/', json.dumps(body), content_type='application/json')
+
+    def test_many_outlets_fit_the_event_log(self):
+        response = self.post({'commands': [{'device_id': d, 'socket': 'a', 'command': 'relay_off'}
+                                           for d in self.device_ids]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['queued'], 5)
+        log = EventLog.objects.get(action_type='BULK_RELAY')
+        self.assertLessEqual(len(log.target_device), EventLog._meta.get_field('target_device').max_length)
+        self.assertEqual(log.target_device, '5 devices')
+        for device_id in self.device_ids:
+            self.assertIn(f'0x{device_id}', log.details)
+        self.assertFalse(Outlet.objects.filter(relay_a=True).exists())
+
+    def test_single_outlet_is_named(self):
+        self.post({'commands': [{'device_id': 'f1', 'socket': 'b', 'command': 'relay_off'}]})
+        self.assertEqual(EventLog.objects.get(action_type='BULK_RELAY').target_device, '0xF1')
+
+    def test_cut_all_power(self):
+        response = self.post({'all': True, 'command': 'relay_off'})
+        self.assertEqual(response.json()['queued'], 10)
+        self.assertEqual(EventLog.objects.get(action_type='CUT_ALL_POWER').target_device, 'All Devices')
+        self.assertEqual(PendingCommand.objects.filter(command='relay_off').count(), 10)
+
+    def test_newer_command_supersedes_a_queued_one(self):
+        self.post({'commands': [{'device_id': 'F1', 'socket': 'a', 'command': 'relay_off'}]})
+        self.post({'commands': [{'device_id': 'F1', 'socket': 'a', 'command': 'relay_on'}]})
+        self.assertEqual(list(PendingCommand.objects.values_list('command', flat=True)), ['relay_on'])
+
+    def test_invalid_requests(self):
+        for body, status in (({'commands': []}, 400),
+                             ({'commands': [{'device_id': 'F1', 'socket': 'a', 'command': 'explode'}]}, 400),
+                             ({'commands': [{'device_id': 'F1', 'socket': 'c', 'command': 'relay_on'}]}, 400),
+                             ({'commands': [{'device_id': 'AA', 'socket': 'a', 'command': 'relay_on'}]}, 404)):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, status)
+        self.assertFalse(PendingCommand.objects.exists())
+
+
+class HistorySeriesTests(TestCase):
+    """GET /api/history/ — deadband rows read back with sample-and-hold."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        cls.ccu = CentralControlUnit.objects.create(user=cls.user, ccu_id='01', history_mode='deadband')
+        cls.outlet = Outlet.objects.create(user=cls.user, ccu=cls.ccu, name='Fan', device_id='FE',
+                                           history_mode='deadband')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_outlet_series_holds_values_and_marks_silence(self):
+        now = timezone.now()
+        for minutes_ago, current in ((50, 1000), (48, 1000), (46, 2000)):
+            SensorData.objects.create(outlet=self.outlet, current_a=current, current_b=0,
+                                      timestamp=now - timedelta(minutes=minutes_ago))
+        data = self.client.get('/api/history/fe/?hours=1&step=120').json()
+        self.assertEqual(len(data['timestamps']), 30)
+        a = data['current_a']
+        self.assertEqual(a[:5], [None] * 5)                 # Before the first row
+        self.assertEqual(a[5:7], [1000.0, 1000.0])
+        self.assertEqual(a[7], 2000.0)
+        self.assertIsNone(a[-1])                            # Silent for longer than a heartbeat
+
+    def test_breaker_series(self):
+        MainBreakerReading.objects.create(ccu_id='01', ccu_device=self.ccu, current_ma=3000, threshold=0,
+                                          timestamp=timezone.now() - timedelta(minutes=3))
+        data = self.client.get('/api/history/ccu/01/?hours=0.1&step=60').json()
+        self.assertEqual(data['current_ma'][-1], 3000.0)
+
+    def test_invalid_requests(self):
+        for path, status in (('/api/history/FE/?hours=48&step=1', 400),
+                             ('/api/history/FE/?step=x', 400),
+                             ('/api/history/AA/', 404)):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, status)
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/history/FE/').status_code, 401)
+
+
+class TelemetrySamplesTests(TestCase):
+    """GET /api/telemetry/ — every sample, flushed or still buffered."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        cls.ccu = CentralControlUnit.objects.create(user=cls.user, ccu_id='01')
+        cls.outlet = Outlet.objects.create(user=cls.user, ccu=cls.ccu, name='Fan', device_id='FE')
+
+    def setUp(self):
+        telemetry._pending.clear()
+        self.client.force_login(self.user)
+
+    @mock.patch.object(telemetry, 'CHUNKS_ENABLED', True)
+    def test_outlet_samples(self):
+        now = timezone.now()
+        for seconds_ago, current in ((30, 1000), (20, 1100), (10, 1200)):
+            telemetry.record_outlet_reading(self.outlet, current, 0, False, now - timedelta(seconds=seconds_ago))
+        data = self.client.get('/api/telemetry/fe/?minutes=1').json()
+        self.assertEqual(data['current_a'], [1000, 1100, 1200])
+        self.assertEqual(len(data['timestamps']), 3)
+        self.assertEqual(self.client.get('/api/telemetry/FE/?minutes=9999').status_code, 400)
+
+    def test_disabled(self):
+        self.assertEqual(self.client.get('/api/telemetry/FE/').status_code, 404)
+
+
+class AdmissionTests(TestCase):
+
+    def setUp(self):
+        admission._buckets.clear()
+        admission._admitted.clear()
+        admission._shed.clear()
+        self.now = 1000.0
+        patcher = mock.patch.object(admission.time, 'monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_rate(self):
+        waits = [admission.take('outlet', 'FE') for _ in range(admission.BURST + 1)]
+        self.assertEqual(waits[:-1], [0] * admission.BURST)
+        self.assertAlmostEqual(waits[-1], 1 / admission.OUTLET_RATE)
+        self.now += 1 / admission.OUTLET_RATE
+        self.assertEqual(admission.take('outlet', 'FE'), 0)
+        self.assertEqual(admission.take('breaker', 'FE'), 0)       # Buckets are per endpoint
+        stats = admission.stats()
+        self.assertEqual((stats['admitted'], stats['shed']), (admission.BURST + 2, 1))
+
+    def test_idle_buckets_are_pruned(self):
+        with mock.patch.object(admission, 'MAX_BUCKETS', 2):
+            admission.take('outlet', 'F1')
+            for _ in range(admission.BURST):
+                admission.take('outlet', 'F2')
+            self.now += 1
+            admission.take('outlet', 'F3')
+        # F1 has refilled; F2 is still short of tokens
+        self.assertEqual(sorted(admission._buckets), [('outlet', 'F2'), ('outlet', 'F3')])
+
+    def test_shed_request_gets_retry_after(self):
+        admission._buckets[('outlet', 'FE')] = admission._Bucket(self.now)
+        admission._buckets[('outlet', 'FE')].tokens = 0
+        response = self.client.post('/api/data/', json.dumps({'device_id': 'fe', 'current_a': 0, 'current_b': 0}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(math.ceil(1 / admission.OUTLET_RATE)))
+
+
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        idempotency._windows.clear()
+        idempotency._counts.clear()
+        idempotency._per_ccu.clear()
+        self.calls = 0
+
+        @idempotency.idempotent
+        def view(request):
+            self.calls += 1
+            return JsonResponse({'success': True, 'call': self.calls}, status=self.status)
+        self.view = view
+        self.status = 201
+
+    def post(self, **payload):
+        body = json.dumps({'ccu_id': '1', 'boot_id': 7, **payload})
+        return self.view(RequestFactory().post('/api/data/', body, content_type='application/json'))
+
+    def test_retry_is_answered_from_the_first_response(self):
+        first = self.post(seq=5)
+        retry = self.post(seq=5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual((retry.status_code, retry.content), (201, first.content))
+        self.assertEqual(retry['X-Idempotent-Replay'], 'true')
+        self.assertEqual(idempotency.stats()['duplicates'], 1)
+
+    def test_failed_delivery_is_forgotten(self):
+        self.status = 500
+        self.post(seq=5)
+        self.status = 201
+        self.assertEqual(self.post(seq=5).status_code, 201)
+        self.assertEqual(self.calls, 2)
+
+    def test_window_and_reboot(self):
+        with mock.patch.object(idempotency, 'WINDOW_SIZE', 3):
+            for seq in (1, 2, 3, 4):
+                self.post(seq=seq)
+            self.assertFalse(idempotency.seen('01', 7, 1))     # Slid out of the window
+            self.assertTrue(idempotency.seen('01', 7, 4))
+            self.post(seq=2)
+            self.assertEqual(self.calls, 4)
+            self.assertEqual(idempotency.stats()['out_of_order'], 0)
+            self.post(seq=0)                                    # Evicted: processed again
+            self.assertEqual(idempotency.stats()['out_of_order'], 1)
+        self.post(boot_id=8, seq=4)                             # New boot, new window
+        self.assertEqual(self.calls, 6)
+        self.assertFalse(idempotency.seen('01', 7, 4))
+
+    def test_backfilled_readings_are_not_recorded_again(self):
+        idempotency.mark('01', 7, [10, 11])
+        response = self.post(seq=11)
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(json.loads(response.content)['message'], 'Already recorded')
+
+    def test_unnumbered_requests_pass_through(self):
+        self.view(RequestFactory().post('/api/data/', json.dumps({'ccu_id': '01'}), content_type='application/json'))
+        self.view(RequestFactory().post('/api/data/', json.dumps({'ccu_id': '01'}), content_type='application/json'))
+        self.assertEqual(self.calls, 2)
+
+
+@mock.patch.object(shedding, 'SHEDDING_ENABLED', True)
+class LoadSheddingTests(TestCase):
+    """10 A breaker limit; three sheddable outlets drawing 2 A, 3 A and 4 A."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        cls.ccu = CentralControlUnit.objects.create(user=cls.user, ccu_id='01', breaker_threshold=10000)
+        cls.outlets = [Outlet.objects.create(user=cls.user, ccu=cls.ccu, name=f'Outlet {n}', device_id=f'F{n}',
+                                             shed_priority=n, relay_a=True)
+                       for n in (1, 2, 3)]
+        Outlet.objects.create(user=cls.user, ccu=cls.ccu, name='Fridge', device_id='F9', relay_a=True)
+
+    def setUp(self):
+        shedding._states.clear()
+        reconcile._latest.clear()
+        self.now = timezone.now()
+        for outlet, load in zip(self.outlets, (2000, 3000, 4000)):
+            reconcile.record_outlet_reading(outlet, load, 0, self.now)
+        patcher = mock.patch.object(shedding._executor, 'submit')
+        self.submit = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def evaluate(self, current_ma, seconds=0):
+        chosen = shedding.evaluate(self.ccu, current_ma, self.now + timedelta(seconds=seconds))
+        return [o.device_id for o in chosen]
+
+    def test_cuts_by_priority_until_the_excess_is_covered(self):
+        # Excess over the release level: 13 A - 9 A = 4 A, covered by F1 + F2
+        self.assertEqual(self.evaluate(13000), ['F1', 'F2'])
+        self.assertEqual(self.submit.call_count, 1)
+
+    def test_hysteresis_and_escalation(self):
+        self.assertEqual(self.evaluate(9500), [])                           # Inside the band
+        self.assertEqual(self.evaluate(10500), ['F1'])
+        self.assertEqual(self.evaluate(10500, seconds=1), [])               # Waiting for the cut to show
+        self.assertEqual(self.evaluate(10500, seconds=shedding.ESCALATE_SECONDS), ['F2'])
+        self.assertEqual(self.evaluate(8000, seconds=20), [])               # Re-armed
+        self.assertEqual(self.evaluate(10500, seconds=21), ['F1'])
+
+    def test_never_cuts_unprioritized_outlets(self):
+        self.assertEqual(self.evaluate(30000), ['F1', 'F2', 'F3'])
+        self.assertEqual(self.evaluate(30000, seconds=shedding.ESCALATE_SECONDS), [])
+
+
+class SyncManifestTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        cls.ccu = CentralControlUnit.objects.create(user=cls.user, ccu_id='01')
+        cls.outlet = Outlet.objects.create(user=cls.user, ccu=cls.ccu, name='Fan', device_id='FE')
+
+    def setUp(self):
+        sync._versions.clear()
+        sync._manifests.clear()
+        focus._focus.clear()
+
+    def fetch(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/api/sync/?ccu_id=1', **headers)
+
+    def test_unchanged_manifest_is_a_304_without_queries(self):
+        first = self.fetch()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['devices'], ['FE'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.fetch(first['ETag']).status_code, 304)
+
+    def test_changes_bump_the_version(self):
+        etag = self.fetch()['ETag']
+        self.ccu.last_seen = timezone.now()
+        self.ccu.save(update_fields=['last_seen'])      # Bookkeeping only
+        self.assertEqual(self.fetch(etag).status_code, 304)
+
+        self.outlet.relay_a = True
+        self.outlet.save()
+        response = self.fetch(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['outlets'][0]['relay_a'])
+
+        focus.set_focus(self.ccu, 'FE')
+        response = self.fetch(response['ETag'])
+        self.assertEqual(response.json()['focused_device'], 'FE')
+
+
+class FocusTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        cls.ccu = CentralControlUnit.objects.create(user=cls.user, ccu_id='01')
+        Outlet.objects.create(user=cls.user, ccu=cls.ccu, name='Fan', device_id='FE')
+
+    def setUp(self):
+        focus._focus.clear()
+        self.client.force_login(self.user)
+
+    def test_poll_with_the_current_version_is_a_304(self):
+        first = self.client.get('/api/focus/?ccu_id=01').json()
+        self.assertIsNone(first['device_id'])
+        self.assertEqual(self.client.get(f'/api/focus/?ccu_id=01&version={first["version"]}').status_code, 304)
+
+        self.client.post('/api/focus/fe/')
+        changed = self.client.get(f'/api/focus/?ccu_id=01&version={first["version"]}').json()
+        self.assertEqual(changed['device_id'], 'FE')
+        self.assertEqual(CentralControlUnit.objects.get(pk=self.ccu.pk).focused_device, 'FE')
+
+    async def test_long_poll_wakes_on_change(self):
+        _, version = await sync_to_async(focus.get)('01')
+        waiting = asyncio.create_task(focus.wait_for_change('01', version, 5))
+        await asyncio.sleep(0.05)
+        self.assertFalse(waiting.done())
+        # Changed from another thread, as a request handled by a sync view would
+        await sync_to_async(focus.set_focus)(self.ccu, 'FE')
+        await asyncio.wait_for(waiting, 1)
+        self.assertEqual(focus.peek('01')[0], 'FE')
+
+
+class TracingTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.trace_file = os.path.join(directory.name, 'traces.jsonl')
+
+        @tracing.traced('ingest')
+        def view(request):
+            with tracing.span('db_write', rows=2):
+                self.carrier = tracing.inject()
+            return JsonResponse({'success': True})
+        self.view = view
+
+    def spans(self):
+        with open(self.trace_file, encoding='utf-8') as f:
+            return [span for line in f
+                    for span in json.loads(line)['resourceSpans'][0]['scopeSpans'][0]['spans']]
+
+    def test_view_stage_and_delivery_share_one_trace(self):
+        with override_settings(TRACE_ENABLED=True, TRACE_FILE=self.trace_file):
+            self.view(RequestFactory().post('/api/data/'))
+            with tracing.delivery_span('sensor_update', self.carrier, group='sensor_FE'):
+                pass
+        root, stage, delivery = self.spans()
+        self.assertEqual((root['name'], stage['name'], delivery['name']), ('ingest', 'db_write', 'sensor_update'))
+        self.assertEqual({root['traceId'], stage['traceId'], delivery['traceId']}, {root['traceId']})
+        self.assertEqual(stage['parentSpanId'], root['spanId'])
+        self.assertEqual(delivery['parentSpanId'], stage['spanId'])
+        self.assertNotIn('parentSpanId', root)
+        self.assertIn({'key': 'rows', 'value': {'intValue': '2'}}, stage['attributes'])
+        self.assertIn({'key': 'http.status_code', 'value': {'intValue': '200'}}, root['attributes'])
+
+    def test_disabled_tracing_writes_nothing(self):
+        with override_settings(TRACE_ENABLED=False, TRACE_FILE=self.trace_file):
+            self.view(RequestFactory().post('/api/data/'))
+        self.assertIsNone(self.carrier)
+        self.assertFalse(os.path.exists(self.trace_file))
+
+
+class BackfillTests(TestCase):
+    """POST /api/backfill/ — a malformed batch must never answer 5xx (the CCU would resend it forever)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        cls.ccu = CentralControlUnit.objects.create(user=cls.user, ccu_id='01')
+        cls.outlet = Outlet.objects.create(user=cls.user, ccu=cls.ccu, name='Fan', device_id='FE')
+
+    def setUp(self):
+        admission._buckets.clear()
+        idempotency._windows.clear()
+
+    def post(self, body):
+        return self.client.post('/api/backfill/', json.dumps(body), content_type='application/json')
+
+    def test_bad_readings_are_skipped_and_acked(self):
+        response = self.post({'ccu_id': '01', 'boot_id': 7, 'readings': [
+            'garbage',
+            {'seq': 1, 'age_ms': 60000, 'device_id': 'FE', 'current_a': 1200, 'current_b': 0},
+            {'seq': 2, 'timestamp': 10 ** 20, 'device_id': 'FE', 'current_a': 1200, 'current_b': 0},
+            {'seq': 3, 'age_ms': 10 ** 20, 'current_ma': 5000},
+            {'seq': 4, 'age_ms': 30000, 'current_ma': 'n/a'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['recorded'], data['skipped'], data['ack']), (1, 4, 4))
+        self.assertEqual(SensorData.objects.filter(outlet=self.outlet, seq=1).count(), 1)
+
+    def test_malformed_batches_are_rejected(self):
+        for body in ([1, 2, 3], {'ccu_id': '01', 'boot_id': 'abc', 'readings': []},
+                     {'ccu_id': '01', 'boot_id': None, 'readings': []}, {'ccu_id': '01', 'readings': []}):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
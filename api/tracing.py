@@ -0,0 +1,190 @@
+"""
+Lightweight span tracing for the real-time sensor path.
+
+A root span is opened by @traced around an ingest view; stage spans are
+opened with span() inside it.  The trace context is carried to the
+WebSocket consumers through inject() in the channel-layer event, where
+delivery_span() records the browser push as a child span.
+
+Finished spans are appended to TRACE_FILE as OTLP/JSON lines (the same
+shape the OpenTelemetry collector's file exporter writes), one line per
+batch.  Tracing is off unless TRACE_ENABLED is set — every helper is a
+cheap no-op in that case.
+"""
+import json
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+SERVICE_NAME = 'smart-outlet-webapp'
+
+# OTLP SpanKind values
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CONSUMER = 5
+
+_current_span = ContextVar('current_span', default=None)
+_write_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, 'TRACE_ENABLED', False)
+
+
+class Span:
+    """A single timed operation. Spans of one trace share a buffer owned by the root."""
+
+    __slots__ = ('name', 'kind', 'trace_id', 'span_id', 'parent_id',
+                 'start_ns', 'end_ns', 'attributes', 'buffer')
+
+    def __init__(self, name, kind=KIND_INTERNAL, trace_id=None, parent_id=None,
+                 start_ns=None, buffer=None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = {}
+        self.buffer = buffer if buffer is not None else []
+        self.buffer.append(self)
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def child(self, name, kind=KIND_INTERNAL):
+        return Span(name, kind=kind, trace_id=self.trace_id,
+                    parent_id=self.span_id, buffer=self.buffer)
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or time.time_ns()),
+            'attributes': [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed = {'boolValue': value}
+    elif isinstance(value, int):
+        typed = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed = {'doubleValue': value}
+    else:
+        typed = {'stringValue': str(value)}
+    return {'key': key, 'value': typed}
+
+
+def export(spans):
+    """Append finished spans to the trace file as one OTLP/JSON line."""
+    if not spans:
+        return
+    line = json.dumps({
+        'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attribute('service.name', SERVICE_NAME)]},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': [s.to_otlp() for s in spans],
+            }],
+        }]
+    }, separators=(',', ':'))
+    path = getattr(settings, 'TRACE_FILE', 'traces.jsonl')
+    try:
+        with _write_lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    except OSError:
+        pass  # Tracing must never break the request path
+
+
+def traced(name):
+    """Decorator: run the wrapped view inside a new root span and export the trace."""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not is_enabled():
+                return view_func(request, *args, **kwargs)
+
+            root = Span(name, kind=KIND_SERVER)
+            root.set_attribute('http.route', request.path)
+            token = _current_span.set(root)
+            try:
+                response = view_func(request, *args, **kwargs)
+                root.set_attribute('http.status_code', response.status_code)
+                return response
+            finally:
+                _current_span.reset(token)
+                root.end()
+                export(root.buffer)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage of the current trace. No-op outside a traced view."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    current = parent.child(name)
+    for key, value in attributes.items():
+        current.set_attribute(key, value)
+    token = _current_span.set(current)
+    try:
+        yield current
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def inject():
+    """Trace context to carry inside a channel-layer event, or None."""
+    current = _current_span.get()
+    if current is None:
+        return None
+    return {
+        'trace_id': current.trace_id,
+        'span_id': current.span_id,
+        'sent_ns': time.time_ns(),
+    }
+
+
+@contextmanager
+def delivery_span(name, carrier, **attributes):
+    """
+    Record a consumer-side delivery as a child of the span in `carrier`.
+    The span starts when the event was handed to the channel layer, so it
+    covers queueing in the layer as well as the WebSocket send.
+    """
+    if not carrier or not is_enabled():
+        yield None
+        return
+
+    current = Span(name, kind=KIND_CONSUMER, trace_id=carrier['trace_id'],
+                   parent_id=carrier['span_id'], start_ns=carrier['sent_ns'])
+    for key, value in attributes.items():
+        current.set_attribute(key, value)
+    try:
+        yield current
+    finally:
+        current.end()
+        export([current])
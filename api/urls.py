@@ -6,10 +6,15 @@ app_name = 'api'
 urlpatterns = [
     path('data/', views.receive_sensor_data, name='receive_sensor_data'),
     path('breaker-data/', views.receive_breaker_data, name='receive_breaker_data'),
+    path('backfill/', views.receive_backfill, name='receive_backfill'),
     path('outlet-status/<str:device_id>/', views.get_outlet_status, name='get_outlet_status'),
+    path('commands/bulk/', views.bulk_command, name='bulk_command'),  # Before commands/<device_id>/
     path('commands/<str:device_id>/', views.get_pending_commands, name='get_pending_commands'),
     path('commands/<str:device_id>/<str:command>/', views.queue_command, name='queue_command'),
     path('devices/', views.get_registered_outlets, name='get_registered_outlets'),
+    # CCU sync manifest (ETag / 304) and sampling plan
+    path('sync/', views.sync_manifest, name='sync_manifest'),
+    path('sampling-plan/', views.get_sampling_plan, name='get_sampling_plan'),
     # Focus device (expand/collapse on online dashboard)
     path('focus/', views.get_focus_device, name='get_focus_device'),
     path('focus/clear/', views.clear_focus_device, name='clear_focus_device'),
@@ -18,4 +23,15 @@ urlpatterns = [
     path('export/sheets/', views.export_for_sheets, name='export_for_sheets'),
     # Breaker threshold
     path('breaker-threshold/', views.set_breaker_threshold, name='set_breaker_threshold'),
+    # Bill estimate / tariff what-if
+    path('bill-estimate/ccu/<str:ccu_id>/', views.bill_estimate, name='bill_estimate_ccu'),
+    path('bill-estimate/<str:device_id>/', views.bill_estimate, name='bill_estimate'),
+    # History on a regular grid (reconstructed from compressed rows)
+    path('history/ccu/<str:ccu_id>/', views.history_series, name='history_series_ccu'),
+    path('history/<str:device_id>/', views.history_series, name='history_series'),
+    # Every sample from the telemetry chunks (TELEMETRY_CHUNKS_ENABLED)
+    path('telemetry/ccu/<str:ccu_id>/', views.telemetry_samples, name='telemetry_samples_ccu'),
+    path('telemetry/<str:device_id>/', views.telemetry_samples, name='telemetry_samples'),
+    # Ingest counters (staff only)
+    path('ingest-stats/', views.ingest_stats, name='ingest_stats'),
 ]
\ No newline at end of file
@@ -1,21 +1,22 @@
-from django.http import JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponseNotModified, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
+from django.conf import settings
 from outlets.models import Outlet, SensorData, Alert, PendingCommand, MainBreakerReading, CentralControlUnit, EventLog
+from outlets import anomaly, billing, conditioning, energy, history, liveness, reconcile, ringbuffer, sampling, telemetry, usage
 from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
+from . import admission, backfill, commands, focus, idempotency, shedding, sync, tracing
+from .ccu_client import DIRECT_CMD_TIMEOUT, send_command as _send_direct_to_esp32
 import json
-import requests as http_requests
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decouple import config
 
-# How often to persist sensor data to the database.
-# Data is always pushed to WebSocket for real-time UI updates.
-DB_LOG_INTERVAL = timedelta(seconds=60)
-
-# How recent the CCU must have been seen to attempt direct HTTP
-DIRECT_CMD_TIMEOUT = timedelta(seconds=30)
-DIRECT_CMD_HTTP_TIMEOUT = 3  # seconds
+# Store-and-forward backfill limits
+BACKFILL_MAX_READINGS = 500
+BACKFILL_MAX_AGE = timedelta(hours=config('BACKFILL_MAX_AGE_HOURS', default=24, cast=float))
 
 
 def _get_client_ip(request):
@@ -32,32 +33,29 @@ def _update_ccu_ip(ccu_obj, ip):
         ccu_obj.ip_address = ip
         ccu_obj.last_seen = timezone.now()
         ccu_obj.save(update_fields=['ip_address', 'last_seen'])
+        liveness.ccu_seen(ccu_obj, ccu_obj.last_seen)
 
 
-def _send_direct_to_esp32(ip, device_id, command, socket='', value=None):
-    """
-    Send a command directly to the ESP32's local web server.
-    Returns (success: bool, response_data: dict or None).
-    """
-    try:
-        url = f'http://{ip}/api/ext/relay'
-        payload = {
-            'device_id': device_id,
-            'command': command,
-            'socket': socket,
-        }
-        if value is not None:
-            payload['value'] = str(value)
+def _raise_anomaly_alerts(alerts, now, outlet=None, ccu=None):
+    """Persist alerts from the streaming anomaly detector (outlet or main breaker)."""
+    owner = outlet or ccu
+    for alert_type, message in alerts:
+        Alert.objects.create(outlet=outlet, ccu=ccu, alert_type=alert_type, message=message)
+        usage.record_alert(outlet, alert_type, now, ccu=ccu)
+        EventLog.objects.create(
+            user_id=owner.user_id,
+            source='SERVER',
+            action_type=f'{alert_type.upper()}_DETECTED',
+            target_device=f'0x{outlet.device_id}' if outlet else f'CCU {ccu.ccu_id}',
+            details=message,
+        )
 
-        resp = http_requests.post(url, data=payload, timeout=DIRECT_CMD_HTTP_TIMEOUT)
-        if resp.status_code == 200:
-            return True, resp.json()
-        return False, None
-    except Exception:
-        return False, None
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@admission.admitted('outlet')
+@idempotency.idempotent
+@tracing.traced('receive_sensor_data')
 def receive_sensor_data(request):
     """
     API endpoint for CCU (ESP32) to send sensor data.
@@ -65,7 +63,7 @@ def receive_sensor_data(request):
     
     Hybrid approach:
       - ALWAYS broadcasts via WebSocket for real-time UI
-      - Only saves to DB every 30 seconds (DB_LOG_INTERVAL)
+      - Saves to DB per the outlet's history_mode (outlets/history.py)
       - Alerts and relay state updates always happen immediately
     
     Expected JSON payload from CCU firmware:
@@ -75,7 +73,8 @@ def receive_sensor_data(request):
         "current_b": 800,
         "relay_a": true,
         "relay_b": false,
-        "is_overload": false
+        "is_overload": false,
+        "ccu_id": "01", "boot_id": 2864434397, "seq": 1042   // optional, see api/idempotency.py
     }
     """
     try:
@@ -90,26 +89,27 @@ def receive_sensor_data(request):
             }, status=400)
         
         # Find the outlet by device_id
-        try:
-            outlet = Outlet.objects.get(device_id=data['device_id'])
-        except Outlet.DoesNotExist:
-            return JsonResponse({
-                'success': False,
-                'message': f'Outlet with device_id {data["device_id"]} not found'
-            }, status=404)
-
-        # Auto-capture ESP32 IP and link outlet to CCU
-        client_ip = _get_client_ip(request)
-        # Try to find which CCU is sending — use breaker data's ccu_id or first user CCU
-        if not outlet.ccu:
-            # Auto-link: find a CCU owned by the same user
-            ccu_obj = CentralControlUnit.objects.filter(user=outlet.user).first()
-            if ccu_obj:
-                outlet.ccu = ccu_obj
-                outlet.save(update_fields=['ccu'])
-                _update_ccu_ip(ccu_obj, client_ip)
-        else:
-            _update_ccu_ip(outlet.ccu, client_ip)
+        with tracing.span('outlet_lookup', device_id=data['device_id']):
+            try:
+                outlet = Outlet.objects.select_related('ccu').get(device_id=data['device_id'])
+            except Outlet.DoesNotExist:
+                return JsonResponse({
+                    'success': False,
+                    'message': f'Outlet with device_id {data["device_id"]} not found'
+                }, status=404)
+
+            # Auto-capture ESP32 IP and link outlet to CCU
+            client_ip = _get_client_ip(request)
+            # Try to find which CCU is sending — use breaker data's ccu_id or first user CCU
+            if not outlet.ccu:
+                # Auto-link: find a CCU owned by the same user
+                ccu_obj = CentralControlUnit.objects.filter(user=outlet.user).first()
+                if ccu_obj:
+                    outlet.ccu = ccu_obj
+                    outlet.save(update_fields=['ccu'])
+                    _update_ccu_ip(ccu_obj, client_ip)
+            else:
+                _update_ccu_ip(outlet.ccu, client_ip)
         
         # Parse values
         is_overload = data.get('is_overload', False)
@@ -119,15 +119,16 @@ def receive_sensor_data(request):
         if current_a == 65535 or current_b == 65535:
             is_overload = True
         
-        # Noise floor filter: PIC current sensors output ~49-98mA baseline
-        # noise even with no load. Clamp 0-100mA to 0 (skip overload sentinel).
-        NOISE_FLOOR_MA = 100
-        if 0 < current_a <= NOISE_FLOOR_MA:
-            current_a = 0
-        if 0 < current_b <= NOISE_FLOOR_MA:
-            current_b = 0
+        # Calibration, spike rejection, smoothing, noise floor (per outlet settings)
+        current_a, current_b = conditioning.outlet_reading(outlet, current_a, current_b)
         
         now = timezone.now()
+        liveness.outlet_seen(outlet, now)
+        usage.record_outlet_reading(outlet, current_a, current_b, is_overload, now)
+        energy.record_outlet_reading(outlet, current_a, current_b, now)
+        telemetry.record_outlet_reading(outlet, current_a, current_b, is_overload, now)
+        ringbuffer.record_outlet_reading(outlet.device_id, current_a, current_b, is_overload, now)
+        reconcile.record_outlet_reading(outlet, current_a, current_b, now)
         
         # NOTE: Relay state (relay_a/relay_b) from sensor data is NOT used here.
         # The ESP32 OutletDevice only knows relay state from PIC ACK packets,
@@ -135,71 +136,80 @@ def receive_sensor_data(request):
         # queue_command() when the user toggles from the UI.
         
         # Alerts always fire immediately (critical events)
-        # Format current values — replace 0xFFFF sentinel with "OVERLOAD" label
-        display_a = 'OVERLOAD' if current_a == 65535 else f'{current_a}mA'
-        display_b = 'OVERLOAD' if current_b == 65535 else f'{current_b}mA'
-        
-        if is_overload:
-            Alert.objects.create(
-                outlet=outlet,
-                alert_type='overload',
-                message=f'Overload trip detected! Socket A: {display_a}, Socket B: {display_b}'
-            )
-            EventLog.objects.create(
-                user=outlet.user,
-                source='PIC_HARDWARE',
-                action_type='OVERLOAD_TRIPPED',
-                target_device=f'0x{outlet.device_id}',
-                details=f'Overload trip on {outlet.name}! Socket A: {display_a}, Socket B: {display_b}. Relay auto-cutoff triggered.'
-            )
+        with tracing.span('alert_evaluation'):
+            # Format current values — replace 0xFFFF sentinel with "OVERLOAD" label
+            display_a = 'OVERLOAD' if current_a == 65535 else f'{current_a}mA'
+            display_b = 'OVERLOAD' if current_b == 65535 else f'{current_b}mA'
         
-        if outlet.threshold > 0 and (current_a > outlet.threshold or current_b > outlet.threshold):
-            Alert.objects.create(
-                outlet=outlet,
-                alert_type='threshold',
-                message=f'Threshold ({outlet.threshold}mA) exceeded! Socket A: {display_a}, Socket B: {display_b}'
-            )
-            EventLog.objects.create(
-                user=outlet.user,
-                source='SERVER',
-                action_type='THRESHOLD_EXCEEDED',
-                target_device=f'0x{outlet.device_id}',
-                details=f'Threshold ({outlet.threshold}mA) exceeded on {outlet.name}! Socket A: {display_a}, Socket B: {display_b}'
-            )
+            if is_overload:
+                Alert.objects.create(
+                    outlet=outlet,
+                    alert_type='overload',
+                    message=f'Overload trip detected! Socket A: {display_a}, Socket B: {display_b}'
+                )
+                usage.record_alert(outlet, 'overload', now)
+                EventLog.objects.create(
+                    user=outlet.user,
+                    source='PIC_HARDWARE',
+                    action_type='OVERLOAD_TRIPPED',
+                    target_device=f'0x{outlet.device_id}',
+                    details=f'Overload trip on {outlet.name}! Socket A: {display_a}, Socket B: {display_b}. Relay auto-cutoff triggered.'
+                )
         
-        # DB write: only persist sensor data every DB_LOG_INTERVAL
-        saved_to_db = False
-        last_entry = SensorData.objects.filter(outlet=outlet).first()
-        if not last_entry or (now - last_entry.timestamp) >= DB_LOG_INTERVAL:
-            SensorData.objects.create(
-                outlet=outlet,
-                current_a=current_a,
-                current_b=current_b,
-                is_overload=is_overload,
-            )
-            saved_to_db = True
+            if outlet.threshold > 0 and (current_a > outlet.threshold or current_b > outlet.threshold):
+                Alert.objects.create(
+                    outlet=outlet,
+                    alert_type='threshold',
+                    message=f'Threshold ({outlet.threshold}mA) exceeded! Socket A: {display_a}, Socket B: {display_b}'
+                )
+                usage.record_alert(outlet, 'threshold', now)
+                EventLog.objects.create(
+                    user=outlet.user,
+                    source='SERVER',
+                    action_type='THRESHOLD_EXCEEDED',
+                    target_device=f'0x{outlet.device_id}',
+                    details=f'Threshold ({outlet.threshold}mA) exceeded on {outlet.name}! Socket A: {display_a}, Socket B: {display_b}'
+                )
+
+            _raise_anomaly_alerts(anomaly.check_outlet(outlet, current_a, current_b, now), now, outlet=outlet)
+
+        # An open fault keeps the outlet on the CCU's fast sampling tier
+        over_threshold = outlet.threshold > 0 and (current_a > outlet.threshold or current_b > outlet.threshold)
+        sampling.note_reading(outlet.device_id, is_overload or over_threshold)
+        
+        # DB write: only the readings the outlet's history_mode keeps
+        with tracing.span('db_write') as db_span:
+            rows = history.outlet_rows(outlet, current_a, current_b, is_overload, now,
+                                       *idempotency.numbering(data))
+            if rows:
+                SensorData.objects.bulk_create(rows, ignore_conflicts=True)
+            saved_to_db = bool(rows)
+            if db_span:
+                db_span.set_attribute('db.persisted', saved_to_db)
         
         # WebSocket: ALWAYS broadcast for real-time UI
-        try:
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f'sensor_{outlet.device_id}',
-                {
-                    'type': 'sensor_update',
-                    'data': {
-                        'outlet_name': outlet.name,
-                        'device_id': outlet.device_id,
-                        'relay_a': outlet.relay_a,
-                        'relay_b': outlet.relay_b,
-                        'current_a': current_a,
-                        'current_b': current_b,
-                        'is_overload': is_overload,
-                        'timestamp': now.isoformat(),
+        with tracing.span('group_send'):
+            try:
+                channel_layer = get_channel_layer()
+                async_to_sync(channel_layer.group_send)(
+                    f'sensor_{outlet.device_id}',
+                    {
+                        'type': 'sensor_update',
+                        'trace': tracing.inject(),
+                        'data': {
+                            'outlet_name': outlet.name,
+                            'device_id': outlet.device_id,
+                            'relay_a': outlet.relay_a,
+                            'relay_b': outlet.relay_b,
+                            'current_a': current_a,
+                            'current_b': current_b,
+                            'is_overload': is_overload,
+                            'timestamp': now.isoformat(),
+                        }
                     }
-                }
-            )
-        except Exception:
-            pass  # WebSocket push is best-effort
+                )
+            except Exception:
+                pass  # WebSocket push is best-effort
         
         return JsonResponse({
             'success': True,
@@ -222,6 +232,8 @@ def receive_sensor_data(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@admission.admitted('breaker')
+@idempotency.idempotent
 def receive_breaker_data(request):
     """
     API endpoint for CCU to send main breaker (SCT-013) readings.
@@ -229,12 +241,13 @@ def receive_breaker_data(request):
     
     Hybrid approach:
       - ALWAYS broadcasts via WebSocket for real-time UI
-      - Only saves to DB every 5 minutes (DB_LOG_INTERVAL)
+      - Saves to DB per the CCU's history_mode (outlets/history.py)
     
     Expected JSON payload from CCU firmware:
     {
         "ccu_id": "01",
-        "current_ma": 4500
+        "current_ma": 4500,
+        "boot_id": 2864434397, "seq": 1043      // optional, see api/idempotency.py
     }
     """
     try:
@@ -250,29 +263,29 @@ def receive_breaker_data(request):
         
         ccu_id = str(data['ccu_id']).upper().zfill(2)  # '1' → '01' to match registered format
         current_ma = max(0, int(data['current_ma']))
-        
-        # Noise floor filter: SCT-013 sensor outputs baseline noise with no load.
-        BREAKER_NOISE_FLOOR_MA = 280
-        if 0 < current_ma <= BREAKER_NOISE_FLOOR_MA:
-            current_ma = 0
-        
         now = timezone.now()
         
         # Look up registered CCU (if exists) and capture IP
         ccu_obj = CentralControlUnit.objects.filter(ccu_id=ccu_id).first()
         _update_ccu_ip(ccu_obj, _get_client_ip(request))
+        # Calibration, spike rejection, smoothing, noise floor (SCT-013 idles at ~280mA)
+        current_ma = conditioning.breaker_reading(ccu_id, ccu_obj, current_ma)
+        usage.record_breaker_reading(ccu_obj, current_ma, now)
+        # Unaccounted load: breaker minus the time-aligned outlet loads
+        balance = reconcile.reconcile(ccu_obj, current_ma, now) if ccu_obj else None
+        energy.record_breaker_reading(ccu_obj, current_ma, now, balance and balance['unaccounted_ma'])
+        telemetry.record_breaker_reading(ccu_obj, current_ma, now)
+        ringbuffer.record_breaker_reading(ccu_id, current_ma, now)
+        if ccu_obj:
+            _raise_anomaly_alerts(anomaly.check_breaker(ccu_obj, current_ma, now), now, ccu=ccu_obj)
+        # Breaker protection: shed prioritized outlets on overload (dispatch runs in background)
+        shed = shedding.evaluate(ccu_obj, current_ma, now)
         
-        # DB write: only persist every DB_LOG_INTERVAL
-        saved_to_db = False
-        last_entry = MainBreakerReading.objects.filter(ccu_id=ccu_id).first()
-        if not last_entry or (now - last_entry.timestamp) >= DB_LOG_INTERVAL:
-            MainBreakerReading.objects.create(
-                ccu_id=ccu_id,
-                ccu_device=ccu_obj,
-                current_ma=current_ma,
-                threshold=ccu_obj.breaker_threshold if ccu_obj else 0,
-            )
-            saved_to_db = True
+        # DB write: only the readings the CCU's history_mode keeps
+        rows = history.breaker_rows(ccu_id, ccu_obj, current_ma, now, *idempotency.numbering(data))
+        if rows:
+            MainBreakerReading.objects.bulk_create(rows, ignore_conflicts=True)
+        saved_to_db = bool(rows)
         
         # WebSocket: ALWAYS broadcast for real-time UI
         try:
@@ -286,6 +299,7 @@ def receive_breaker_data(request):
                         'current_ma': current_ma,
                         'current_amps': round(current_ma / 1000.0, 2),
                         'timestamp': now.isoformat(),
+                        **(balance or {}),
                     }
                 }
             )
@@ -295,6 +309,113 @@ def receive_breaker_data(request):
         return JsonResponse({
             'success': True,
             'message': 'Breaker data received' + (' (logged to DB)' if saved_to_db else ' (WebSocket only)'),
+            'shed': [o.device_id for o in shed],
+        })
+        
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'success': False,
+            'message': 'Invalid JSON format'
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@admission.admitted('backfill')
+def receive_backfill(request):
+    """
+    API endpoint for the CCU to forward readings it could not send live
+    (Wi-Fi or server down). Readings are recorded without real-time side
+    effects — see api/backfill.py.
+    URL: POST /api/backfill/
+    
+    Expected JSON payload:
+    {
+        "ccu_id": "01",
+        "boot_id": 2864434397,          // random per CCU boot
+        "readings": [                   // oldest first, at most 500
+            {"seq": 17, "age_ms": 64000, "device_id": "FE", "current_a": 1200, "current_b": 0, "is_overload": false},
+            {"seq": 18, "age_ms": 62000, "current_ma": 5300}
+        ]
+    }
+    age_ms is how long before this request the reading was taken; a CCU with
+    a synced clock may send "timestamp" (epoch ms) instead. A reading without
+    device_id is a main breaker reading. The answer's "ack" is the highest seq
+    the CCU may drop from its backlog.
+    """
+    try:
+        data = json.loads(request.body)
+        readings = data.get('readings') if isinstance(data, dict) else None
+        required_fields = ['ccu_id', 'boot_id', 'readings']
+        if not isinstance(readings, list) or not all(field in data for field in required_fields):
+            return JsonResponse({
+                'success': False,
+                'message': f'Missing required fields. Required: {required_fields}'
+            }, status=400)
+        if len(readings) > BACKFILL_MAX_READINGS:
+            return JsonResponse({
+                'success': False,
+                'message': f'Too many readings (max {BACKFILL_MAX_READINGS} per request)'
+            }, status=400)
+        
+        try:
+            boot_id = int(data['boot_id'])
+        except (TypeError, ValueError):
+            return JsonResponse({'success': False, 'message': 'boot_id must be an integer'}, status=400)
+        
+        ccu_id = str(data['ccu_id']).upper().zfill(2)
+        now = timezone.now()
+        ccu_obj = CentralControlUnit.objects.filter(ccu_id=ccu_id).first()
+        _update_ccu_ip(ccu_obj, _get_client_ip(request))
+        
+        # A malformed entry is skipped, not fatal: a 5xx would make the CCU resend the batch forever
+        valid = [r for r in readings if isinstance(r, dict)]
+        device_ids = {str(r['device_id']).upper() for r in valid if r.get('device_id')}
+        outlets = {o.device_id: o for o in Outlet.objects.filter(device_id__in=device_ids).select_related('ccu')}
+        
+        parsed, skipped, ack = [], len(readings) - len(valid), None
+        for r in valid:
+            try:
+                seq = int(r['seq'])
+                # Acked even if the rest is unusable, so the CCU drops it from its backlog
+                ack = seq if ack is None else max(ack, seq)
+                if 'timestamp' in r:
+                    ts = datetime.fromtimestamp(int(r['timestamp']) / 1000, tz=dt_timezone.utc)
+                else:
+                    ts = now - timedelta(milliseconds=max(0, int(r['age_ms'])))
+                if ts > now or now - ts > BACKFILL_MAX_AGE:
+                    skipped += 1
+                    continue
+                if r.get('device_id'):
+                    outlet = outlets.get(str(r['device_id']).upper())
+                    if outlet is None:
+                        skipped += 1    # Unregistered device
+                        continue
+                    current_a = max(0, int(r['current_a']))
+                    current_b = max(0, int(r['current_b']))
+                    is_overload = bool(r.get('is_overload')) or current_a == 65535 or current_b == 65535
+                    parsed.append({'seq': seq, 'timestamp': ts, 'outlet': outlet, 'current_a': current_a,
+                                   'current_b': current_b, 'is_overload': is_overload})
+                else:
+                    current_ma = max(0, int(r['current_ma']))
+                    parsed.append({'seq': seq, 'timestamp': ts, 'current_ma': current_ma})
+            except (KeyError, TypeError, ValueError, OverflowError, OSError):
+                skipped += 1     # Out-of-range timestamps raise OverflowError / OSError
+        
+        recorded, duplicates = backfill.ingest(ccu_id, ccu_obj, boot_id, parsed)
+        
+        return JsonResponse({
+            'success': True,
+            'message': f'{recorded} readings recorded',
+            'recorded': recorded,
+            'duplicates': duplicates,
+            'skipped': skipped,
+            'ack': ack,
         })
         
     except json.JSONDecodeError:
@@ -463,6 +584,70 @@ def queue_command(request, device_id, command):
 
 
 
+@require_http_methods(["POST"])
+def bulk_command(request):
+    """
+    API endpoint for the UI to switch many sockets in one call (e.g. Cut All Power).
+    URL: POST /api/commands/bulk/
+    Body: {"commands": [{"device_id": "FE", "socket": "a", "command": "relay_off"}, ...]}
+       or {"all": true, "command": "relay_off"} for both sockets of every outlet.
+    One direct request per CCU; fallback is a single PendingCommand bulk insert.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'Authentication required'}, status=401)
+
+    try:
+        data = json.loads(request.body)
+        outlets = {o.device_id: o for o in Outlet.objects.filter(user=request.user).select_related('ccu')}
+
+        if data.get('all'):
+            command = data.get('command', '')
+            requested = [(device_id, socket, command) for device_id in outlets for socket in ('a', 'b')]
+        else:
+            requested = [
+                (str(c.get('device_id', '')).upper(), str(c.get('socket', '')).lower(), c.get('command', ''))
+                for c in data.get('commands', [])
+            ]
+        if not requested:
+            return JsonResponse({'success': False, 'message': 'No commands provided'}, status=400)
+
+        items = []
+        for device_id, socket, command in requested:
+            if command not in commands.RELAY_COMMANDS:
+                return JsonResponse({'success': False, 'message': f'Invalid command: {command}'}, status=400)
+            if socket not in ('a', 'b'):
+                return JsonResponse({'success': False, 'message': f'Invalid socket: {socket}'}, status=400)
+            if device_id not in outlets:
+                return JsonResponse({'success': False, 'message': f'Outlet {device_id} not found or unauthorized'}, status=404)
+            items.append((outlets[device_id], socket, command))
+
+        result = commands.dispatch_relay_commands(items)
+
+        devices = sorted({outlet.device_id for outlet, _, _ in items})
+        states = '/'.join(sorted({command.replace('relay_', '').upper() for _, _, command in items}))
+        cut_all = data.get('all') and data.get('command') == 'relay_off'
+        if data.get('all'):
+            target = 'All Devices'
+        else:
+            # target_device is a short column; the full list goes into details
+            target = f'0x{devices[0]}' if len(devices) == 1 else f'{len(devices)} devices'
+        EventLog.objects.create(
+            user=request.user,
+            source='WEB_DASHBOARD',
+            action_type='CUT_ALL_POWER' if cut_all else 'BULK_RELAY',
+            target_device=target,
+            details=(f'{len(items)} socket(s) on {len(devices)} outlet(s) turned {states} — '
+                     f'{result["direct"]} direct, {result["queued"]} queued ({result["ccus"]} CCU request(s)): '
+                     + ', '.join(f'0x{d}' for d in devices)),
+        )
+        return JsonResponse({'success': True, 'message': f'{len(items)} command(s) sent', **result})
+
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON format'}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=500)
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_pending_commands(request, device_id):
@@ -519,9 +704,13 @@ def get_registered_outlets(request):
     API endpoint for CCU to fetch the master list of registered outlets.
     URL: GET /api/devices/
     
+    Optional ?ccu_id=01 limits the list to that CCU's outlets.
+    
     Returns: { "success": true, "devices": ["FE", "FD"] }
     """
     outlets = Outlet.objects.values_list('device_id', flat=True)
+    if request.GET.get('ccu_id'):
+        outlets = outlets.filter(ccu__ccu_id=focus.normalize_ccu_id(request.GET['ccu_id']))
     return JsonResponse({
         'success': True,
         'devices': list(outlets)
@@ -676,27 +865,36 @@ def export_for_sheets(request):
 #   FOCUS DEVICE — Which outlet the user is currently viewing
 # ═══════════════════════════════════════════════════════════
 
+def _ccu_id_for_ip(ip):
+    """Best guess at the calling CCU when it does not send its ccu_id (older firmware)."""
+    ccu = CentralControlUnit.objects.filter(ip_address=ip).first() or CentralControlUnit.objects.first()
+    return ccu.ccu_id if ccu else None
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def set_focus_device(request, device_id):
     """
-    Set the focused device for the CCU.
+    Set the focused device on the outlet's CCU.
     URL: POST /api/focus/<device_id>/
     Called when user expands a device card on the web dashboard.
     """
     device_id = device_id.upper()
     
-    # Find the CCU (use first available — single-CCU setup)
-    ccu = CentralControlUnit.objects.first()
-    if not ccu:
-        return JsonResponse({'success': False, 'message': 'No CCU registered'}, status=404)
-    
-    # Verify the outlet exists
-    if not Outlet.objects.filter(device_id__iexact=device_id).exists():
+    outlets = Outlet.objects.filter(device_id__iexact=device_id).select_related('ccu')
+    if request.user.is_authenticated:
+        outlets = outlets.filter(user=request.user)
+    outlet = outlets.first()
+    if not outlet:
         return JsonResponse({'success': False, 'message': f'Outlet {device_id} not found'}, status=404)
     
-    ccu.focused_device = device_id
-    ccu.save(update_fields=['focused_device'])
+    # Unlinked outlet: it is polled by one of the owner's CCUs
+    ccus = [outlet.ccu] if outlet.ccu else list(CentralControlUnit.objects.filter(user=outlet.user))
+    if not ccus:
+        return JsonResponse({'success': False, 'message': 'No CCU registered'}, status=404)
+    
+    for ccu in ccus:
+        focus.set_focus(ccu, device_id)
     
     return JsonResponse({'success': True, 'device_id': device_id})
 
@@ -705,31 +903,263 @@ def set_focus_device(request, device_id):
 @require_http_methods(["POST", "DELETE"])
 def clear_focus_device(request):
     """
-    Clear the focused device (no outlet expanded).
+    Clear the focused device (no outlet expanded) on the user's CCUs.
     URL: POST /api/focus/clear/ or DELETE /api/focus/clear/
     Called when user collapses a device card.
     """
-    ccu = CentralControlUnit.objects.first()
-    if not ccu:
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'Authentication required'}, status=401)
+    
+    ccus = CentralControlUnit.objects.filter(user=request.user)
+    if not ccus:
         return JsonResponse({'success': False, 'message': 'No CCU registered'}, status=404)
     
-    ccu.focused_device = ''
-    ccu.save(update_fields=['focused_device'])
+    for ccu in ccus:
+        focus.set_focus(ccu, None)
     
     return JsonResponse({'success': True, 'device_id': None})
 
 
 @csrf_exempt
 @require_http_methods(["GET"])
-def get_focus_device(request):
+async def get_focus_device(request):
     """
-    Get the currently focused device.
-    URL: GET /api/focus/
+    Get the currently focused device of the calling CCU (answered from memory).
+    URL: GET /api/focus/?ccu_id=01[&version=<v>[&wait=<seconds>]]
     ESP32 polls this to know which device to read sensors for.
+    
+    - version: the version from the last answer; if nothing changed → 304
+    - wait: hold the request open until the focus changes (long-poll, max 25s)
+    Without ccu_id the CCU is looked up by its IP address.
     """
-    ccu = CentralControlUnit.objects.first()
-    if not ccu:
+    if request.GET.get('ccu_id'):
+        ccu_id = focus.normalize_ccu_id(request.GET['ccu_id'])
+    else:
+        ccu_id = await sync_to_async(_ccu_id_for_ip)(_get_client_ip(request))
+    if not ccu_id:
         return JsonResponse({'success': True, 'device_id': None})
     
-    focused = ccu.focused_device if ccu.focused_device else None
-    return JsonResponse({'success': True, 'device_id': focused})
\ No newline at end of file
+    focused, version = focus.peek(ccu_id) or await sync_to_async(focus.get)(ccu_id)
+    try:
+        known = int(request.GET.get('version', ''))
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        known, wait = None, 0
+    
+    if known == version and wait > 0:
+        await focus.wait_for_change(ccu_id, version, wait)
+        focused, version = focus.peek(ccu_id)
+    if known == version:
+        return HttpResponseNotModified()
+    
+    return JsonResponse({'success': True, 'device_id': focused, 'version': version})
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def sync_manifest(request):
+    """
+    Everything the calling CCU mirrors, in one versioned document.
+    URL: GET /api/sync/?ccu_id=01
+    Returns {success, ccu_id, version, breaker_threshold, focused_device,
+    devices, outlets: [{device_id, name, relay_a, relay_b, threshold}]} with
+    an ETag; If-None-Match with the current ETag → 304 (no DB query).
+    """
+    if not request.GET.get('ccu_id'):
+        return JsonResponse({'success': False, 'message': 'ccu_id is required'}, status=400)
+    ccu_id = focus.normalize_ccu_id(request.GET['ccu_id'])
+    
+    current = sync.etag(ccu_id)
+    if current and current in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+        response['ETag'] = current
+        return response
+    
+    result = sync.manifest(ccu_id)
+    if result is None:
+        return JsonResponse({'success': False, 'message': f'CCU {ccu_id} not registered'}, status=404)
+    manifest, tag = result
+    response = JsonResponse({'success': True, **manifest})
+    response['ETag'] = tag
+    return response
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_sampling_plan(request):
+    """
+    Which of its outlets the calling CCU should sample fast, in the background
+    round-robin, or only occasionally — from live dashboard demand.
+    URL: GET /api/sampling-plan/?ccu_id=01[&version=<v>]
+    Returns {success, version, high, background, idle, *_interval_ms}; 304 if
+    `version` is still current.
+    """
+    ccu_id = focus.normalize_ccu_id(request.GET['ccu_id']) if request.GET.get('ccu_id') \
+        else _ccu_id_for_ip(_get_client_ip(request))
+    ccu = CentralControlUnit.objects.filter(ccu_id=ccu_id).first() if ccu_id else None
+    if not ccu:
+        return JsonResponse({'success': False, 'message': 'CCU not registered'}, status=404)
+    
+    device_ids = list(Outlet.objects.filter(ccu=ccu).order_by('device_id').values_list('device_id', flat=True))
+    focused, _ = focus.peek(ccu.ccu_id) or focus.get(ccu.ccu_id)
+    plan = sampling.plan(device_ids, focused)
+    if request.GET.get('version') == str(plan['version']):
+        return HttpResponseNotModified()
+    
+    return JsonResponse({'success': True, **plan})
+
+# ═══════════════════════════════════════════════════════════
+#   BILL ESTIMATE — Cost per tariff for an outlet or main breaker
+# ═══════════════════════════════════════════════════════════
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def bill_estimate(request, device_id=None, ccu_id=None):
+    """
+    Estimate the monthly bill for an outlet (or a CCU's main breaker).
+    URL: GET  /api/bill-estimate/<device_id>/?days=30   — configured tariffs
+         POST /api/bill-estimate/<device_id>/           — what-if: {"days": 30, "tariffs": [...]}
+         GET|POST /api/bill-estimate/ccu/<ccu_id>/
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'Authentication required'}, status=401)
+
+    try:
+        data = json.loads(request.body) if request.method == 'POST' and request.body else {}
+        days = int(data.get('days', request.GET.get('days', 30)))
+        if not 1 <= days <= 366:
+            return JsonResponse({'success': False, 'message': 'days must be between 1 and 366'}, status=400)
+        tariffs = data.get('tariffs') or settings.BILLING_TARIFFS
+
+        start, end = billing.window(days)
+        if ccu_id is not None:
+            ccu = CentralControlUnit.objects.filter(ccu_id=ccu_id.upper(), user=request.user).first()
+            if not ccu:
+                return JsonResponse({'success': False, 'message': f'CCU {ccu_id} not found'}, status=404)
+            energy.flush()
+            profile, since = billing.ccu_profile(ccu, start, end)
+            target = {'ccu_id': ccu.ccu_id, 'name': ccu.name}
+        else:
+            outlet = Outlet.objects.select_related('ccu').filter(device_id=device_id.upper(), user=request.user).first()
+            if not outlet:
+                return JsonResponse({'success': False, 'message': f'Outlet {device_id} not found'}, status=404)
+            energy.flush()
+            profile, since = billing.outlet_profile(outlet, start, end)
+            target = {'device_id': outlet.device_id, 'name': outlet.name}
+
+        # Project from the time actually covered, not the requested window
+        observed_days = (end - max(start, since)).total_seconds() / 86400 if since else 0
+        return JsonResponse({'success': True, **target, **billing.estimate(profile, observed_days, tariffs)})
+
+    except billing.TariffError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    except (json.JSONDecodeError, ValueError):
+        return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=500)
+
+
+# ═══════════════════════════════════════════════════════════
+#   HISTORY SERIES — Persisted readings rebuilt on a regular grid
+# ═══════════════════════════════════════════════════════════
+
+HISTORY_MAX_POINTS = 5000
+TELEMETRY_MAX_MINUTES = 360
+
+
+@require_http_methods(["GET"])
+def history_series(request, device_id=None, ccu_id=None):
+    """
+    Current history of an outlet (or a CCU's main breaker) on a regular grid,
+    rebuilt from the compressed rows per the device's history_mode.
+    URL: GET /api/history/<device_id>/?hours=24&step=60
+         GET /api/history/ccu/<ccu_id>/?hours=24&step=60
+    Values are null where the device was silent.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'Authentication required'}, status=401)
+
+    try:
+        hours = float(request.GET.get('hours', 24))
+        step = int(request.GET.get('step', 60))
+    except (ValueError, TypeError):
+        return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
+    if not 0 < hours <= 24 * 31 or step < 1 or hours * 3600 / step > HISTORY_MAX_POINTS:
+        return JsonResponse({'success': False,
+                             'message': f'hours must be up to 744 and give at most {HISTORY_MAX_POINTS} steps'},
+                            status=400)
+
+    def values(series):
+        return [None if v != v else round(float(v), 1) for v in series]     # NaN → null
+
+    end = timezone.now()
+    start = end - timedelta(hours=hours)
+    if ccu_id is not None:
+        ccu = CentralControlUnit.objects.filter(ccu_id=ccu_id.upper(), user=request.user).first()
+        if not ccu:
+            return JsonResponse({'success': False, 'message': f'CCU {ccu_id} not found'}, status=404)
+        at, current_ma = history.breaker_series(ccu, start, end, step)
+        series = {'ccu_id': ccu.ccu_id, 'current_ma': values(current_ma)}
+    else:
+        outlet = Outlet.objects.filter(device_id=device_id.upper(), user=request.user).first()
+        if not outlet:
+            return JsonResponse({'success': False, 'message': f'Outlet {device_id} not found'}, status=404)
+        at, current_a, current_b = history.outlet_series(outlet, start, end, step)
+        series = {'device_id': outlet.device_id, 'current_a': values(current_a), 'current_b': values(current_b)}
+
+    return JsonResponse({'success': True, 'step': step,
+                         'timestamps': [int(t * 1000) for t in at], **series})
+
+
+@require_http_methods(["GET"])
+def telemetry_samples(request, device_id=None, ccu_id=None):
+    """
+    Every sample of an outlet (or a CCU's main breaker) from its telemetry
+    chunks, including the ones not flushed yet.
+    URL: GET /api/telemetry/<device_id>/?minutes=60
+         GET /api/telemetry/ccu/<ccu_id>/?minutes=60
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'Authentication required'}, status=401)
+    if not telemetry.CHUNKS_ENABLED:
+        return JsonResponse({'success': False, 'message': 'Telemetry chunks are disabled'}, status=404)
+
+    try:
+        minutes = float(request.GET.get('minutes', 60))
+    except (ValueError, TypeError):
+        return JsonResponse({'success': False, 'message': 'Invalid request'}, status=400)
+    if not 0 < minutes <= TELEMETRY_MAX_MINUTES:
+        return JsonResponse({'success': False, 'message': f'minutes must be between 0 and {TELEMETRY_MAX_MINUTES}'},
+                            status=400)
+
+    end = timezone.now()
+    start = end - timedelta(minutes=minutes)
+    if ccu_id is not None:
+        ccu = CentralControlUnit.objects.filter(ccu_id=ccu_id.upper(), user=request.user).first()
+        if not ccu:
+            return JsonResponse({'success': False, 'message': f'CCU {ccu_id} not found'}, status=404)
+        samples = telemetry.breaker_samples(ccu, start, end)
+        target = {'ccu_id': ccu.ccu_id}
+    else:
+        outlet = Outlet.objects.filter(device_id=device_id.upper(), user=request.user).first()
+        if not outlet:
+            return JsonResponse({'success': False, 'message': f'Outlet {device_id} not found'}, status=404)
+        samples = telemetry.outlet_samples(outlet, start, end)
+        target = {'device_id': outlet.device_id}
+
+    return JsonResponse({'success': True, **target, 'timestamps': samples.pop('t').tolist(),
+                         **{name: column.tolist() for name, column in samples.items()}})
+
+
+# ═══════════════════════════════════════════════════════════
+#   INGEST STATS — Idempotency and admission counters (staff only)
+# ═══════════════════════════════════════════════════════════
+
+@staff_member_required
+@require_http_methods(["GET"])
+def ingest_stats(request):
+    """Duplicate / out-of-order delivery and shed-request counters of the CCU ingest (staff only)"""
+    return JsonResponse({
+        'success': True,
+        'idempotency': idempotency.stats(),
+        'admission': admission.stats(),
+    })
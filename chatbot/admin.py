@@ -1,3 +1,14 @@
 from django.contrib import admin
+from .models import Conversation, ChatTurn
 
-# Register your models here.
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'updated_at']
+    search_fields = ['user__username']
+    readonly_fields = ['updated_at']
+
+@admin.register(ChatTurn)
+class ChatTurnAdmin(admin.ModelAdmin):
+    list_display = ['conversation', 'created_at']
+    search_fields = ['conversation__user__username', 'user_message']
+    readonly_fields = ['created_at']
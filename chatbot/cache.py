@@ -0,0 +1,113 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from decouple import config
+
+CACHE_MAX_ENTRIES = config('CHAT_CACHE_MAX_ENTRIES', default=256, cast=int)
+CACHE_TTL_SECONDS = config('CHAT_CACHE_TTL', default=6 * 3600, cast=int)
+
+# Questions about the user's own devices or live readings must reach Gemini
+# with fresh data, so they never share a cached answer.
+LIVE_DATA_PATTERN = re.compile(
+    r"\b(my|mine|i'm|am i|current(ly)?|right now|now|today|tonight|yesterday|"
+    r"this (week|month)|usage|consum\w*|drawing|using|bill|cost|how much)\b"
+)
+
+
+# With conversation history, a question that points back at it ("what about
+# the TV?", "why does it trip?") has no answer of its own to share.
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|it's|that|this|these|those|they|them|their|the other|same|again|"
+    r"above|previous|earlier|before|what about|how about|instead|also|else|more)\b"
+)
+FOLLOW_UP_MAX_WORDS = 3     # "why?", "and socket b?", "explain more" — only make sense in context
+
+
+def normalize_message(message):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    message = re.sub(r'\s+', ' ', message).strip().lower()
+    return message.rstrip('?!. ')
+
+
+def needs_live_data(message):
+    return bool(LIVE_DATA_PATTERN.search(normalize_message(message)))
+
+
+def is_follow_up(message):
+    message = normalize_message(message)
+    return len(message.split()) <= FOLLOW_UP_MAX_WORDS or bool(FOLLOW_UP_PATTERN.search(message))
+
+
+def make_key(message, prompt_hash):
+    return hashlib.sha256(f'{prompt_hash}\x00{normalize_message(message)}'.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU cache of chatbot answers with a time-to-live.
+    Keys should come from make_key() so a prompt change invalidates them.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()   # key → (expires_at, response)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, response = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def set(self, key, response):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypasses': self.bypasses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+response_cache = ResponseCache()
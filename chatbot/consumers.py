@@ -1,8 +1,22 @@
+import asyncio
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
+from .gemini_client import get_gemini_client
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Streams Gemini answers over the socket as they are generated.
+
+    Client → server:  {"message": "..."}  or  {"type": "cancel"}
+    Server → client:  start, chunk {message}, done, cancelled, error {message}
+    """
     async def connect(self):
+        self.user = self.scope.get('user')
+        self.stream_task = None
+        if not self.user or not self.user.is_authenticated:
+            await self.close()
+            return
+
         await self.accept()
         await self.send(text_data=json.dumps({
             'type': 'connection',
@@ -10,15 +24,49 @@ class ChatConsumer(AsyncWebsocketConsumer):
         }))
     
     async def disconnect(self, close_code):
-        pass
+        # Stop generating for a reader that is gone
+        if self.stream_task and not self.stream_task.done():
+            self.stream_task.cancel()
     
     async def receive(self, text_data):
-        """Receive message from WebSocket (optional for real-time chat)"""
+        """Start streaming a reply (runs as a task so cancel/disconnect are handled meanwhile)"""
         data = json.loads(text_data)
-        message = data.get('message', '')
-        
-        # Echo back for now (can be enhanced later)
-        await self.send(text_data=json.dumps({
-            'type': 'message',
-            'message': f'Received: {message}'
-        }))
\ No newline at end of file
+
+        if data.get('type') == 'cancel':
+            if self.stream_task and not self.stream_task.done():
+                self.stream_task.cancel()
+                await self.send_json_message('cancelled')
+            return
+
+        message = data.get('message', '').strip()
+        if not message:
+            await self.send_json_message('error', 'No message provided')
+            return
+        if self.stream_task and not self.stream_task.done():
+            await self.send_json_message('error', 'Please wait for the current answer to finish')
+            return
+
+        self.stream_task = asyncio.create_task(self.stream_reply(message))
+
+    async def stream_reply(self, message):
+        try:
+            gemini = get_gemini_client()
+        except ValueError as e:
+            # API key not configured
+            await self.send_json_message('error', str(e))
+            return
+
+        await self.send_json_message('start')
+        try:
+            async for text in gemini.astream_response(message, user=self.user):
+                await self.send_json_message('chunk', text)
+        except Exception as e:
+            await self.send_json_message('error', gemini.error_message(e))
+            return
+        await self.send_json_message('done')
+
+    async def send_json_message(self, msg_type, message=None):
+        payload = {'type': msg_type}
+        if message is not None:
+            payload['message'] = message
+        await self.send(text_data=json.dumps(payload))
@@ -1,17 +1,94 @@
+import asyncio
+import hashlib
+import threading
+import time
+import weakref
+
 import google.generativeai as genai
+from asgiref.sync import sync_to_async
 from decouple import config
 from pathlib import Path
+from outlets import usage
+from . import memory
+from .cache import is_follow_up, make_key, needs_live_data, normalize_message, response_cache
+
+# Upstream limits. The free tier allows ~15 requests/minute for the whole key,
+# so calls are capped process-wide and paced per user.
+MAX_CONCURRENT_REQUESTS = config('GEMINI_MAX_CONCURRENCY', default=4, cast=int)
+USER_RATE_PER_MINUTE = config('GEMINI_USER_RATE_PER_MINUTE', default=6, cast=float)
+USER_BURST = config('GEMINI_USER_BURST', default=3, cast=int)
+RATE_LIMIT_RETRIES = 2
+# Idle (refilled) per-user buckets are dropped once there are this many
+MAX_BUCKETS = 4096
+
+# Hard cap on the live usage summary injected into the prompt
+CONTEXT_MAX_TOKENS = config('CHAT_CONTEXT_MAX_TOKENS', default=300, cast=int)
+# Budget for the whole prompt; conversation history gets whatever is left
+PROMPT_MAX_TOKENS = config('CHAT_PROMPT_MAX_TOKENS', default=2500, cast=int)
+
+RATE_LIMIT_MESSAGE = ("⏳ **Rate limit reached!** The free tier allows a limited number of requests per minute.\n\n"
+                      "Please wait **~60 seconds** and try again. This is a Google API limit, not a bug.\n\n"
+                      "💡 *Tip: The free tier allows ~15 requests/minute and ~1,500 requests/day.*")
+
+
+class TokenBucket:
+    """
+    Per-user pacing. reserve() always grants a token and returns how long the
+    caller must wait for it, so bursts are queued in arrival order instead of
+    being rejected.
+    """
+
+    def __init__(self, rate_per_second, burst):
+        self.rate = rate_per_second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def is_full(self, now):
+        """Refilled to the burst — dropping it changes nothing for the user."""
+        with self._lock:
+            return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class _LoopState:
+    """
+    asyncio primitives are bound to one event loop, so they are kept per loop.
+    In practice there are two: the server's, and the one get_response() runs
+    every sync call on.
+    """
+
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self.in_flight = {}         # (user pk or None, message) → (task, pks of the users asking)
+        self.folding = set()        # user ids with a summary update running
+        self.background = set()     # strong refs so fold tasks are not collected
+
 
 class GeminiClient:
     def __init__(self):
         api_key = config('GEMINI_API_KEY', default='')
         if not api_key or api_key == 'your_gemini_api_key_here':
             raise ValueError("Gemini API key not configured. Please set GEMINI_API_KEY in your .env file.")
-        
+
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel('gemini-2.5-flash')
         self.system_prompt = self._load_system_prompt()
-    
+        self.prompt_hash = hashlib.sha256(self.system_prompt.encode('utf-8')).hexdigest()[:16]
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._loop_states = weakref.WeakKeyDictionary()
+        self._sync_loop = None
+        self._sync_loop_lock = threading.Lock()
+
     def _load_system_prompt(self):
         """Load system prompt from the prompts directory"""
         prompt_path = Path(__file__).parent / 'prompts' / 'system_prompt.txt'
@@ -20,27 +97,248 @@ class GeminiClient:
                 return f.read()
         except FileNotFoundError:
             return "You are a helpful assistant for a smart outlet monitoring system."
-    
-    def get_response(self, user_message, user=None):
+
+    def build_prompt(self, user_message, context=None, history=None):
         """
-        Get AI response from Gemini based on user message and system prompt
+        Build the full prompt with system instructions, optional live data and
+        conversation history. History is trimmed so the prompt stays within
+        PROMPT_MAX_TOKENS.
         """
-        # Build the full prompt with system instructions
-        prompt = f"""{self.system_prompt}
+        live_data = ''
+        if context:
+            live_data = f"""Live data for this user's devices (use it for questions about their current usage):
+{context}
+
+---
+
+"""
+        conversation = ''
+        if history:
+            budget = PROMPT_MAX_TOKENS - 50 - sum(
+                memory.estimate_tokens(part) for part in (self.system_prompt, live_data, user_message)
+            )
+            history = memory.fit_history(history, budget)
+            if history:
+                conversation = f"""{memory.format_history(history)}
+
+---
+
+"""
+        return f"""{self.system_prompt}
 
 ---
 
-User: {user_message}
+{live_data}{conversation}User: {user_message}
 
 Please respond helpfully based on the instructions above."""
-        
+
+    @staticmethod
+    def error_message(exc):
+        """User-facing text for a failed Gemini call."""
+        error_msg = str(exc)
+        if '429' in error_msg:
+            return RATE_LIMIT_MESSAGE
+        return f"Sorry, I encountered an error: {error_msg}"
+
+    def live_context(self, user_message, user):
+        """The user's precomputed usage summary, for questions that need live data."""
+        if user is None or not user.is_authenticated or not needs_live_data(user_message):
+            return None
+        return usage.render_context(user, max_tokens=CONTEXT_MAX_TOKENS)
+
+    def user_state(self, user_message, user):
+        """(live context, conversation history) for this message."""
+        return self.live_context(user_message, user), memory.load_history(user)
+
+    def get_response(self, user_message, user=None):
+        """
+        Get AI response from Gemini based on user message and system prompt.
+        Blocking — async callers should use aget_response(). Sync calls all run
+        on one background event loop, so they share its concurrency limit and
+        in-flight coalescing instead of each getting a fresh loop.
+        """
+        return asyncio.run_coroutine_threadsafe(self.aget_response(user_message, user), self._get_sync_loop()).result()
+
+    def _get_sync_loop(self):
+        with self._sync_loop_lock:
+            if self._sync_loop is None:
+                self._sync_loop = asyncio.new_event_loop()
+                threading.Thread(target=self._sync_loop.run_forever, name='gemini-sync', daemon=True).start()
+            return self._sync_loop
+
+    async def aget_response(self, user_message, user=None):
+        """
+        Async variant of get_response().
+
+        Cached answers are returned immediately. Identical questions already
+        in flight share one upstream call; new calls wait for the user's
+        token bucket, then for a free slot in the process-wide concurrency
+        limit. Successful answers are added to the user's conversation.
+        """
+        context, history = await sync_to_async(self.user_state)(user_message, user)
+        cache_key = self.cache_key(user_message, history)
+        if cache_key:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                await self._remember(user, user_message, cached)
+                return cached
+
+        prompt = self.build_prompt(user_message, context, history)
+
+        state = self._loop_state()
+        # Answers built on one user's live data or history are only shared with that user
+        key = (user.pk if context or history else None, normalize_message(user_message))
+        shared = state.in_flight.get(key)
+        if shared is None:
+            # Only answers built without the user's data or conversation may be shared
+            cacheable = cache_key is not None and not (context or history)
+            task = asyncio.ensure_future(self._generate(prompt, user, state, cache_key, cacheable))
+            shared = state.in_flight[key] = (task, set())
+            task.add_done_callback(lambda _: state.in_flight.pop(key, None))
+        task, askers = shared
+        # A user's repeated question joins the call already running — one turn, not two
+        user_key = getattr(user, 'pk', None)
+        first_ask = user_key not in askers
+        askers.add(user_key)
+
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            # shield: one caller going away must not cancel the shared call
+            text = await asyncio.shield(task)
         except Exception as e:
-            error_msg = str(e)
-            if '429' in error_msg:
-                return ("⏳ **Rate limit reached!** The free tier allows a limited number of requests per minute.\n\n"
-                        "Please wait **~60 seconds** and try again. This is a Google API limit, not a bug.\n\n"
-                        "💡 *Tip: The free tier allows ~15 requests/minute and ~1,500 requests/day.*")
-            return f"Sorry, I encountered an error: {error_msg}"
\ No newline at end of file
+            return self.error_message(e)
+        if first_ask:
+            await self._remember(user, user_message, text)
+        return text
+
+    async def _generate(self, prompt, user, state, cache_key=None, cacheable=False):
+        await self._wait_for_turn(user)
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            try:
+                async with state.semaphore:
+                    response = await self.model.generate_content_async(prompt)
+                text = response.text
+                if cacheable:
+                    response_cache.set(cache_key, text)
+                return text
+            except Exception as e:
+                # Shared-quota 429: back off and retry rather than failing the user
+                if '429' not in str(e) or attempt == RATE_LIMIT_RETRIES:
+                    raise
+                await asyncio.sleep(2 ** (attempt + 1))
+
+    async def astream_response(self, user_message, user=None):
+        """
+        Stream the answer as text chunks while Gemini generates it.
+        Paced and concurrency-limited like aget_response(); cancelling the
+        consuming task releases the slot and abandons the upstream stream.
+        """
+        context, history = await sync_to_async(self.user_state)(user_message, user)
+        cache_key = self.cache_key(user_message, history)
+        if cache_key:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                await self._remember(user, user_message, cached)
+                return
+
+        prompt = self.build_prompt(user_message, context, history)
+        cacheable = cache_key is not None and not (context or history)
+
+        state = self._loop_state()
+        await self._wait_for_turn(user)
+        parts = []
+        async with state.semaphore:
+            response = await self.model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue  # Chunk without text parts (e.g. finish/safety metadata)
+                if text:
+                    parts.append(text)
+                    yield text
+        if parts:
+            text = ''.join(parts)
+            if cacheable:
+                response_cache.set(cache_key, text)
+            await self._remember(user, user_message, text)
+
+    def cache_key(self, user_message, history=None):
+        """
+        Response-cache key, or None when the answer depends on live user data
+        or the question is a follow-up to the conversation so far. Standalone
+        questions are keyed on the message and prompt only, so a user with
+        history can still be answered from the cache; only answers generated
+        without history or live context are stored under the key.
+        """
+        if needs_live_data(user_message) or (history and is_follow_up(user_message)):
+            response_cache.record_bypass()
+            return None
+        return make_key(user_message, self.prompt_hash)
+
+    async def _remember(self, user, user_message, response):
+        """Store the turn, then fold old turns into the summary in the background."""
+        if user is None or not user.is_authenticated:
+            return
+        needs_fold = await sync_to_async(memory.record_turn)(user, user_message, response)
+        state = self._loop_state()
+        if needs_fold and user.pk not in state.folding:
+            state.folding.add(user.pk)
+            task = asyncio.ensure_future(self._fold_history(user))
+            state.background.add(task)
+            task.add_done_callback(state.background.discard)
+            task.add_done_callback(lambda _: state.folding.discard(user.pk))
+
+    async def _fold_history(self, user):
+        conversation, overflow = await sync_to_async(memory.overflow_turns)(user)
+        if not overflow:
+            return
+        prompt = memory.summarization_prompt(conversation.summary, overflow)
+        try:
+            async with self._loop_state().semaphore:
+                response = await self.model.generate_content_async(prompt)
+            summary = response.text.strip()
+        except Exception:
+            return  # Turns stay verbatim; the next answer retries the fold
+        if summary:
+            await sync_to_async(memory.save_summary)(conversation, summary, overflow)
+
+    async def _wait_for_turn(self, user):
+        user_key = getattr(user, 'pk', None)
+        with self._buckets_lock:
+            bucket = self._buckets.get(user_key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_BUCKETS:
+                    now = time.monotonic()
+                    for key in [key for key, idle in self._buckets.items() if idle.is_full(now)]:
+                        del self._buckets[key]
+                bucket = TokenBucket(USER_RATE_PER_MINUTE / 60.0, USER_BURST)
+                self._buckets[user_key] = bucket
+        delay = bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _loop_state(self):
+        loop = asyncio.get_running_loop()
+        state = self._loop_states.get(loop)
+        if state is None:
+            state = _LoopState()
+            self._loop_states[loop] = state
+        return state
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gemini_client():
+    """
+    Process-wide GeminiClient. genai.configure(), the model object and the
+    system prompt are set up once instead of on every message.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GeminiClient()
+    return _client
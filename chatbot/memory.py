@@ -0,0 +1,134 @@
+"""
+Bounded per-user conversation memory for the chatbot.
+
+The last CHAT_HISTORY_TURNS turns are kept verbatim; older turns are folded
+into Conversation.summary by a background summarization call after a reply
+has been sent. fit_history() trims what goes into the prompt to a token
+budget, so prompt size stays flat however long a conversation runs.
+"""
+from datetime import timedelta
+
+from decouple import config
+from django.utils import timezone
+
+from .models import ChatTurn, Conversation
+
+HISTORY_TURNS = config('CHAT_HISTORY_TURNS', default=6, cast=int)
+SESSION_IDLE_MINUTES = config('CHAT_SESSION_IDLE_MINUTES', default=30, cast=int)
+SUMMARY_MAX_TOKENS = config('CHAT_SUMMARY_MAX_TOKENS', default=250, cast=int)
+CHARS_PER_TOKEN = 4  # Rough estimate for English prompt text
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class History:
+    """Rolling summary plus recent (user_message, ai_response) pairs, oldest first."""
+
+    __slots__ = ('summary', 'turns')
+
+    def __init__(self, summary='', turns=()):
+        self.summary = summary
+        self.turns = list(turns)
+
+    def __bool__(self):
+        return bool(self.summary or self.turns)
+
+
+def _is_over(last_turn_at):
+    return timezone.now() - last_turn_at > timedelta(minutes=SESSION_IDLE_MINUTES)
+
+
+def load_history(user):
+    """
+    The user's conversation memory. A conversation idle for longer than
+    CHAT_SESSION_IDLE_MINUTES is treated as over: the next question starts fresh.
+    """
+    if user is None or not user.is_authenticated:
+        return History()
+    conversation = Conversation.objects.filter(user=user).first()
+    if conversation is None:
+        return History()
+
+    recent = list(
+        conversation.turns.order_by('-created_at')
+        .values_list('user_message', 'ai_response', 'created_at')[:HISTORY_TURNS]
+    )
+    if not recent or _is_over(recent[0][2]):
+        return History()
+    return History(conversation.summary, [(m, r) for m, r, _ in reversed(recent)])
+
+
+def record_turn(user, user_message, ai_response):
+    """
+    Store a finished turn. If the conversation had gone idle, its summary and
+    turns are dropped first, so the new session does not pick them up again.
+    Returns True when older turns are waiting to be folded.
+    """
+    conversation, _ = Conversation.objects.get_or_create(user=user)
+    last_turn_at = conversation.turns.order_by('-created_at').values_list('created_at', flat=True).first()
+    if last_turn_at is not None and _is_over(last_turn_at):
+        conversation.turns.all().delete()
+        if conversation.summary:
+            conversation.summary = ''
+            conversation.save(update_fields=['summary', 'updated_at'])
+    ChatTurn.objects.create(conversation=conversation, user_message=user_message, ai_response=ai_response)
+    return conversation.turns.count() > HISTORY_TURNS
+
+
+def overflow_turns(user):
+    """(conversation, turns beyond the verbatim window — oldest first)."""
+    conversation = Conversation.objects.get(user=user)
+    turns = list(conversation.turns.all())
+    return conversation, turns[:-HISTORY_TURNS] if len(turns) > HISTORY_TURNS else []
+
+
+def save_summary(conversation, summary, folded_turns):
+    deleted, _ = ChatTurn.objects.filter(pk__in=[turn.pk for turn in folded_turns]).delete()
+    if not deleted:
+        return  # The session was reset while the summary was being written
+    conversation.summary = summary[:SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN]
+    conversation.save(update_fields=['summary', 'updated_at'])
+
+
+def summarization_prompt(previous_summary, turns):
+    transcript = '\n'.join(f'User: {t.user_message}\nAssistant: {t.ai_response}' for t in turns)
+    return f"""Update the running summary of a conversation between a user and a smart outlet assistant.
+Keep facts the assistant may need later (devices, settings, problems, decisions). Drop small talk.
+Write at most {SUMMARY_MAX_TOKENS * 3 // 4} words of plain text.
+
+Current summary:
+{previous_summary or '(none)'}
+
+New messages to fold in:
+{transcript}
+
+Updated summary:"""
+
+
+def fit_history(history, budget_tokens):
+    """Trim history to the budget: oldest verbatim turns go first, then the summary is cut."""
+    if budget_tokens <= 0:
+        return History()
+    summary = history.summary[:SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN]
+    turns = list(history.turns)
+
+    def size():
+        return estimate_tokens(summary) + sum(estimate_tokens(m) + estimate_tokens(r) for m, r in turns)
+
+    while turns and size() > budget_tokens:
+        turns.pop(0)
+    if estimate_tokens(summary) > budget_tokens:
+        summary = summary[:budget_tokens * CHARS_PER_TOKEN]
+    return History(summary, turns)
+
+
+def format_history(history):
+    lines = ['Conversation so far:']
+    if history.summary:
+        lines.append(f'(Summary of earlier messages) {history.summary}')
+    for user_message, ai_response in history.turns:
+        lines.append(f'User: {user_message}')
+        lines.append(f'Assistant: {ai_response}')
+    return '\n'.join(lines)
@@ -1,3 +1,29 @@
 from django.db import models
+from django.contrib.auth.models import User
 
-# Create your models here.
+
+class Conversation(models.Model):
+    """
+    Chatbot memory for one user: the last few turns are kept verbatim
+    (ChatTurn rows) and everything older is folded into `summary`.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='chat_conversation')
+    summary = models.TextField(blank=True, help_text="Rolling summary of turns no longer kept verbatim")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username}'s conversation"
+
+
+class ChatTurn(models.Model):
+    """One user message and the assistant's reply"""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='turns')
+    user_message = models.TextField()
+    ai_response = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.conversation.user.username} @ {self.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
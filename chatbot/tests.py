@@ -1,3 +1,257 @@
-from django.test import TestCase
+import asyncio
+import os
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from . import cache, gemini_client, memory
+from .cache import ResponseCache, is_follow_up, response_cache
+from .gemini_client import GeminiClient, TokenBucket
+from .models import ChatTurn, Conversation
+
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel: records prompts, answers after `delay` seconds."""
+
+    def __init__(self, text='A smart outlet is a socket you can switch remotely.', delay=0.2):
+        self.text = text
+        self.delay = delay
+        self.prompts = []
+        self.running = 0
+        self.max_running = 0
+
+    async def generate_content_async(self, prompt, stream=False):
+        self.prompts.append(prompt)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        return SimpleNamespace(text=self.text)
+
+
+def make_client(**model_options):
+    with mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'test-key'}):
+        client = GeminiClient()
+    client.model = FakeModel(**model_options)
+    return client
+
+
+class TokenBucketTests(TestCase):
+
+    def test_burst_then_paced(self):
+        bucket = TokenBucket(rate_per_second=2.0, burst=3)
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(bucket.reserve(), 0.5, places=2)
+        self.assertAlmostEqual(bucket.reserve(), 1.0, places=2)
+
+    def test_is_full_after_refilling(self):
+        bucket = TokenBucket(rate_per_second=1.0, burst=2)
+        bucket.reserve()
+        now = time.monotonic()
+        self.assertFalse(bucket.is_full(now))
+        self.assertTrue(bucket.is_full(now + 1.0))
+
+
+class GeminiClientTests(TransactionTestCase):
+
+    def setUp(self):
+        response_cache.clear()
+
+    def test_idle_user_buckets_are_pruned(self):
+        client = make_client(delay=0)
+        with mock.patch.object(gemini_client, 'MAX_BUCKETS', 3):
+            for user_pk in range(3):
+                client._buckets[user_pk] = TokenBucket(1.0, 3)
+            client._buckets[1].reserve()    # Still refilling: kept
+            asyncio.run(client._wait_for_turn(SimpleNamespace(pk=99)))
+        self.assertEqual(sorted(client._buckets), [1, 99])
+
+    def test_sync_callers_share_one_loop(self):
+        # Identical questions from sync callers in different threads are coalesced
+        client = make_client(delay=0.3)
+        answers = []
+        threads = [threading.Thread(target=lambda: answers.append(client.get_response('What is a smart outlet?')))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(client.model.prompts), 1)
+        self.assertEqual(answers, [client.model.text] * 3)
+
+    def test_sync_callers_share_the_concurrency_limit(self):
+        client = make_client(delay=0.2)
+        questions = [f'What does fault code {n} mean?' for n in range(4)]
+        with mock.patch.object(gemini_client, 'MAX_CONCURRENT_REQUESTS', 2):
+            # Different (anonymous) users, so per-user pacing does not hold them back
+            threads = [threading.Thread(target=client.get_response,
+                                        args=(q, SimpleNamespace(pk=n, is_authenticated=False)))
+                       for n, q in enumerate(questions)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(client.model.prompts), 4)
+        self.assertEqual(client.model.max_running, 2)
+
+
+class ConversationMemoryTests(TransactionTestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        self.alice = User.objects.create_user('alice', password='secret')
+        self.bob = User.objects.create_user('bob', password='secret')
+
+    async def test_coalesced_question_is_remembered_once(self):
+        client = make_client()
+        question = 'What is a smart outlet?'
+        answers = await asyncio.gather(client.aget_response(question, self.alice),
+                                       client.aget_response(question, self.alice))
+        self.assertEqual(answers, [client.model.text] * 2)
+        self.assertEqual(len(client.model.prompts), 1)
+        self.assertEqual(await ChatTurn.objects.filter(conversation__user=self.alice).acount(), 1)
+
+    async def test_shared_answer_is_remembered_for_every_user(self):
+        client = make_client()
+        question = 'What is a smart outlet?'
+        await asyncio.gather(client.aget_response(question, self.alice), client.aget_response(question, self.bob))
+        self.assertEqual(len(client.model.prompts), 1)
+        self.assertEqual(await ChatTurn.objects.filter(conversation__user=self.alice).acount(), 1)
+        self.assertEqual(await ChatTurn.objects.filter(conversation__user=self.bob).acount(), 1)
+
+
+    async def test_answer_built_on_history_is_not_shared(self):
+        client = make_client(delay=0)
+        question = 'What is a deadband?'
+        await client.aget_response('My fan on outlet FE draws 1.2 A, is that normal?', self.alice)
+        await client.aget_response(question, self.alice)       # Prompt carries Alice's conversation
+        self.assertEqual(response_cache.stats()['entries'], 0)
+        await client.aget_response(question, self.bob)         # Bob has no history: stored
+        self.assertEqual(len(client.model.prompts), 3)
+        self.assertIn('1.2 A', client.model.prompts[1])
+        self.assertNotIn('1.2 A', client.model.prompts[2])
+        self.assertEqual(response_cache.stats()['entries'], 1)
+        await client.aget_response(question, self.alice)       # Reads may still hit
+        self.assertEqual(len(client.model.prompts), 3)
+
+
+class MemoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('carol', password='secret')
+
+    def age_turns(self, minutes):
+        ChatTurn.objects.update(created_at=timezone.now() - timedelta(minutes=minutes))
+
+    def test_history_keeps_the_last_turns_oldest_first(self):
+        for n in range(memory.HISTORY_TURNS + 2):
+            memory.record_turn(self.user, f'question {n}', f'answer {n}')
+        history = memory.load_history(self.user)
+        self.assertEqual(len(history.turns), memory.HISTORY_TURNS)
+        self.assertEqual(history.turns[0], ('question 2', 'answer 2'))
+        self.assertEqual(history.turns[-1][0], f'question {memory.HISTORY_TURNS + 1}')
+
+    def test_record_turn_reports_overflow(self):
+        results = [memory.record_turn(self.user, 'q', 'a') for _ in range(memory.HISTORY_TURNS + 1)]
+        self.assertEqual(results, [False] * memory.HISTORY_TURNS + [True])
+
+    def test_idle_session_starts_fresh_and_stays_fresh(self):
+        memory.record_turn(self.user, 'My fan is outlet FE', 'Noted.')
+        Conversation.objects.filter(user=self.user).update(summary='The user owns a fan on outlet FE.')
+        self.age_turns(memory.SESSION_IDLE_MINUTES + 1)
+
+        self.assertFalse(memory.load_history(self.user))
+        memory.record_turn(self.user, 'What is a deadband?', 'A tolerance band.')
+        # The second message of the new session must not see the old one again
+        history = memory.load_history(self.user)
+        self.assertEqual(history.summary, '')
+        self.assertEqual(history.turns, [('What is a deadband?', 'A tolerance band.')])
+
+    def test_summary_of_a_reset_session_is_discarded(self):
+        for _ in range(memory.HISTORY_TURNS + 1):
+            memory.record_turn(self.user, 'q', 'a')
+        conversation, overflow = memory.overflow_turns(self.user)
+        self.assertEqual(len(overflow), 1)
+        self.age_turns(memory.SESSION_IDLE_MINUTES + 1)
+        memory.record_turn(self.user, 'new question', 'new answer')     # Resets the session
+        memory.save_summary(conversation, 'Summary of the old session', overflow)
+        self.assertEqual(Conversation.objects.get(user=self.user).summary, '')
+
+    def test_fit_history_drops_oldest_turns_first(self):
+        turns = [(f'question {n} ' + 'x' * 80, 'answer ' + 'y' * 80) for n in range(5)]
+        history = memory.History('summary', turns)
+        fitted = memory.fit_history(history, 100)
+        self.assertEqual(fitted.summary, 'summary')
+        self.assertEqual(fitted.turns, turns[-2:])
+
+    def test_fit_history_cuts_the_summary_last(self):
+        history = memory.History('s' * 400, [('q', 'a')])
+        fitted = memory.fit_history(history, 20)
+        self.assertEqual(fitted.turns, [])
+        self.assertEqual(len(fitted.summary), 20 * memory.CHARS_PER_TOKEN)
+        self.assertFalse(memory.fit_history(history, 0))
+
+
+class CacheKeyTests(TestCase):
+
+    def setUp(self):
+        self.client_ = make_client()
+        self.history = memory.History('', [('What is a smart outlet?', 'A socket you can switch remotely.')])
+
+    def test_standalone_question_is_cached_with_or_without_history(self):
+        key = self.client_.cache_key('What is a deadband?')
+        self.assertIsNotNone(key)
+        self.assertEqual(self.client_.cache_key('what is a deadband', self.history), key)
+
+    def test_follow_up_bypasses_the_cache_only_with_history(self):
+        for message in ('Why does it trip?', 'What about the other socket?', 'explain more', 'why?'):
+            with self.subTest(message=message):
+                self.assertTrue(is_follow_up(message))
+                self.assertIsNone(self.client_.cache_key(message, self.history))
+                self.assertIsNotNone(self.client_.cache_key(message))
+
+    def test_live_data_questions_are_never_cached(self):
+        self.assertIsNone(self.client_.cache_key('How much power am I using right now?'))
+        self.assertIsNone(self.client_.cache_key('What is my bill this month?', self.history))
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(cache.time, 'monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_least_recently_used_is_evicted(self):
+        lru = ResponseCache(max_entries=2, ttl_seconds=60)
+        lru.set('a', 'answer a')
+        lru.set('b', 'answer b')
+        self.assertEqual(lru.get('a'), 'answer a')     # 'b' is now the oldest
+        lru.set('c', 'answer c')
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual((lru.get('a'), lru.get('c')), ('answer a', 'answer c'))
+        self.assertEqual(lru.stats()['evictions'], 1)
+
+    def test_entries_expire(self):
+        ttl = ResponseCache(max_entries=2, ttl_seconds=60)
+        ttl.set('a', 'answer a')
+        self.now += 59
+        self.assertEqual(ttl.get('a'), 'answer a')
+        self.now += 1
+        self.assertIsNone(ttl.get('a'))
+        stats = ttl.stats()
+        self.assertEqual((stats['entries'], stats['expirations'], stats['hits'], stats['misses']), (0, 1, 1, 1))
+
+    def test_keys_normalize_the_question_and_follow_the_prompt(self):
+        self.assertEqual(cache.make_key('  What is a   Deadband?? ', 'p1'), cache.make_key('what is a deadband', 'p1'))
+        self.assertNotEqual(cache.make_key('what is a deadband', 'p1'), cache.make_key('what is a deadband', 'p2'))
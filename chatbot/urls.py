@@ -6,4 +6,5 @@ app_name = 'chatbot'
 urlpatterns = [
     path('', views.chat_page, name='chat_page'),
     path('send/', views.send_message, name='send_message'),
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
 ]
\ No newline at end of file
@@ -1,8 +1,10 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
-from .gemini_client import GeminiClient
+from .cache import response_cache
+from .gemini_client import get_gemini_client
 import json
 
 @login_required
@@ -12,8 +14,11 @@ def chat_page(request):
 
 @login_required
 @require_http_methods(["POST"])
-def send_message(request):
-    """Handle chatbot message and return AI response"""
+async def send_message(request):
+    """
+    Handle chatbot message and return AI response.
+    Async so the worker is free while Gemini is generating.
+    """
     try:
         data = json.loads(request.body)
         user_message = data.get('message', '')
@@ -24,9 +29,10 @@ def send_message(request):
                 'message': 'No message provided'
             }, status=400)
         
-        # Initialize Gemini client and get response
-        gemini = GeminiClient()
-        ai_response = gemini.get_response(user_message, user=request.user)
+        # Shared Gemini client — concurrency-limited and paced per user
+        gemini = get_gemini_client()
+        user = await request.auser()
+        ai_response = await gemini.aget_response(user_message, user=user)
         
         return JsonResponse({
             'success': True,
@@ -43,4 +49,13 @@ def send_message(request):
         return JsonResponse({
             'success': False,
             'message': f'An error occurred: {str(e)}'
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+@staff_member_required
+@require_http_methods(["GET"])
+def cache_stats(request):
+    """Response-cache size and hit-rate counters (staff only)"""
+    return JsonResponse({
+        'success': True,
+        'cache': response_cache.stats(),
+    })
@@ -31,7 +31,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'config.middleware.AsyncWhiteNoiseMiddleware',  # WhiteNoise, async-capable
+    'api.capture.CaptureMiddleware',  # CCU traffic capture (only with CAPTURE_ENABLED)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -62,6 +63,22 @@ WSGI_APPLICATION = 'config.wsgi.application'
 ASGI_APPLICATION = 'config.asgi.application'
 
 # Database - PostgreSQL (Supabase)
+#
+# Connection management — opening a TLS connection to Supabase costs far more
+# than the ingest queries themselves, so production should reuse them:
+#   DB_POOL          Use psycopg 3's native pool (one pool per worker, sized by
+#                    DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE). The production path.
+#   DB_CONN_MAX_AGE  Keep each thread's connection open this many seconds.
+#                    Leave at 0 under Daphne: every sync_to_async worker thread
+#                    would hold its own connection open (Django advises against
+#                    persistent connections under ASGI).
+#   DB_PGBOUNCER     Set when DB_HOST is a transaction-mode pooler (Supabase
+#                    pooler on port 6543): disables server-side cursors.
+#                    Prepared statements are already off under psycopg 3.
+# `python manage.py bench_db_connections` measures the connection setup cost.
+DB_POOL = config('DB_POOL', default=False, cast=bool)
+DB_PGBOUNCER = config('DB_PGBOUNCER', default=False, cast=bool)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -70,9 +87,22 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': config('DB_PORT', default=5432, cast=int),
+        # Pooled connections are returned to the pool per request, so Django's
+        # own persistence must be off when DB_POOL is enabled.
+        'CONN_MAX_AGE': 0 if DB_POOL else config('DB_CONN_MAX_AGE', default=0, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
+        'OPTIONS': {},
     }
 }
 
+if DB_POOL:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+        'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+        'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+    }
+
 # Django Channels Configuration — In-memory for dev (no Redis needed)
 CHANNEL_LAYERS = {
     'default': {
@@ -113,4 +143,28 @@ LOGIN_REDIRECT_URL = 'outlets:home'
 LOGOUT_REDIRECT_URL = 'outlets:login'
 
 # Google Sheets Export API Key
-SHEETS_API_KEY = config('SHEETS_API_KEY', default='')
\ No newline at end of file
+SHEETS_API_KEY = config('SHEETS_API_KEY', default='')
+
+# Real-time path tracing (CCU POST → WebSocket frame). When enabled, spans
+# are appended to TRACE_FILE as OTLP/JSON lines; summarize with
+# `python manage.py trace_report`.
+TRACE_ENABLED = config('TRACE_ENABLED', default=False, cast=bool)
+TRACE_FILE = config('TRACE_FILE', default=str(BASE_DIR / 'traces.jsonl'))
+
+# CCU traffic capture (api/capture.py). When enabled, every CCU request is
+# appended to rotating gzip JSON-lines files in CAPTURE_DIR; re-drive them
+# with `python manage.py replay_capture`.
+CAPTURE_ENABLED = config('CAPTURE_ENABLED', default=False, cast=bool)
+CAPTURE_DIR = config('CAPTURE_DIR', default=str(BASE_DIR / 'captures'))
+CAPTURE_MAX_MB = config('CAPTURE_MAX_MB', default=20, cast=float)
+CAPTURE_KEEP_FILES = config('CAPTURE_KEEP_FILES', default=10, cast=int)
+
+# Bill estimates (/api/bill-estimate/) — rates per kWh, see outlets/billing.py for the format
+BILLING_CURRENCY = config('BILLING_CURRENCY', default='PHP')
+BILLING_FLAT_RATE = config('BILLING_FLAT_RATE', default=12.0, cast=float)
+BILLING_TARIFFS = [
+    {'name': 'Flat rate', 'type': 'flat', 'rate': BILLING_FLAT_RATE},
+    {'name': 'Time of use', 'type': 'tou', 'rate': round(BILLING_FLAT_RATE * 0.8, 2),
+     'periods': [{'rate': round(BILLING_FLAT_RATE * 1.3, 2), 'start_hour': 8, 'end_hour': 21,
+                  'days': [0, 1, 2, 3, 4]}]},
+]
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Outlet, SensorData, OutletSchedule, Alert, UserProfile, PendingCommand, MainBreakerReading, CentralControlUnit
+from .models import Outlet, SensorData, OutletSchedule, Alert, UserProfile, PendingCommand, MainBreakerReading, CentralControlUnit, EnergyRollup, TelemetryChunk
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -9,15 +9,15 @@ class UserProfileAdmin(admin.ModelAdmin):
 
 @admin.register(CentralControlUnit)
 class CentralControlUnitAdmin(admin.ModelAdmin):
-    list_display = ['ccu_id', 'name', 'user', 'location', 'created_at']
+    list_display = ['ccu_id', 'name', 'user', 'location', 'nominal_voltage', 'power_factor', 'history_mode', 'created_at']
     list_filter = ['user', 'created_at']
     search_fields = ['ccu_id', 'name', 'user__username']
     readonly_fields = ['created_at']
 
 @admin.register(Outlet)
 class OutletAdmin(admin.ModelAdmin):
-    list_display = ['name', 'device_id', 'user', 'location', 'relay_a', 'relay_b', 'threshold', 'created_at']
-    list_filter = ['relay_a', 'relay_b', 'created_at']
+    list_display = ['name', 'device_id', 'user', 'location', 'relay_a', 'relay_b', 'threshold', 'shed_priority', 'history_mode', 'created_at']
+    list_filter = ['relay_a', 'relay_b', 'history_mode', 'created_at']
     search_fields = ['name', 'device_id', 'location']
     readonly_fields = ['created_at', 'updated_at']
 
@@ -37,7 +37,7 @@ class OutletScheduleAdmin(admin.ModelAdmin):
 
 @admin.register(Alert)
 class AlertAdmin(admin.ModelAdmin):
-    list_display = ['outlet', 'alert_type', 'is_read', 'created_at']
+    list_display = ['outlet', 'ccu', 'alert_type', 'is_read', 'created_at']
     list_filter = ['alert_type', 'is_read', 'created_at']
     search_fields = ['outlet__name', 'message']
     readonly_fields = ['created_at']
@@ -55,4 +55,21 @@ class MainBreakerReadingAdmin(admin.ModelAdmin):
     list_filter = ['ccu_id', 'timestamp']
     search_fields = ['ccu_id']
     readonly_fields = ['timestamp']
-    date_hierarchy = 'timestamp'
\ No newline at end of file
+    date_hierarchy = 'timestamp'
+
+@admin.register(EnergyRollup)
+class EnergyRollupAdmin(admin.ModelAdmin):
+    list_display = ['bucket_start', 'period', 'outlet', 'ccu', 'channel', 'energy_wh', 'samples']
+    list_filter = ['period', 'channel', 'bucket_start']
+    search_fields = ['outlet__name', 'outlet__device_id', 'ccu__ccu_id']
+    readonly_fields = ['updated_at']
+    date_hierarchy = 'bucket_start'
+
+@admin.register(TelemetryChunk)
+class TelemetryChunkAdmin(admin.ModelAdmin):
+    list_display = ['window_start', 'outlet', 'ccu', 'count', 'encoding', 'updated_at']
+    list_filter = ['encoding', 'window_start']
+    search_fields = ['outlet__name', 'outlet__device_id', 'ccu__ccu_id']
+    readonly_fields = ['updated_at']
+    exclude = ['data']
+    date_hierarchy = 'window_start'
@@ -0,0 +1,133 @@
+"""
+Streaming anomaly detection on per-socket and main breaker current.
+
+Each channel (outlet socket A/B, CCU main breaker) keeps an exponentially
+weighted mean and variance in memory and is checked in O(1) per sample:
+
+  anomaly       draw far above the channel's usual level (z-score)
+  stuck_sensor  the same non-zero reading for STUCK_SECONDS
+  sudden_drop   a socket's load falls from an established level to the noise
+                floor for DROP_CONFIRM_SAMPLES readings in a row although the
+                server believes its relay is on (e.g. a device failed or its
+                fuse blew)
+
+The relay state is the server's own (it is set when a command is sent; the
+CCU does not report it reliably), and current alone cannot tell a failure
+from an appliance switched off at its own switch. The drop check therefore
+waits for a sustained, complete loss of load instead of a single low sample.
+
+Nothing is read from the database; the ingest views create the Alert rows
+for whatever check_*() returns. State is process-local and re-learns after
+a restart (WARMUP_SAMPLES samples before z-scores are trusted).
+"""
+import math
+import threading
+
+from decouple import config
+
+OVERLOAD_SENTINEL = 65535
+ALPHA = 0.05                # EWMA weight — roughly the last ~40 samples
+WARMUP_SAMPLES = 30
+Z_THRESHOLD = config('ANOMALY_Z_THRESHOLD', default=4.0, cast=float)
+MIN_STD_MA = 50             # Variance floor so a flat history is not hair-trigger
+MIN_ANOMALY_MA = 300        # Ignore "spikes" that are still tiny loads
+STUCK_SECONDS = config('ANOMALY_STUCK_SECONDS', default=600, cast=float)
+DROP_MIN_MA = 500
+DROP_CONFIRM_SAMPLES = 3
+COOLDOWN_SECONDS = config('ANOMALY_COOLDOWN_SECONDS', default=600, cast=float)
+
+
+class _Channel:
+    __slots__ = ('mean', 'var', 'samples', 'low', 'last_value', 'same_since', 'last_alert')
+
+    def __init__(self):
+        self.mean = 0.0
+        self.var = 0.0
+        self.samples = 0
+        self.low = 0            # Consecutive samples at the noise floor after an established level
+        self.last_value = None
+        self.same_since = None
+        self.last_alert = {}    # alert_type → timestamp
+
+
+_channels = {}
+_lock = threading.Lock()
+
+
+def _check(key, value, timestamp, drop_floor=None):
+    """
+    Update one channel with a sample; returns [(alert_type, usual_level_ma)] to raise.
+    drop_floor: the channel's noise floor if sudden drops are checked, else None.
+    """
+    found = []
+    with _lock:
+        ch = _channels.get(key)
+        if ch is None:
+            ch = _channels[key] = _Channel()
+
+        if value == OVERLOAD_SENTINEL:
+            ch.last_value = None    # Overload has its own alert; restart stuck tracking
+            return found
+
+        dropping = False
+        if ch.samples >= WARMUP_SAMPLES:
+            std = max(math.sqrt(ch.var), MIN_STD_MA)
+            if value >= MIN_ANOMALY_MA and (value - ch.mean) / std > Z_THRESHOLD:
+                found.append('anomaly')
+            dropping = drop_floor is not None and ch.mean >= DROP_MIN_MA and value <= drop_floor
+        ch.low = ch.low + 1 if dropping else 0
+        if ch.low >= DROP_CONFIRM_SAMPLES:
+            found.append('sudden_drop')
+
+        if value > 0 and value == ch.last_value:
+            if (timestamp - ch.same_since).total_seconds() >= STUCK_SECONDS:
+                found.append('stuck_sensor')
+        else:
+            ch.same_since = timestamp
+        ch.last_value = value
+
+        usual = ch.mean
+        # A drop is a level change, not noise: restart learning at the new level
+        if 'sudden_drop' in found:
+            ch.mean, ch.var, ch.samples, ch.low = float(value), 0.0, 0, 0
+        elif not dropping:     # An unconfirmed drop keeps the established level to compare against
+            diff = value - ch.mean if ch.samples else 0.0
+            ch.mean = value if not ch.samples else ch.mean + ALPHA * diff
+            ch.var = (1 - ALPHA) * (ch.var + ALPHA * diff * diff)
+            ch.samples += 1
+
+        raised = []
+        for alert_type in found:
+            last = ch.last_alert.get(alert_type)
+            if last is None or (timestamp - last).total_seconds() >= COOLDOWN_SECONDS:
+                ch.last_alert[alert_type] = timestamp
+                raised.append((alert_type, usual))
+        return raised
+
+
+def _message(alert_type, where, value, mean):
+    if alert_type == 'anomaly':
+        return f'Abnormal draw on {where}: {value}mA (usual ~{mean:.0f}mA)'
+    if alert_type == 'stuck_sensor':
+        return f'Sensor on {where} has reported exactly {value}mA for over {STUCK_SECONDS / 60:.0f} min — check the device'
+    return (f'Sudden drop on {where}: no load for {DROP_CONFIRM_SAMPLES} readings (was ~{mean:.0f}mA) '
+            f'while its relay is on — check the device if it was not switched off at its own switch')
+
+
+def check_outlet(outlet, current_a, current_b, timestamp):
+    """[(alert_type, message)] for an outlet reading."""
+    alerts = []
+    for socket, value, relay_on in (('A', current_a, outlet.relay_a), ('B', current_b, outlet.relay_b)):
+        drop_floor = outlet.noise_floor if relay_on else None
+        for alert_type, mean in _check(('outlet', outlet.pk, socket), value, timestamp, drop_floor):
+            alerts.append((alert_type, _message(alert_type, f'{outlet.name} socket {socket}', value, mean)))
+    return alerts
+
+
+def check_breaker(ccu, current_ma, timestamp):
+    """[(alert_type, message)] for a main breaker reading."""
+    # Whole-house drops are normally someone switching things off — not checked
+    return [
+        (alert_type, _message(alert_type, f'main breaker ({ccu.name})', current_ma, mean))
+        for alert_type, mean in _check(('ccu', ccu.pk, 'main'), current_ma, timestamp)
+    ]
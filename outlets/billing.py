@@ -0,0 +1,173 @@
+"""
+Bill estimates and tariff what-ifs for an outlet or a CCU main breaker.
+
+A device's history is reduced to one vector E of 168 kWh values — energy per
+hour of the week (Monday 00:00 = 0). Every tariff is a row of hourly rates,
+so costing any number of tariffs is a single matrix product R @ E.
+
+History comes from EnergyRollup hour buckets where they exist and from
+trapezoidal integration of raw SensorData / MainBreakerReading rows for the
+time before the first bucket.
+
+Tariff format (rates per kWh):
+    {'name': 'Flat', 'type': 'flat', 'rate': 12.0, 'monthly_charge': 0}
+    {'name': 'Time of use', 'type': 'tou', 'rate': 13.5,          # off-peak / default rate
+     'periods': [{'rate': 16.0, 'start_hour': 8, 'end_hour': 21, 'days': [0, 1, 2, 3, 4]}]}
+Periods may wrap midnight (start_hour > end_hour); days are 0=Mon … 6=Sun.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from . import history
+from .energy import DEFAULT_POWER_FACTOR, DEFAULT_VOLTAGE
+from .models import EnergyRollup, MainBreakerReading, SensorData
+
+HOURS_PER_WEEK = 168
+OVERLOAD_SENTINEL = 65535
+# Persisted rows are ~DB_LOG_INTERVAL apart (longer for round-robin polled
+# outlets), or up to the history heartbeat for compressed devices
+# (outlets.history); a longer gap means the device was off
+MAX_GAP_SECONDS = max(300, history.MAX_GAP_SECONDS * 1.5)
+DAYS_PER_MONTH = 30.44
+
+
+class TariffError(ValueError):
+    pass
+
+
+def _rate(value, name):
+    try:
+        rate = float(value)
+    except (TypeError, ValueError):
+        raise TariffError(f'Tariff "{name}": rate must be a number')
+    if rate < 0:
+        raise TariffError(f'Tariff "{name}": rate must not be negative')
+    return rate
+
+
+def tariff_matrix(tariffs):
+    """(T, 168) array of per-kWh rates by hour of week, plus (T,) monthly fixed charges."""
+    if not tariffs:
+        raise TariffError('At least one tariff is required')
+    rates = np.zeros((len(tariffs), HOURS_PER_WEEK))
+    fixed = np.zeros(len(tariffs))
+    hours = np.arange(HOURS_PER_WEEK)
+    day_of, hour_of = hours // 24, hours % 24
+
+    for row, tariff in enumerate(tariffs):
+        name = tariff.get('name') or f'Tariff {row + 1}'
+        kind = tariff.get('type', 'flat')
+        rates[row] = _rate(tariff.get('rate'), name)
+        fixed[row] = _rate(tariff.get('monthly_charge', 0), name)
+        if kind == 'flat':
+            continue
+        if kind != 'tou':
+            raise TariffError(f'Tariff "{name}": unknown type "{kind}" (use flat or tou)')
+        for period in tariff.get('periods', []):
+            start, end = int(period.get('start_hour', 0)), int(period.get('end_hour', 24))
+            if not (0 <= start <= 24 and 0 <= end <= 24):
+                raise TariffError(f'Tariff "{name}": hours must be between 0 and 24')
+            in_hours = (hour_of >= start) & (hour_of < end) if start <= end else (hour_of >= start) | (hour_of < end)
+            in_days = np.isin(day_of, period.get('days', range(7)))
+            rates[row, in_hours & in_days] = _rate(period.get('rate'), name)
+    return rates, fixed
+
+
+def _hour_of_week(epoch_seconds):
+    """Local hour of week for UTC epoch seconds (uses the current UTC offset)."""
+    offset = timezone.localtime().utcoffset().total_seconds()
+    local_hours = ((epoch_seconds + offset) // 3600).astype(np.int64)
+    # 1970-01-01 was a Thursday (weekday 3)
+    return ((local_hours // 24 + 3) % 7) * 24 + local_hours % 24
+
+
+def integrate_samples(epoch_seconds, current_ma, watts_per_ma, max_gap=MAX_GAP_SECONDS):
+    """Trapezoidal kWh per hour-of-week bin for sorted samples."""
+    energy = np.zeros(HOURS_PER_WEEK)
+    if len(epoch_seconds) < 2:
+        return energy
+    dt = np.diff(epoch_seconds)
+    mean_ma = (current_ma[1:] + current_ma[:-1]) / 2.0
+    kwh = np.where((dt > 0) & (dt <= max_gap), mean_ma * watts_per_ma * dt / 3.6e6, 0.0)
+    # Each segment is attributed to the hour it starts in
+    return np.bincount(_hour_of_week(epoch_seconds[:-1]), weights=kwh, minlength=HOURS_PER_WEEK)
+
+
+def _epochs(timestamps):
+    return np.fromiter((ts.timestamp() for ts in timestamps), dtype=np.float64, count=len(timestamps))
+
+
+def _weekly_profile(rollups, raw_rows, watts_per_ma):
+    """
+    (168,) kWh by hour of week from hour rollups, plus raw rows
+    (timestamp, current_ma, ...) for the time before the first rollup.
+    Also returns the earliest time covered (None without any history).
+    """
+    energy = np.zeros(HOURS_PER_WEEK)
+    since = None
+    rows = list(rollups.values_list('bucket_start', 'energy_wh'))
+    if rows:
+        starts, wh = zip(*rows)
+        energy += np.bincount(_hour_of_week(_epochs(starts)), weights=np.asarray(wh) / 1000.0,
+                              minlength=HOURS_PER_WEEK)
+        since = min(starts)
+        raw_rows = raw_rows.filter(timestamp__lt=since)
+
+    raw = list(raw_rows)
+    if raw:
+        columns = np.asarray([row[1:] for row in raw], dtype=np.float64)
+        # Overload sentinel means the relay cut the load
+        currents = np.where(columns == OVERLOAD_SENTINEL, 0.0, columns).sum(axis=1)
+        energy += integrate_samples(_epochs([row[0] for row in raw]), currents, watts_per_ma)
+        since = raw[0][0]
+    return energy, since
+
+
+def outlet_profile(outlet, start, end):
+    ccu = outlet.ccu
+    voltage, power_factor = (ccu.nominal_voltage, ccu.power_factor) if ccu else (DEFAULT_VOLTAGE, DEFAULT_POWER_FACTOR)
+    rollups = EnergyRollup.objects.filter(outlet=outlet, period='hour', bucket_start__gte=start, bucket_start__lt=end)
+    raw = (SensorData.objects.filter(outlet=outlet, timestamp__gte=start, timestamp__lt=end)
+           .order_by('timestamp').values_list('timestamp', 'current_a', 'current_b'))
+    return _weekly_profile(rollups, raw, voltage * power_factor / 1000.0)
+
+
+def ccu_profile(ccu, start, end):
+    rollups = EnergyRollup.objects.filter(ccu=ccu, channel='main', period='hour',
+                                          bucket_start__gte=start, bucket_start__lt=end)
+    raw = (MainBreakerReading.objects.filter(ccu_id=ccu.ccu_id, timestamp__gte=start, timestamp__lt=end)
+           .order_by('timestamp').values_list('timestamp', 'current_ma'))
+    return _weekly_profile(rollups, raw, ccu.nominal_voltage * ccu.power_factor / 1000.0)
+
+
+def estimate(profile, days, tariffs):
+    """
+    Cost of the observed window and a monthly projection under every tariff.
+    profile: (168,) kWh by hour of week observed over `days` days.
+    """
+    rates, fixed = tariff_matrix(tariffs)
+    window_cost = rates @ profile                   # (T,)
+    scale = DAYS_PER_MONTH / days if days else 0.0
+    total_kwh = float(profile.sum())
+    return {
+        'days': round(days, 2),
+        'energy_kwh': round(total_kwh, 3),
+        'monthly_kwh': round(total_kwh * scale, 3),
+        'currency': settings.BILLING_CURRENCY,
+        'tariffs': [
+            {
+                'name': tariff.get('name') or f'Tariff {i + 1}',
+                'window_cost': round(float(window_cost[i]), 2),
+                'monthly_cost': round(float(window_cost[i] * scale + fixed[i]), 2),
+            }
+            for i, tariff in enumerate(tariffs)
+        ],
+    }
+
+
+def window(days):
+    end = timezone.now()
+    return end - timedelta(days=days), end
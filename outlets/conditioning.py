@@ -0,0 +1,135 @@
+"""
+Signal conditioning of raw current readings, per outlet channel and per CCU
+main breaker, before anything else sees them (alerts, history, energy).
+
+Each device's settings (Outlet / CentralControlUnit fields) run in order:
+
+  1. calibration   value × calibration_gain + calibration_offset
+  2. spike_window  median of the last N readings (1 = off) — a single-sample
+                   spike no longer crosses the threshold and raises an alert
+  3. smoothing     EWMA, weight of the new reading (1.0 = off)
+  4. noise_floor   1..noise_floor mA → 0 (PIC sensors idle at ~49-98 mA,
+                   the SCT-013 at ~280 mA)
+
+The defaults only apply the noise floor, as ingest always did. The overload
+sentinel (65535) is passed through untouched and does not enter the
+filters. Live readings keep O(1) state per channel (the last N values and
+the EWMA) in memory; changing a device's settings starts it afresh.
+
+Backfilled readings are history, older than the live state, so a batch is
+conditioned on its own: *_batch() run the same steps over NumPy arrays.
+"""
+import math
+import statistics
+import threading
+from collections import deque
+
+import numpy as np
+
+OVERLOAD_SENTINEL = 65535
+# CentralControlUnit.noise_floor default, for breaker readings of unregistered CCUs
+BREAKER_NOISE_FLOOR_MA = 280
+
+
+class _Channel:
+    """Filter state of one current channel."""
+    __slots__ = ('settings', 'recent', 'ewma')
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.recent = deque(maxlen=settings[2])
+        self.ewma = None
+
+
+_channels = {}      # ('outlet', pk, 'a' / 'b') / ('breaker', ccu_id) → _Channel
+_lock = threading.Lock()
+
+
+def _settings(device):
+    """(gain, offset, spike_window, smoothing, noise_floor) of an Outlet or CCU (None: unregistered CCU)."""
+    if device is None:
+        return 1.0, 0, 1, 1.0, BREAKER_NOISE_FLOOR_MA
+    return (device.calibration_gain, device.calibration_offset, max(1, device.spike_window),
+            min(1.0, max(0.0, device.smoothing)) or 1.0, device.noise_floor)
+
+
+def _floor(value, noise_floor):
+    # Calibration must not turn a reading into the overload sentinel
+    return 0 if value <= noise_floor else min(value, OVERLOAD_SENTINEL - 1)
+
+
+def _step(key, settings, value):
+    if value == OVERLOAD_SENTINEL:
+        return value
+    gain, offset, _, alpha, noise_floor = settings
+    value = max(0.0, value * gain + offset)
+    with _lock:
+        channel = _channels.get(key)
+        if channel is None or channel.settings != settings:
+            channel = _channels[key] = _Channel(settings)
+        channel.recent.append(value)
+        value = statistics.median(channel.recent)
+        channel.ewma = value if channel.ewma is None else channel.ewma + alpha * (value - channel.ewma)
+        value = channel.ewma
+    return _floor(int(round(value)), noise_floor)
+
+
+def outlet_reading(outlet, current_a, current_b):
+    """Conditioned (current_a, current_b) of a live outlet reading."""
+    settings = _settings(outlet)
+    return (_step(('outlet', outlet.pk, 'a'), settings, current_a),
+            _step(('outlet', outlet.pk, 'b'), settings, current_b))
+
+
+def breaker_reading(ccu_id, ccu, current_ma):
+    """Conditioned live main breaker reading (ccu may be None if unregistered)."""
+    return _step(('breaker', ccu_id), _settings(ccu), current_ma)
+
+
+# ─── Batches (backfill) ───
+
+def _ewma(values, alpha):
+    """EWMA of a float array, seeded with its first value, in closed form per block."""
+    if alpha >= 1 or len(values) < 2:
+        return values
+    decay = 1 - alpha
+    # decay ** -block must stay well inside float64
+    block = max(1, int(150 / -math.log10(decay)))
+    out = np.empty_like(values)
+    previous = values[0]
+    for start in range(0, len(values), block):
+        x = values[start:start + block]
+        k = np.arange(len(x))
+        # y_k = decay^(k+1)·y_prev + alpha·decay^k·Σ_{j≤k} x_j·decay^-j (y_0 = x_0 for the first block)
+        y = decay ** (k + 1) * previous + alpha * decay ** k * np.cumsum(x * decay ** -k)
+        out[start:start + len(x)] = y
+        previous = y[-1]
+    return out
+
+
+def _condition(settings, values):
+    gain, offset, window, alpha, noise_floor = settings
+    values = np.asarray(values, dtype=np.int64)
+    result = values.copy()
+    live = values != OVERLOAD_SENTINEL
+    signal = np.maximum(0.0, values[live] * gain + offset)
+    if window > 1 and len(signal) > 1:
+        # Median of the last `window` readings, fewer at the start like the live filter
+        padded = np.concatenate([np.full(window - 1, np.nan), signal])
+        signal = np.nanmedian(np.lib.stride_tricks.sliding_window_view(padded, window), axis=1)
+    signal = np.rint(_ewma(signal, alpha)).astype(np.int64)
+    signal[signal <= noise_floor] = 0
+    np.minimum(signal, OVERLOAD_SENTINEL - 1, out=signal)
+    result[live] = signal
+    return result
+
+
+def outlet_batch(outlet, current_a, current_b):
+    """Conditioned arrays for a time-ordered batch of an outlet's past readings."""
+    settings = _settings(outlet)
+    return _condition(settings, current_a), _condition(settings, current_b)
+
+
+def breaker_batch(ccu, current_ma):
+    """Conditioned array for a time-ordered batch of past main breaker readings."""
+    return _condition(_settings(ccu), current_ma)
@@ -1,12 +1,17 @@
+import asyncio
 import json
+from datetime import datetime, timezone as dt_timezone
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from api import tracing
+from . import liveness, ringbuffer, sampling
 from .models import Outlet, SensorData
 
 class SensorDataConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.outlet_id = self.scope['url_route']['kwargs']['outlet_id']
         self.room_group_name = f'sensor_{self.outlet_id}'
+        self.viewing = False
         
         # Join room group
         await self.channel_layer.group_add(
@@ -15,6 +20,8 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
         )
         
         await self.accept()
+        sampling.subscribe(self.outlet_id)
+        liveness.bind_loop(asyncio.get_running_loop())
         
         # Send initial data
         initial_data = await self.get_latest_sensor_data()
@@ -24,6 +31,7 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
         }))
     
     async def disconnect(self, close_code):
+        sampling.unsubscribe(self.outlet_id, self.viewing)
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -37,11 +45,25 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
         if data.get('type') == 'toggle_relay':
             socket = data.get('socket', 'a')
             await self.toggle_relay(socket)
+        elif data.get('type') == 'view':
+            # Detail view opened/closed — drives the CCU's sampling plan
+            active = bool(data.get('active'))
+            if active != self.viewing:
+                self.viewing = active
+                sampling.set_viewing(self.outlet_id, active)
     
     async def sensor_update(self, event):
         """Send sensor data to WebSocket"""
+        with tracing.delivery_span('sensor_update', event.get('trace'), group=self.room_group_name):
+            await self.send(text_data=json.dumps({
+                'type': 'sensor_data',
+                'data': event['data']
+            }))
+    
+    async def status_update(self, event):
+        """Send online/offline changes to WebSocket"""
         await self.send(text_data=json.dumps({
-            'type': 'sensor_data',
+            'type': 'device_status',
             'data': event['data']
         }))
     
@@ -49,6 +71,21 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
     def get_latest_sensor_data(self):
         try:
             outlet = Outlet.objects.get(device_id=self.outlet_id)
+            # Recent samples from memory (with the newest as current values);
+            # the last persisted row only when nothing arrived lately
+            history = ringbuffer.outlet_history(outlet.device_id)
+            if history:
+                return {
+                    'outlet_name': outlet.name,
+                    'device_id': outlet.device_id,
+                    'relay_a': outlet.relay_a,
+                    'relay_b': outlet.relay_b,
+                    'current_a': history['current_a'][-1],
+                    'current_b': history['current_b'][-1],
+                    'is_overload': history['is_overload'][-1],
+                    'timestamp': datetime.fromtimestamp(history['t'][-1] / 1000, tz=dt_timezone.utc).isoformat(),
+                    'history': history,
+                }
             latest = outlet.sensor_data.first()
             
             if latest:
@@ -99,6 +136,22 @@ class BreakerDataConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         await self.accept()
+        liveness.bind_loop(asyncio.get_running_loop())
+        
+        # Send the buffered load history (memory only) so the chart starts filled
+        history = ringbuffer.breaker_history(self.ccu_id)
+        if history:
+            current_ma = history['current_ma'][-1]
+            await self.send(text_data=json.dumps({
+                'type': 'initial_data',
+                'data': {
+                    'ccu_id': self.ccu_id,
+                    'current_ma': current_ma,
+                    'current_amps': round(current_ma / 1000.0, 2),
+                    'timestamp': datetime.fromtimestamp(history['t'][-1] / 1000, tz=dt_timezone.utc).isoformat(),
+                    'history': history,
+                }
+            }))
     
     async def disconnect(self, close_code):
         # Leave room group
@@ -112,4 +165,11 @@ class BreakerDataConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps({
             'type': 'sensor_data',
             'data': event['data']
-        }))
\ No newline at end of file
+        }))
+    
+    async def status_update(self, event):
+        """Send CCU online/offline changes to WebSocket"""
+        await self.send(text_data=json.dumps({
+            'type': 'device_status',
+            'data': event['data']
+        }))
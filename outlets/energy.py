@@ -0,0 +1,239 @@
+"""
+Incremental energy (Wh) accumulation per outlet socket and per CCU main breaker.
+
+Every ingest — persisted to SensorData or not — adds the trapezoid between
+the previous and the current sample of each channel:
+
+    Wh += (I_prev + I_now) / 2 · V · PF · Δt
+
+using the CCU's nominal_voltage and power_factor. Segments that cross an
+hour boundary are split at the boundary, so hour and day buckets are exact.
+Gaps longer than MAX_GAP_SECONDS (device offline, server restart) are not
+integrated across; for outlets on a slow sampling tier the limit is their
+sampling.report_window() instead.
+
+Totals accumulate in memory and are flushed into EnergyRollup every
+FLUSH_INTERVAL_SECONDS with F() increments, so answering "how much today"
+is a single-row lookup instead of an integration over raw readings.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from decouple import config
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import sampling
+from .models import EnergyRollup
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_SENTINEL = 65535
+DEFAULT_VOLTAGE = 220.0
+DEFAULT_POWER_FACTOR = 1.0
+# The focused outlet reports every ~2s and the breaker every ~5s, but the other
+# outlets are only polled round-robin every 30s each; a longer silence is an outage
+MAX_GAP_SECONDS = config('ENERGY_MAX_GAP_SECONDS', default=300, cast=float)
+FLUSH_INTERVAL_SECONDS = config('ENERGY_FLUSH_SECONDS', default=60, cast=float)
+
+_last = {}                                  # (owner, channel) → (timestamp, current_ma, max_gap)
+_pending = defaultdict(lambda: [0.0, 0])    # (owner, channel, period, bucket_start) → [wh, samples]
+_last_flush = timezone.now()
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+
+
+def _site(ccu):
+    if ccu is None:
+        return DEFAULT_VOLTAGE, DEFAULT_POWER_FACTOR
+    return ccu.nominal_voltage, ccu.power_factor
+
+
+def _hour_start(ts):
+    return timezone.localtime(ts).replace(minute=0, second=0, microsecond=0)
+
+
+def _day_start(hour_start):
+    return hour_start.replace(hour=0)
+
+
+def _accumulate(owner, channel, current_ma, timestamp, watts_per_ma, max_gap=MAX_GAP_SECONDS):
+    """Add the segment since this channel's previous sample. Caller holds _lock."""
+    if current_ma == OVERLOAD_SENTINEL:
+        current_ma = 0  # Tripped: the relay has cut the load
+    previous = _last.get((owner, channel))
+    _last[(owner, channel)] = (timestamp, current_ma, max_gap)
+    if previous is not None:
+        # The gap may have started under a slower sampling tier than the current one
+        t0, i0, previous_gap = previous
+        _integrate(owner, channel, (t0, i0), current_ma, timestamp, watts_per_ma, max(max_gap, previous_gap))
+
+
+def _integrate(owner, channel, previous, current_ma, timestamp, watts_per_ma, max_gap=MAX_GAP_SECONDS):
+    """Add the segment from previous (timestamp, mA) to this sample. Caller holds _lock."""
+    t0, i0 = previous
+    span = (timestamp - t0).total_seconds()
+    if span <= 0 or span > max_gap:
+        return
+
+    # Walk the segment hour by hour, interpolating the current at each boundary
+    slope = (current_ma - i0) / span
+    start, start_ma = t0, i0
+    while start < timestamp:
+        hour = _hour_start(start)
+        end = min(timestamp, hour + timedelta(hours=1))
+        seconds = (end - start).total_seconds()
+        end_ma = start_ma + slope * seconds
+        wh = (start_ma + end_ma) / 2.0 * watts_per_ma * seconds / 3600.0
+        for period, bucket in (('hour', hour), ('day', _day_start(hour))):
+            entry = _pending[(owner, channel, period, bucket)]
+            entry[0] += wh
+            if end == timestamp:
+                entry[1] += 1
+        start, start_ma = end, end_ma
+
+
+def record_outlet_reading(outlet, current_a, current_b, timestamp):
+    voltage, power_factor = _site(outlet.ccu)
+    watts_per_ma = voltage * power_factor / 1000.0
+    owner = ('outlet', outlet.pk)
+    max_gap = sampling.report_window(outlet.device_id, MAX_GAP_SECONDS)
+    with _lock:
+        _accumulate(owner, 'a', current_a, timestamp, watts_per_ma, max_gap)
+        _accumulate(owner, 'b', current_b, timestamp, watts_per_ma, max_gap)
+    _maybe_flush(timestamp)
+
+
+def record_breaker_reading(ccu, current_ma, timestamp, unaccounted_ma=None):
+    """Main breaker sample; unaccounted_ma (see outlets.reconcile) is accumulated alongside."""
+    if ccu is None:
+        return  # Unregistered CCU — nowhere to attribute the energy
+    voltage, power_factor = _site(ccu)
+    watts_per_ma = voltage * power_factor / 1000.0
+    with _lock:
+        _accumulate(('ccu', ccu.pk), 'main', current_ma, timestamp, watts_per_ma)
+        if unaccounted_ma is not None:
+            _accumulate(('ccu', ccu.pk), 'unaccounted', unaccounted_ma, timestamp, watts_per_ma)
+    _maybe_flush(timestamp)
+
+
+def _backfill(owner, channel, samples, watts_per_ma, max_gap=MAX_GAP_SECONDS):
+    """Integrate past samples [(timestamp, mA)] between themselves — the live chain (_last) is not touched."""
+    with _lock:
+        previous = None
+        for timestamp, current_ma in samples:
+            if current_ma == OVERLOAD_SENTINEL:
+                current_ma = 0
+            if previous is not None:
+                _integrate(owner, channel, previous, current_ma, timestamp, watts_per_ma, max_gap)
+            previous = (timestamp, current_ma)
+    _maybe_flush(timezone.now())
+
+
+def record_outlet_backfill(outlet, samples):
+    """Store-and-forward samples of an outlet: [(timestamp, current_a, current_b)] sorted by time."""
+    voltage, power_factor = _site(outlet.ccu)
+    watts_per_ma = voltage * power_factor / 1000.0
+    max_gap = sampling.report_window(outlet.device_id, MAX_GAP_SECONDS)
+    _backfill(('outlet', outlet.pk), 'a', [(ts, a) for ts, a, _ in samples], watts_per_ma, max_gap)
+    _backfill(('outlet', outlet.pk), 'b', [(ts, b) for ts, _, b in samples], watts_per_ma, max_gap)
+
+
+def record_breaker_backfill(ccu, samples):
+    """Store-and-forward main breaker samples: [(timestamp, current_ma)] sorted by time."""
+    if ccu is None:
+        return
+    voltage, power_factor = _site(ccu)
+    _backfill(('ccu', ccu.pk), 'main', samples, voltage * power_factor / 1000.0)
+
+
+def _maybe_flush(now):
+    if (now - _last_flush).total_seconds() >= FLUSH_INTERVAL_SECONDS:
+        try:
+            flush()
+        except Exception:
+            # The reading itself is stored; the energy stays pending for the next flush
+            logger.exception('Energy flush failed')
+
+
+def _write(owner, channel, period, bucket, wh, samples):
+    kind, pk = owner
+    lookup = {'outlet_id' if kind == 'outlet' else 'ccu_id': pk,
+              'channel': channel, 'period': period, 'bucket_start': bucket}
+    try:
+        with transaction.atomic():
+            updated = EnergyRollup.objects.filter(**lookup).update(
+                energy_wh=F('energy_wh') + wh, samples=F('samples') + samples,
+                updated_at=timezone.now(),
+            )
+            if not updated:
+                EnergyRollup.objects.create(energy_wh=wh, samples=samples, **lookup)
+    except IntegrityError:
+        # Another process created the bucket first
+        EnergyRollup.objects.filter(**lookup).update(
+            energy_wh=F('energy_wh') + wh, samples=F('samples') + samples,
+        )
+
+
+def flush():
+    """
+    Write pending energy into EnergyRollup rows (increment or create). If the
+    database fails midway, the buckets not written yet go back to pending
+    and the error is raised.
+    """
+    global _last_flush
+    if not _flush_lock.acquire(blocking=False):
+        return  # Another request is already flushing
+    try:
+        with _lock:
+            batch = list(_pending.items())
+            _pending.clear()
+            _last_flush = timezone.now()
+
+        written = 0
+        try:
+            for key, (wh, samples) in batch:
+                _write(*key, wh, samples)
+                written += 1
+        except Exception:
+            with _lock:
+                for key, (wh, samples) in batch[written:]:
+                    entry = _pending[key]
+                    entry[0] += wh
+                    entry[1] += samples
+            raise
+    finally:
+        _flush_lock.release()
+
+
+atexit.register(flush)
+
+
+def _pending_wh(owner, channels, period, bucket):
+    with _lock:
+        return sum(_pending[(owner, c, period, bucket)][0] for c in channels
+                   if (owner, c, period, bucket) in _pending)
+
+
+def outlet_energy_wh(outlet, period='day', when=None):
+    """Energy (both sockets) for the hour/day containing `when` — flushed plus pending."""
+    hour = _hour_start(when or timezone.now())
+    bucket = hour if period == 'hour' else _day_start(hour)
+    rows = EnergyRollup.objects.filter(outlet=outlet, period=period, bucket_start=bucket)
+    stored = sum(rows.values_list('energy_wh', flat=True))
+    return stored + _pending_wh(('outlet', outlet.pk), ('a', 'b'), period, bucket)
+
+
+def ccu_energy_wh(ccu, period='day', when=None, channel='main'):
+    """
+    Main breaker (or channel='unaccounted') energy for the hour/day containing
+    `when` — flushed plus pending.
+    """
+    hour = _hour_start(when or timezone.now())
+    bucket = hour if period == 'hour' else _day_start(hour)
+    row = EnergyRollup.objects.filter(ccu=ccu, channel=channel, period=period, bucket_start=bucket).first()
+    return (row.energy_wh if row else 0.0) + _pending_wh(('ccu', ccu.pk), (channel,), period, bucket)
@@ -0,0 +1,285 @@
+"""
+Compression of persisted sensor history (SensorData / MainBreakerReading).
+
+Every reading still goes to the WebSocket and the in-memory aggregators;
+this module decides which readings become rows. The mode is set per device
+(Outlet.history_mode / CentralControlUnit.history_mode):
+
+  interval       one row every DB_LOG_INTERVAL, whatever the signal does
+  deadband       a row when any channel moves more than history_tolerance mA
+                 from the last saved value; the reading just before the
+                 change is saved too so the step lands at the right time.
+                 Read back with sample-and-hold.
+  swinging_door  a row when no straight line from the last saved point
+                 stays within ±history_tolerance of every reading since; the
+                 last reading that still fitted is saved. Read back with
+                 linear interpolation.
+
+In the compressing modes a row is also written at least every
+MAX_GAP_SECONDS (heartbeat, so a silent device is distinguishable from a
+flat one) and for every overload reading. The reading held back between
+rows is process memory; pending ones are written at shutdown.
+"""
+import atexit
+import threading
+from datetime import timedelta
+
+import numpy as np
+from decouple import config
+
+from .models import MainBreakerReading, SensorData
+
+DB_LOG_INTERVAL = timedelta(seconds=60)
+MAX_GAP_SECONDS = config('HISTORY_MAX_GAP_SECONDS', default=300, cast=float)
+
+
+class _Stream:
+    """Compression state of one device: last saved point, held point, door slopes."""
+    __slots__ = ('saved', 'held', 'held_saved', 'upper', 'lower', 'make_row', 'mode')
+
+    def __init__(self, make_row):
+        self.mode = 'interval'
+        self.saved = None       # (timestamp, values) of the last persisted row
+        self.held = None        # (timestamp, values, flag) of the latest reading
+        self.held_saved = True
+        self.upper = []         # per channel: lowest upper slope seen since `saved`
+        self.lower = []         # per channel: highest lower slope seen since `saved`
+        self.make_row = make_row
+
+    def open_door(self, point):
+        self.saved = point[:2]
+        self.upper = [float('inf')] * len(point[1])
+        self.lower = [float('-inf')] * len(point[1])
+
+    def fits(self, timestamp, values, tolerance):
+        """Narrow the door with a reading; False once no line fits every reading."""
+        span = (timestamp - self.saved[0]).total_seconds()
+        if span <= 0:
+            return True
+        fits = True
+        for i, (value, origin) in enumerate(zip(values, self.saved[1])):
+            self.upper[i] = min(self.upper[i], (value + tolerance - origin) / span)
+            self.lower[i] = max(self.lower[i], (value - tolerance - origin) / span)
+            fits = fits and self.lower[i] <= self.upper[i]
+        return fits
+
+
+_streams = {}
+_lock = threading.Lock()
+
+
+def _within(values, saved, tolerance):
+    return all(abs(v - s) <= tolerance for v, s in zip(values, saved))
+
+
+def _compress(stream, mode, tolerance, timestamp, values, flag, force):
+    """Readings of this stream to persist now, as (timestamp, values, flag)."""
+    current = (timestamp, values, flag)
+    points = []
+    stream.mode = mode
+
+    def save(point):
+        points.append(point)
+        stream.open_door(point)
+
+    if mode == 'interval':
+        if stream.saved is None or timestamp - stream.saved[0] >= DB_LOG_INTERVAL:
+            save(current)
+    elif stream.saved is None or force or (timestamp - stream.saved[0]).total_seconds() >= MAX_GAP_SECONDS:
+        # The held reading only matters if the signal moved since the last row
+        if stream.saved is not None and not stream.held_saved and not (
+                _within(values, stream.saved[1], tolerance) if mode == 'deadband'
+                else stream.fits(timestamp, values, tolerance)):
+            save(stream.held)
+        save(current)
+    elif mode == 'deadband':
+        if not _within(values, stream.saved[1], tolerance):
+            if not stream.held_saved:
+                save(stream.held)
+            save(current)
+    elif not stream.fits(timestamp, values, tolerance):
+        # Swinging door: the held reading is the end of the last straight segment
+        save(stream.held)
+        stream.fits(timestamp, values, tolerance)
+
+    stream.held = current
+    stream.held_saved = bool(points) and points[-1] is current
+    return [stream.make_row(*point) for point in points]
+
+
+def _stream(key, make_row, load_last):
+    stream = _streams.get(key)
+    if stream is None:
+        stream = _streams[key] = _Stream(make_row)
+        last = load_last()
+        if last is not None:
+            stream.open_door(last)
+    return stream
+
+
+def outlet_rows(outlet, current_a, current_b, is_overload, timestamp, boot_id=None, seq=None):
+    """Unsaved SensorData rows this reading makes due (usually none or one)."""
+    def make_row(ts, values, flag):
+        overload, boot, number = flag
+        return SensorData(outlet=outlet, timestamp=ts, current_a=values[0], current_b=values[1],
+                          is_overload=overload, boot_id=boot, seq=number)
+
+    def load_last():
+        row = SensorData.objects.filter(outlet=outlet).first()
+        return (row.timestamp, (row.current_a, row.current_b)) if row else None
+
+    with _lock:
+        stream = _stream(('outlet', outlet.pk), make_row, load_last)
+        return _compress(stream, outlet.history_mode, outlet.history_tolerance, timestamp,
+                         (current_a, current_b), (is_overload, boot_id, seq), force=is_overload)
+
+
+def breaker_rows(ccu_id, ccu, current_ma, timestamp, boot_id=None, seq=None):
+    """Unsaved MainBreakerReading rows this reading makes due (ccu may be None if unregistered)."""
+    threshold = ccu.breaker_threshold if ccu else 0
+
+    def make_row(ts, values, flag):
+        return MainBreakerReading(ccu_id=ccu_id, ccu_device=ccu, current_ma=values[0],
+                                  threshold=threshold, timestamp=ts, boot_id=flag[0], seq=flag[1])
+
+    def load_last():
+        row = MainBreakerReading.objects.filter(ccu_id=ccu_id).first()
+        return (row.timestamp, (row.current_ma,)) if row else None
+
+    mode, tolerance = (ccu.history_mode, ccu.history_tolerance) if ccu else ('interval', 0)
+    with _lock:
+        stream = _stream(('breaker', ccu_id), make_row, load_last)
+        return _compress(stream, mode, tolerance, timestamp, (current_ma,), (boot_id, seq),
+                         force=threshold > 0 and current_ma > threshold)
+
+
+def _backfill(mode, tolerance, points, make_row, last, force):
+    """
+    Rows for a batch of past readings [(timestamp, values, flag)], sorted by
+    time, compressed on a stream of their own that starts at `last` (the row
+    before the batch) — the live stream of the device is left alone. The
+    last reading of the batch is always kept, so the gap ends where it ended.
+    """
+    stream = _Stream(make_row)
+    if last is not None:
+        stream.open_door(last)
+    rows = []
+    for timestamp, values, flag in points:
+        rows += _compress(stream, mode, tolerance, timestamp, values, flag, force(values, flag))
+    if stream.held is not None and not stream.held_saved:
+        rows.append(make_row(*stream.held))
+    return rows
+
+
+def backfill_outlet_rows(outlet, boot_id, points):
+    """
+    Unsaved SensorData rows for past readings of an outlet; points are
+    (timestamp, current_a, current_b, is_overload, seq), sorted by time.
+    """
+    if not points:
+        return []
+
+    def make_row(ts, values, flag):
+        return SensorData(outlet=outlet, timestamp=ts, current_a=values[0], current_b=values[1],
+                          is_overload=flag[0], boot_id=boot_id, seq=flag[1])
+
+    row = SensorData.objects.filter(outlet=outlet, timestamp__lt=points[0][0]).first()
+    last = (row.timestamp, (row.current_a, row.current_b)) if row else None
+    return _backfill(outlet.history_mode, outlet.history_tolerance,
+                     [(ts, (a, b), (overload, seq)) for ts, a, b, overload, seq in points],
+                     make_row, last, force=lambda values, flag: flag[0])
+
+
+def backfill_breaker_rows(ccu_id, ccu, boot_id, points):
+    """Unsaved MainBreakerReading rows for past breaker readings; points are (timestamp, current_ma, seq)."""
+    if not points:
+        return []
+    threshold = ccu.breaker_threshold if ccu else 0
+
+    def make_row(ts, values, seq):
+        return MainBreakerReading(ccu_id=ccu_id, ccu_device=ccu, current_ma=values[0], threshold=threshold,
+                                  timestamp=ts, boot_id=boot_id, seq=seq)
+
+    row = MainBreakerReading.objects.filter(ccu_id=ccu_id, timestamp__lt=points[0][0]).first()
+    last = (row.timestamp, (row.current_ma,)) if row else None
+    mode, tolerance = (ccu.history_mode, ccu.history_tolerance) if ccu else ('interval', 0)
+    return _backfill(mode, tolerance, [(ts, (ma,), seq) for ts, ma, seq in points], make_row, last,
+                     force=lambda values, seq: threshold > 0 and values[0] > threshold)
+
+
+def flush():
+    """Persist held readings of the compressing modes that are not saved yet (at shutdown)."""
+    with _lock:
+        # Interval mode drops the readings between rows by design: nothing is held back
+        pending = [s.make_row(*s.held) for s in _streams.values()
+                   if s.mode != 'interval' and s.held is not None and not s.held_saved]
+        for stream in _streams.values():
+            stream.held_saved = True
+    for row in pending:
+        try:
+            row.save()
+        except Exception:
+            pass    # The device may have been deleted meanwhile
+
+
+atexit.register(flush)
+
+
+# ─── Reading history back ───
+
+def reconstruct(times, values, at, mode):
+    """
+    Signal values at epoch seconds `at` from persisted points (`times` sorted):
+    sample-and-hold for deadband, linear otherwise. NaN before the first point,
+    inside gaps longer than the heartbeat (device silent) and more than one
+    heartbeat after the last point; up to then the last value holds.
+    """
+    times, values, at = (np.asarray(x, dtype=np.float64) for x in (times, values, at))
+    result = np.full(at.shape, np.nan)
+    if len(times) == 0:
+        return result
+    right = np.searchsorted(times, at, side='right')
+    left = np.clip(right - 1, 0, len(times) - 1)
+    # Past the last point there is no next one: measure from the last point
+    nxt_time = np.where(right < len(times), times[np.clip(right, 0, len(times) - 1)], at)
+    inside = (right > 0) & (nxt_time - times[left] <= MAX_GAP_SECONDS * 1.5)
+    if mode == 'deadband':
+        result[inside] = values[left[inside]]
+    else:
+        result[inside] = np.interp(at[inside], times, values)
+    return result
+
+
+def _grid(start, end, step_seconds):
+    return np.arange(start.timestamp(), end.timestamp(), step_seconds)
+
+
+def outlet_series(outlet, start, end, step_seconds=60):
+    """(epoch seconds, current_a, current_b) on a regular grid between start and end."""
+    # One point either side so the edges of the window interpolate correctly
+    before = SensorData.objects.filter(outlet=outlet, timestamp__lt=start).values_list('timestamp', 'current_a', 'current_b')[:1]
+    after = (SensorData.objects.filter(outlet=outlet, timestamp__gt=end)
+             .order_by('timestamp').values_list('timestamp', 'current_a', 'current_b')[:1])
+    inside = (SensorData.objects.filter(outlet=outlet, timestamp__gte=start, timestamp__lte=end)
+              .order_by('timestamp').values_list('timestamp', 'current_a', 'current_b'))
+    rows = list(before) + list(inside) + list(after)
+    at = _grid(start, end, step_seconds)
+    if not rows:
+        return at, np.full(at.shape, np.nan), np.full(at.shape, np.nan)
+    times = [ts.timestamp() for ts, _, _ in rows]
+    return (at,
+            reconstruct(times, [a for _, a, _ in rows], at, outlet.history_mode),
+            reconstruct(times, [b for _, _, b in rows], at, outlet.history_mode))
+
+
+def breaker_series(ccu, start, end, step_seconds=60):
+    """(epoch seconds, current_ma) on a regular grid between start and end."""
+    readings = MainBreakerReading.objects.filter(ccu_id=ccu.ccu_id)
+    before = readings.filter(timestamp__lt=start).values_list('timestamp', 'current_ma')[:1]
+    after = readings.filter(timestamp__gt=end).order_by('timestamp').values_list('timestamp', 'current_ma')[:1]
+    inside = readings.filter(timestamp__gte=start, timestamp__lte=end).order_by('timestamp').values_list('timestamp', 'current_ma')
+    rows = list(before) + list(inside) + list(after)
+    at = _grid(start, end, step_seconds)
+    if not rows:
+        return at, np.full(at.shape, np.nan)
+    return at, reconstruct([ts.timestamp() for ts, _ in rows], [ma for _, ma in rows], at, ccu.history_mode)
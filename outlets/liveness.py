@@ -0,0 +1,228 @@
+"""
+Offline detection for CCUs and outlets.
+
+Every ingest refreshes the device's deadline — the time by which its next
+report is due. Deadlines live in a min-heap watched by a single daemon
+thread that sleeps until the earliest one, so the cost per report is O(1)
+and per expiry O(log n), independent of how many devices there are:
+
+  - a report only moves the device's deadline forward; its heap entry is
+    left alone (lazy update)
+  - when an entry comes due the watcher compares it with the device's
+    current deadline: if the device reported meanwhile the entry is pushed
+    back with the new deadline, otherwise the device has gone offline
+
+Going offline creates an 'offline' Alert and a DEVICE_OFFLINE EventLog entry
+and pushes a status_update on the device's WebSocket group; the first
+report afterwards logs DEVICE_ONLINE and pushes the recovery. Outlets whose
+CCU is already offline go offline silently — the CCU alert covers them.
+The watcher is a plain thread, so its pushes are handed to the server's
+event loop (bind_loop, called by the WebSocket consumers) rather than sent
+from a throwaway loop the in-memory channel layer would not wake up for.
+
+The CCU sends breaker readings every ~5s. Outlets are only polled
+round-robin unless focused, so OUTLET_OFFLINE_SECONDS must stay above that
+period; outlets on a slow tier of the sampling plan (outlets.sampling) are
+given sampling.MISSED_REPORTS of their expected intervals instead. State is
+process-local: after a restart a device is tracked again from its first
+report.
+"""
+import asyncio
+import heapq
+import threading
+import time
+
+from channels.layers import get_channel_layer
+from decouple import config
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import sampling, usage
+from .models import Alert, CentralControlUnit, EventLog, Outlet
+
+CCU_OFFLINE_SECONDS = config('CCU_OFFLINE_SECONDS', default=20, cast=float)
+OUTLET_OFFLINE_SECONDS = config('OUTLET_OFFLINE_SECONDS', default=90, cast=float)
+
+
+class _Device:
+    __slots__ = ('pk', 'kind', 'device_id', 'ccu_pk', 'reported', 'deadline', 'last_seen', 'online', 'silent')
+
+    def __init__(self, kind, pk, device_id=None):
+        self.kind = kind        # 'ccu' or 'outlet'
+        self.pk = pk
+        self.device_id = device_id
+        self.ccu_pk = None
+        self.reported = None    # time.monotonic() of the last report
+        self.deadline = None    # time.monotonic() by which the next report is due
+        self.last_seen = None
+        self.online = True
+        self.silent = False     # Went offline with its CCU — no alert raised
+
+
+_devices = {}       # (kind, pk) → _Device
+_heap = []          # (deadline, kind, pk) — at most one entry per device
+_queued = set()     # devices with an entry in _heap
+_wakeup = threading.Condition()
+_watcher = None
+_loop = None        # Event loop the WebSocket consumers run on
+
+
+def bind_loop(loop):
+    """Remember the server's event loop; status pushes are sent on it."""
+    global _loop
+    _loop = loop
+
+
+def _seen(kind, pk, timeout, timestamp, ccu_pk=None, device_id=None):
+    """
+    Refresh a device's deadline. Returns None, or — if the device was offline
+    until now — whether its outage was raised as an alert.
+    """
+    global _watcher
+    reported = time.monotonic()
+    deadline = reported + timeout
+    with _wakeup:
+        device = _devices.get((kind, pk))
+        if device is None:
+            device = _devices[(kind, pk)] = _Device(kind, pk, device_id)
+        device.ccu_pk = ccu_pk
+        device.reported = reported
+        device.deadline = deadline
+        device.last_seen = timestamp
+        recovered = None if device.online else not device.silent
+        device.online = True
+        if (kind, pk) not in _queued:
+            _queued.add((kind, pk))
+            heapq.heappush(_heap, (deadline, kind, pk))
+            if _heap[0][1:] == (kind, pk):
+                _wakeup.notify()    # New earliest deadline
+        if _watcher is None:
+            _watcher = threading.Thread(target=_watch, name='liveness', daemon=True)
+            _watcher.start()
+    return recovered
+
+
+def ccu_seen(ccu, timestamp):
+    if ccu is None:
+        return
+    alerted = _seen('ccu', ccu.pk, CCU_OFFLINE_SECONDS, timestamp)
+    if alerted is not None:
+        _announce(ccu=ccu, online=True, timestamp=timestamp, alert=alerted)
+
+
+def outlet_seen(outlet, timestamp):
+    alerted = _seen('outlet', outlet.pk, OUTLET_OFFLINE_SECONDS, timestamp, outlet.ccu_id, outlet.device_id)
+    if alerted is not None:
+        _announce(outlet=outlet, online=True, timestamp=timestamp, alert=alerted)
+
+
+def is_online(kind, pk):
+    """True/False for a tracked device, None if it has not reported since startup."""
+    with _wakeup:
+        device = _devices.get((kind, pk))
+        return device.online if device else None
+
+
+def _deadline(device):
+    """The device's deadline, stretched if its sampling tier asks for slower reports."""
+    if device.kind != 'outlet':
+        return device.deadline
+    return device.reported + sampling.report_window(device.device_id, OUTLET_OFFLINE_SECONDS)
+
+
+def _due():
+    """Wait for the next expired deadline; returns the devices that went offline."""
+    with _wakeup:
+        while True:
+            if not _heap:
+                _wakeup.wait()
+                continue
+            deadline, kind, pk = _heap[0]
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                _wakeup.wait(delay)
+                continue
+
+            expired = []
+            now = time.monotonic()
+            while _heap and _heap[0][0] <= now:
+                _, kind, pk = heapq.heappop(_heap)
+                device = _devices[(kind, pk)]
+                deadline = _deadline(device)
+                if deadline > now:
+                    heapq.heappush(_heap, (deadline, kind, pk))     # Reported meanwhile, or slower tier
+                else:
+                    _queued.discard((kind, pk))
+                    device.online = False
+                    device.silent = False
+                    expired.append(device)
+            if expired:
+                return expired
+
+
+def _watch():
+    while True:
+        for device in sorted(_due(), key=lambda d: d.kind):    # CCUs before outlets
+            try:
+                _went_offline(device)
+            except Exception:
+                pass    # Never let one failed write stop the watcher
+        close_old_connections()
+
+
+def _went_offline(device):
+    with _wakeup:
+        if device.online:
+            return  # Reported again before we got here
+    if device.kind == 'ccu':
+        ccu = CentralControlUnit.objects.filter(pk=device.pk).first()
+        if ccu is None:
+            return
+        _announce(ccu=ccu, online=False, timestamp=device.last_seen)
+        return
+
+    outlet = Outlet.objects.select_related('ccu').filter(pk=device.pk).first()
+    if outlet is None:
+        return
+    with _wakeup:
+        ccu_device = _devices.get(('ccu', device.ccu_pk))
+        device.silent = ccu_device is not None and not ccu_device.online
+    _announce(outlet=outlet, online=False, timestamp=device.last_seen, alert=not device.silent)
+
+
+def _announce(outlet=None, ccu=None, online=True, timestamp=None, alert=True):
+    """Alert / EventLog / WebSocket side of a status change."""
+    owner = outlet or ccu
+    where = outlet.name if outlet else f'{ccu.name} (CCU {ccu.ccu_id})'
+    last_seen = timezone.localtime(timestamp).strftime('%H:%M:%S') if timestamp else 'unknown'
+
+    if not online and alert:
+        message = f'{where} stopped reporting (last seen {last_seen})'
+        Alert.objects.create(outlet=outlet, ccu=ccu, alert_type='offline', message=message)
+        usage.record_alert(outlet, 'offline', timezone.now(), ccu=ccu)
+    if alert:
+        EventLog.objects.create(
+            user_id=owner.user_id,
+            source='SERVER',
+            action_type='DEVICE_ONLINE' if online else 'DEVICE_OFFLINE',
+            target_device=f'0x{outlet.device_id}' if outlet else f'CCU {ccu.ccu_id}',
+            details=f'{where} is reporting again' if online else f'{where} stopped reporting (last seen {last_seen})',
+        )
+
+    loop = _loop
+    if loop is None or loop.is_closed():
+        return  # No WebSocket has connected since startup — nobody to tell
+    try:
+        asyncio.run_coroutine_threadsafe(get_channel_layer().group_send(
+            f'sensor_{outlet.device_id}' if outlet else f'sensor_breaker_{ccu.ccu_id}',
+            {
+                'type': 'status_update',
+                'data': {
+                    'device_id': outlet.device_id if outlet else ccu.ccu_id,
+                    'online': online,
+                    'last_seen': timestamp.isoformat() if timestamp else None,
+                },
+            }
+        ), loop)
+    except Exception:
+        pass  # WebSocket push is best-effort
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.9 on 2026-10-19 07:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outlets', '0012_centralcontrolunit_breaker_threshold'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='centralcontrolunit',
+            name='nominal_voltage',
+            field=models.FloatField(default=220.0, help_text='Site mains voltage (V) used for energy estimates'),
+        ),
+        migrations.AddField(
+            model_name='centralcontrolunit',
+            name='power_factor',
+            field=models.FloatField(default=1.0, help_text='Assumed load power factor (0-1) used for energy estimates'),
+        ),
+        migrations.CreateModel(
+            name='EnergyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(choices=[('a', 'Socket A'), ('b', 'Socket B'), ('main', 'Main Breaker')], max_length=10)),
+                ('period', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField(help_text='Start of the hour/day (local time) this bucket covers')),
+                ('energy_wh', models.FloatField(default=0.0, help_text='Accumulated energy in Wh')),
+                ('samples', models.IntegerField(default=0, help_text='Readings integrated into this bucket')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('ccu', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='energy_rollups', to='outlets.centralcontrolunit')),
+                ('outlet', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='energy_rollups', to='outlets.outlet')),
+            ],
+            options={
+                'ordering': ['-bucket_start'],
+                'indexes': [models.Index(fields=['outlet', 'period', '-bucket_start'], name='outlets_ene_outlet__87fb8c_idx'), models.Index(fields=['ccu', 'period', '-bucket_start'], name='outlets_ene_ccu_id_457bd9_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('outlet__isnull', False)), fields=('outlet', 'channel', 'period', 'bucket_start'), name='unique_outlet_energy_bucket'), models.UniqueConstraint(condition=models.Q(('ccu__isnull', False)), fields=('ccu', 'channel', 'period', 'bucket_start'), name='unique_ccu_energy_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-19 07:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outlets', '0013_energy_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='ccu',
+            field=models.ForeignKey(blank=True, help_text='Set instead of outlet for main breaker alerts', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='outlets.centralcontrolunit'),
+        ),
+        migrations.AlterField(
+            model_name='alert',
+            name='alert_type',
+            field=models.CharField(choices=[('overload', 'Overload Trip'), ('threshold', 'Threshold Exceeded'), ('offline', 'Device Offline'), ('anomaly', 'Abnormal Draw'), ('stuck_sensor', 'Stuck Sensor'), ('sudden_drop', 'Sudden Drop')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='alert',
+            name='outlet',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='outlets.outlet'),
+        ),
+    ]
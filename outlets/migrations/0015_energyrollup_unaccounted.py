@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outlets', '0014_alert_anomaly_types'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='energyrollup',
+            name='channel',
+            field=models.CharField(choices=[('a', 'Socket A'), ('b', 'Socket B'), ('main', 'Main Breaker'), ('unaccounted', 'Unaccounted Load')], max_length=12),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outlets', '0015_energyrollup_unaccounted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outlet',
+            name='shed_priority',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Load shedding order on main breaker overload: 1 is cut first, 0 = never cut'),
+        ),
+    ]
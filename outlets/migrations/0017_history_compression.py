@@ -0,0 +1,44 @@
+# Generated by Django 5.2.9 on 2026-10-19 07:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outlets', '0016_outlet_shed_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='centralcontrolunit',
+            name='history_mode',
+            field=models.CharField(choices=[('interval', 'Fixed interval'), ('deadband', 'Deadband'), ('swinging_door', 'Swinging door')], default='interval', help_text='How main breaker readings are thinned before saving', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='centralcontrolunit',
+            name='history_tolerance',
+            field=models.PositiveIntegerField(default=100, help_text='Compression tolerance in mA'),
+        ),
+        migrations.AddField(
+            model_name='outlet',
+            name='history_mode',
+            field=models.CharField(choices=[('interval', 'Fixed interval'), ('deadband', 'Deadband'), ('swinging_door', 'Swinging door')], default='interval', help_text='How sensor readings are thinned before saving', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='outlet',
+            name='history_tolerance',
+            field=models.PositiveIntegerField(default=50, help_text='Compression tolerance in mA per socket'),
+        ),
+        migrations.AlterField(
+            model_name='mainbreakerreading',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When the reading was taken'),
+        ),
+        migrations.AlterField(
+            model_name='sensordata',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When the reading was taken'),
+        ),
+    ]
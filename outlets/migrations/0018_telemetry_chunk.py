@@ -0,0 +1,31 @@
+# Generated by Django 5.2.9 on 2026-10-19 07:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outlets', '0017_history_compression'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelemetryChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_start', models.DateTimeField(help_text='Start of the window; sample times are offsets from it')),
+                ('count', models.PositiveIntegerField(default=0, help_text='Samples in the blob')),
+                ('encoding', models.CharField(choices=[('raw', 'Raw'), ('zlib', 'zlib')], default='zlib', max_length=4)),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('ccu', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_chunks', to='outlets.centralcontrolunit')),
+                ('outlet', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='telemetry_chunks', to='outlets.outlet')),
+            ],
+            options={
+                'ordering': ['-window_start'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('outlet__isnull', False)), fields=('outlet', 'window_start'), name='unique_outlet_telemetry_window'), models.UniqueConstraint(condition=models.Q(('ccu__isnull', False)), fields=('ccu', 'window_start'), name='unique_ccu_telemetry_window')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.9 on 2026-10-19 07:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outlets', '0018_telemetry_chunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mainbreakerreading',
+            name='boot_id',
+            field=models.PositiveBigIntegerField(blank=True, help_text='CCU boot the reading was numbered in (backfill)', null=True),
+        ),
+        migrations.AddField(
+            model_name='mainbreakerreading',
+            name='seq',
+            field=models.PositiveIntegerField(blank=True, help_text='CCU sequence number within boot_id (backfill)', null=True),
+        ),
+        migrations.AddField(
+            model_name='sensordata',
+            name='boot_id',
+            field=models.PositiveBigIntegerField(blank=True, help_text='CCU boot the reading was numbered in (backfill)', null=True),
+        ),
+        migrations.AddField(
+            model_name='sensordata',
+            name='seq',
+            field=models.PositiveIntegerField(blank=True, help_text='CCU sequence number within boot_id (backfill)', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='mainbreakerreading',
+            constraint=models.UniqueConstraint(condition=models.Q(('seq__isnull', False)), fields=('ccu_id', 'boot_id', 'seq'), name='unique_breaker_reading_seq'),
+        ),
+        migrations.AddConstraint(
+            model_name='sensordata',
+            constraint=models.UniqueConstraint(condition=models.Q(('seq__isnull', False)), fields=('outlet', 'boot_id', 'seq'), name='unique_sensor_data_seq'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-19 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outlets', '0019_reading_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='centralcontrolunit',
+            name='backfill_boot_id',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Boot of the last backfilled batch', null=True),
+        ),
+        migrations.AddField(
+            model_name='centralcontrolunit',
+            name='backfill_seq',
+            field=models.PositiveIntegerField(blank=True, help_text='Highest sequence number backfilled for that boot', null=True),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.9 on 2026-10-19 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outlets', '0020_ccu_backfill_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='centralcontrolunit',
+            name='calibration_gain',
+            field=models.FloatField(default=1.0, help_text='Reading × gain + offset'),
+        ),
+        migrations.AddField(
+            model_name='centralcontrolunit',
+            name='calibration_offset',
+            field=models.IntegerField(default=0, help_text='Calibration offset in mA'),
+        ),
+        migrations.AddField(
+            model_name='centralcontrolunit',
+            name='noise_floor',
+            field=models.PositiveIntegerField(default=280, help_text='Readings up to this many mA are sensor noise (→ 0)'),
+        ),
+        migrations.AddField(
+            model_name='centralcontrolunit',
+            name='smoothing',
+            field=models.FloatField(default=1.0, help_text='EWMA weight of a new reading (0-1); 1 = off'),
+        ),
+        migrations.AddField(
+            model_name='centralcontrolunit',
+            name='spike_window',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Median of the last N readings; 1 = off'),
+        ),
+        migrations.AddField(
+            model_name='outlet',
+            name='calibration_gain',
+            field=models.FloatField(default=1.0, help_text='Reading × gain + offset'),
+        ),
+        migrations.AddField(
+            model_name='outlet',
+            name='calibration_offset',
+            field=models.IntegerField(default=0, help_text='Calibration offset in mA'),
+        ),
+        migrations.AddField(
+            model_name='outlet',
+            name='noise_floor',
+            field=models.PositiveIntegerField(default=100, help_text='Readings up to this many mA are sensor noise (→ 0)'),
+        ),
+        migrations.AddField(
+            model_name='outlet',
+            name='smoothing',
+            field=models.FloatField(default=1.0, help_text='EWMA weight of a new reading (0-1); 1 = off'),
+        ),
+        migrations.AddField(
+            model_name='outlet',
+            name='spike_window',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Median of the last N readings; 1 = off'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 class UserProfile(models.Model):
     """Extended user information"""
@@ -28,6 +29,14 @@ def save_user_profile(sender, instance, **kwargs):
         instance.profile.save()
 
 
+# How a device's readings are thinned before they are persisted (see outlets/history.py)
+HISTORY_MODES = [
+    ('interval', 'Fixed interval'),
+    ('deadband', 'Deadband'),
+    ('swinging_door', 'Swinging door'),
+]
+
+
 class CentralControlUnit(models.Model):
     """ESP32 Central Control Unit — links a physical CCU to a user account"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ccus')
@@ -38,6 +47,20 @@ class CentralControlUnit(models.Model):
     last_seen = models.DateTimeField(null=True, blank=True, help_text="Last time this CCU contacted the server")
     focused_device = models.CharField(max_length=10, blank=True, default='', help_text="Currently expanded outlet device_id (hex)")
     breaker_threshold = models.IntegerField(default=15000, help_text="Main breaker overload threshold in mA")
+    nominal_voltage = models.FloatField(default=220.0, help_text="Site mains voltage (V) used for energy estimates")
+    power_factor = models.FloatField(default=1.0, help_text="Assumed load power factor (0-1) used for energy estimates")
+    history_mode = models.CharField(max_length=16, choices=HISTORY_MODES, default='interval',
+                                    help_text="How main breaker readings are thinned before saving")
+    history_tolerance = models.PositiveIntegerField(default=100, help_text="Compression tolerance in mA")
+    # Signal conditioning of breaker readings (outlets/conditioning.py)
+    noise_floor = models.PositiveIntegerField(default=280, help_text="Readings up to this many mA are sensor noise (→ 0)")
+    spike_window = models.PositiveSmallIntegerField(default=1, help_text="Median of the last N readings; 1 = off")
+    smoothing = models.FloatField(default=1.0, help_text="EWMA weight of a new reading (0-1); 1 = off")
+    calibration_gain = models.FloatField(default=1.0, help_text="Reading × gain + offset")
+    calibration_offset = models.IntegerField(default=0, help_text="Calibration offset in mA")
+    backfill_boot_id = models.PositiveBigIntegerField(null=True, blank=True, help_text="Boot of the last backfilled batch")
+    backfill_seq = models.PositiveIntegerField(null=True, blank=True,
+                                               help_text="Highest sequence number backfilled for that boot")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -60,6 +83,17 @@ class Outlet(models.Model):
     relay_a = models.BooleanField(default=False, help_text="Socket A relay state (ON/OFF)")
     relay_b = models.BooleanField(default=False, help_text="Socket B relay state (ON/OFF)")
     threshold = models.IntegerField(default=0, help_text="Current threshold in mA")
+    shed_priority = models.PositiveSmallIntegerField(
+        default=0, help_text="Load shedding order on main breaker overload: 1 is cut first, 0 = never cut")
+    history_mode = models.CharField(max_length=16, choices=HISTORY_MODES, default='interval',
+                                    help_text="How sensor readings are thinned before saving")
+    history_tolerance = models.PositiveIntegerField(default=50, help_text="Compression tolerance in mA per socket")
+    # Signal conditioning of sensor readings, per socket (outlets/conditioning.py)
+    noise_floor = models.PositiveIntegerField(default=100, help_text="Readings up to this many mA are sensor noise (→ 0)")
+    spike_window = models.PositiveSmallIntegerField(default=1, help_text="Median of the last N readings; 1 = off")
+    smoothing = models.FloatField(default=1.0, help_text="EWMA weight of a new reading (0-1); 1 = off")
+    calibration_gain = models.FloatField(default=1.0, help_text="Reading × gain + offset")
+    calibration_offset = models.IntegerField(default=0, help_text="Calibration offset in mA")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -81,10 +115,16 @@ class SensorData(models.Model):
     current_a = models.IntegerField(default=0, help_text="Socket A current in mA")
     current_b = models.IntegerField(default=0, help_text="Socket B current in mA")
     is_overload = models.BooleanField(default=False, help_text="True if 0xFFFF overload trip detected")
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, help_text="When the reading was taken")
+    boot_id = models.PositiveBigIntegerField(null=True, blank=True, help_text="CCU boot the reading was numbered in (backfill)")
+    seq = models.PositiveIntegerField(null=True, blank=True, help_text="CCU sequence number within boot_id (backfill)")
     
     class Meta:
         ordering = ['-timestamp']
+        constraints = [
+            models.UniqueConstraint(fields=['outlet', 'boot_id', 'seq'],
+                                    condition=models.Q(seq__isnull=False), name='unique_sensor_data_seq'),
+        ]
         indexes = [
             models.Index(fields=['-timestamp']),
             models.Index(fields=['outlet', '-timestamp']),
@@ -105,10 +145,16 @@ class MainBreakerReading(models.Model):
                             help_text="Linked CCU device (auto-set from ccu_id)")
     current_ma = models.IntegerField(help_text="Total load current in mA from SCT sensor")
     threshold = models.IntegerField(default=0, help_text="Current threshold in mA for main breaker")
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, help_text="When the reading was taken")
+    boot_id = models.PositiveBigIntegerField(null=True, blank=True, help_text="CCU boot the reading was numbered in (backfill)")
+    seq = models.PositiveIntegerField(null=True, blank=True, help_text="CCU sequence number within boot_id (backfill)")
 
     class Meta:
         ordering = ['-timestamp']
+        constraints = [
+            models.UniqueConstraint(fields=['ccu_id', 'boot_id', 'seq'],
+                                    condition=models.Q(seq__isnull=False), name='unique_breaker_reading_seq'),
+        ]
         indexes = [
             models.Index(fields=['-timestamp']),
             models.Index(fields=['ccu_id', '-timestamp']),
@@ -118,6 +164,89 @@ class MainBreakerReading(models.Model):
         return f"Breaker [{self.ccu_id}] {self.current_ma}mA @ {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
 
 
+class EnergyRollup(models.Model):
+    """
+    Energy per outlet socket or CCU main breaker, bucketed by hour and day.
+    Maintained incrementally on every ingest by outlets.energy — each row
+    belongs to either an outlet (channels a/b) or a CCU (channels main and
+    unaccounted, the breaker load no smart outlet explains).
+    """
+    PERIOD_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+    CHANNEL_CHOICES = [
+        ('a', 'Socket A'),
+        ('b', 'Socket B'),
+        ('main', 'Main Breaker'),
+        ('unaccounted', 'Unaccounted Load'),
+    ]
+
+    outlet = models.ForeignKey(Outlet, null=True, blank=True, on_delete=models.CASCADE, related_name='energy_rollups')
+    ccu = models.ForeignKey(CentralControlUnit, null=True, blank=True, on_delete=models.CASCADE,
+                            related_name='energy_rollups')
+    channel = models.CharField(max_length=12, choices=CHANNEL_CHOICES)
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket_start = models.DateTimeField(help_text="Start of the hour/day (local time) this bucket covers")
+    energy_wh = models.FloatField(default=0.0, help_text="Accumulated energy in Wh")
+    samples = models.IntegerField(default=0, help_text="Readings integrated into this bucket")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-bucket_start']
+        constraints = [
+            models.UniqueConstraint(fields=['outlet', 'channel', 'period', 'bucket_start'],
+                                    condition=models.Q(outlet__isnull=False), name='unique_outlet_energy_bucket'),
+            models.UniqueConstraint(fields=['ccu', 'channel', 'period', 'bucket_start'],
+                                    condition=models.Q(ccu__isnull=False), name='unique_ccu_energy_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['outlet', 'period', '-bucket_start']),
+            models.Index(fields=['ccu', 'period', '-bucket_start']),
+        ]
+
+    def __str__(self):
+        owner = self.outlet.name if self.outlet_id else f'CCU {self.ccu.ccu_id}'
+        return f"{owner} [{self.channel}] {self.period} {self.bucket_start:%Y-%m-%d %H:%M} — {self.energy_wh:.1f} Wh"
+
+
+class TelemetryChunk(models.Model):
+    """
+    Every reading of one outlet or CCU main breaker within a window (one hour),
+    packed by outlets.telemetry into a binary blob of segments, one appended
+    per flush. Each segment holds its samples column by column: delta
+    timestamps in ms (uint32), then the currents (uint16 for outlets, int32
+    for the breaker) and the outlet overload flags (uint8), zlib-compressed
+    unless encoding is 'raw'. A few bytes per sample instead of a SensorData row.
+    """
+    ENCODING_CHOICES = [
+        ('raw', 'Raw'),
+        ('zlib', 'zlib'),
+    ]
+
+    outlet = models.ForeignKey(Outlet, null=True, blank=True, on_delete=models.CASCADE, related_name='telemetry_chunks')
+    ccu = models.ForeignKey(CentralControlUnit, null=True, blank=True, on_delete=models.CASCADE,
+                            related_name='telemetry_chunks')
+    window_start = models.DateTimeField(help_text="Start of the window; sample times are offsets from it")
+    count = models.PositiveIntegerField(default=0, help_text="Samples in the blob")
+    encoding = models.CharField(max_length=4, choices=ENCODING_CHOICES, default='zlib')
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-window_start']
+        constraints = [
+            models.UniqueConstraint(fields=['outlet', 'window_start'],
+                                    condition=models.Q(outlet__isnull=False), name='unique_outlet_telemetry_window'),
+            models.UniqueConstraint(fields=['ccu', 'window_start'],
+                                    condition=models.Q(ccu__isnull=False), name='unique_ccu_telemetry_window'),
+        ]
+
+    def __str__(self):
+        owner = self.outlet.name if self.outlet_id else f'CCU {self.ccu.ccu_id}'
+        return f"{owner} {self.window_start:%Y-%m-%d %H:%M} — {self.count} samples, {len(self.data)} bytes"
+
+
 class OutletSchedule(models.Model):
     """Schedule for automatic outlet control"""
     outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, related_name='schedules')
@@ -137,9 +266,14 @@ class Alert(models.Model):
         ('overload', 'Overload Trip'),
         ('threshold', 'Threshold Exceeded'),
         ('offline', 'Device Offline'),
+        ('anomaly', 'Abnormal Draw'),
+        ('stuck_sensor', 'Stuck Sensor'),
+        ('sudden_drop', 'Sudden Drop'),
     ]
     
-    outlet = models.ForeignKey(Outlet, on_delete=models.CASCADE, related_name='alerts')
+    outlet = models.ForeignKey(Outlet, null=True, blank=True, on_delete=models.CASCADE, related_name='alerts')
+    ccu = models.ForeignKey(CentralControlUnit, null=True, blank=True, on_delete=models.CASCADE,
+                            related_name='alerts', help_text="Set instead of outlet for main breaker alerts")
     alert_type = models.CharField(max_length=20, choices=ALERT_TYPES)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
@@ -149,7 +283,8 @@ class Alert(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.get_alert_type_display()} - {self.outlet.name}"
+        source = self.outlet.name if self.outlet_id else f"CCU {self.ccu.ccu_id}"
+        return f"{self.get_alert_type_display()} - {source}"
 
 
 class PendingCommand(models.Model):
@@ -0,0 +1,59 @@
+"""
+Breaker-vs-outlets reconciliation per CCU.
+
+Outlet readings and main breaker readings arrive on independent streams.
+Each outlet's latest load is held per CCU in memory (sample-and-hold); every
+breaker sample is joined against the outlet loads that are recent enough to
+still describe the same moment:
+
+    unaccounted_ma = breaker_ma − Σ fresh outlet loads
+
+i.e. whatever is drawing power on circuits with no smart outlet. Outlets
+reported more than STALE_SECONDS before the breaker sample are left out
+and counted in `outlets_stale`. Only the focused outlet reports every 2s;
+the others are polled round-robin every 30s, hence the generous window.
+Outlets on the idle sampling tier report even less often; for them the
+window is their sampling.report_window().
+"""
+import threading
+
+from decouple import config
+
+from . import sampling
+
+OVERLOAD_SENTINEL = 65535
+STALE_SECONDS = config('RECONCILE_STALE_SECONDS', default=300, cast=float)
+
+_latest = {}        # ccu pk → {outlet pk: (timestamp, load_ma, stale after seconds)}
+_lock = threading.Lock()
+
+
+def record_outlet_reading(outlet, current_a, current_b, timestamp):
+    if outlet.ccu_id is None:
+        return
+    load = sum(c for c in (current_a, current_b) if c != OVERLOAD_SENTINEL)
+    window = sampling.report_window(outlet.device_id, STALE_SECONDS)
+    with _lock:
+        _latest.setdefault(outlet.ccu_id, {})[outlet.pk] = (timestamp, load, window)
+
+
+def reconcile(ccu, breaker_ma, timestamp):
+    """Time-aligned split of a breaker sample into monitored and unaccounted load."""
+    with _lock:
+        readings = list(_latest.get(ccu.pk, {}).values())
+    fresh = [load for ts, load, window in readings if abs((timestamp - ts).total_seconds()) <= window]
+    outlets_ma = sum(fresh)
+    return {
+        'outlets_ma': outlets_ma,
+        'unaccounted_ma': max(0, breaker_ma - outlets_ma),
+        'outlets_counted': len(fresh),
+        'outlets_stale': len(readings) - len(fresh),
+    }
+
+
+def outlet_loads(ccu, timestamp):
+    """{outlet pk: load_ma} for the CCU's outlets whose last report is still fresh."""
+    with _lock:
+        readings = dict(_latest.get(ccu.pk, {}))
+    return {pk: load for pk, (ts, load, window) in readings.items()
+            if abs((timestamp - ts).total_seconds()) <= window}
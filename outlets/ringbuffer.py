@@ -0,0 +1,100 @@
+"""
+Last few minutes of every reading, per outlet and per CCU main breaker.
+
+Most readings are never persisted (see outlets.history), so without this a
+page reload showed only the last saved value and the breaker chart started
+empty. Each device gets a fixed-size ring of NumPy arrays holding the last
+RING_BUFFER_MINUTES of samples; the consumers send it as the initial frame
+and outlet_detail renders it, neither touching the database.
+
+Process-local like the other in-memory state: with several workers a page
+sees the samples that reached its worker.
+"""
+import threading
+import time
+
+import numpy as np
+from decouple import config
+
+BUFFER_MINUTES = config('RING_BUFFER_MINUTES', default=15, cast=float)
+# The fastest report rate is one reading every ~2s (focused outlet)
+CAPACITY = int(BUFFER_MINUTES * 60 / 2)
+
+OUTLET_FIELDS = ('current_a', 'current_b', 'is_overload')
+BREAKER_FIELDS = ('current_ma',)
+
+
+class _Ring:
+    """Fixed-size circular buffer of (epoch ms, int values) samples."""
+    __slots__ = ('times', 'values', 'next', 'size')
+
+    def __init__(self, fields):
+        self.times = np.zeros(CAPACITY, dtype=np.int64)
+        self.values = np.zeros((CAPACITY, len(fields)), dtype=np.int32)
+        self.next = 0
+        self.size = 0
+
+    def append(self, time_ms, values):
+        self.times[self.next] = time_ms
+        self.values[self.next] = values
+        self.next = (self.next + 1) % CAPACITY
+        self.size = min(self.size + 1, CAPACITY)
+
+    def ordered(self):
+        """(times, values) oldest first — copies, safe to use outside the lock."""
+        start = (self.next - self.size) % CAPACITY
+        order = (start + np.arange(self.size)) % CAPACITY
+        return self.times[order], self.values[order]
+
+
+_rings = {}     # ('outlet', device_id) / ('breaker', ccu_id) → _Ring
+_lock = threading.Lock()
+
+
+def _append(key, fields, timestamp, values):
+    with _lock:
+        ring = _rings.get(key)
+        if ring is None:
+            ring = _rings[key] = _Ring(fields)
+        ring.append(int(timestamp.timestamp() * 1000), values)
+
+
+def record_outlet_reading(device_id, current_a, current_b, is_overload, timestamp):
+    _append(('outlet', device_id), OUTLET_FIELDS, timestamp, (current_a, current_b, int(bool(is_overload))))
+
+
+def record_breaker_reading(ccu_id, current_ma, timestamp):
+    _append(('breaker', ccu_id), BREAKER_FIELDS, timestamp, (current_ma,))
+
+
+def _recent(key, fields):
+    with _lock:
+        ring = _rings.get(key)
+        if ring is None:
+            return None
+        times, values = ring.ordered()
+    # A device that went quiet keeps its ring; only show the last minutes
+    keep = times >= (time.time() - BUFFER_MINUTES * 60) * 1000
+    times, values = times[keep], values[keep]
+    if len(times) == 0:
+        return None
+    history = {'t': times.tolist()}
+    for i, field in enumerate(fields):
+        history[field] = values[:, i].tolist()
+    if 'is_overload' in history:
+        history['is_overload'] = [bool(v) for v in history['is_overload']]
+    return history
+
+
+def outlet_history(device_id):
+    """
+    Buffered samples of an outlet, oldest first, as columns
+    {'t': [epoch ms], 'current_a': [...], 'current_b': [...], 'is_overload': [...]};
+    None if nothing was received in the last RING_BUFFER_MINUTES.
+    """
+    return _recent(('outlet', device_id), OUTLET_FIELDS)
+
+
+def breaker_history(ccu_id):
+    """Buffered breaker samples, {'t': [epoch ms], 'current_ma': [...]}, or None."""
+    return _recent(('breaker', ccu_id), BREAKER_FIELDS)
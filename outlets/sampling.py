@@ -0,0 +1,116 @@
+"""
+Demand-driven sampling plan per CCU.
+
+Every outlet gets a tier from live demand, tracked in memory:
+
+  high        a dashboard has its detail view open, it is the CCU's focus
+              device, or a fault is open (last reading overloaded or over
+              threshold) — read on every CCU cycle (~2s)
+  background  at least one dashboard is subscribed to its live stream —
+              round-robin, one outlet every BACKGROUND_INTERVAL_SECONDS
+  idle        nobody is watching and nothing is wrong — once
+              IDLE_INTERVAL_SECONDS have passed, at its next round-robin slot
+
+Subscriptions and view flags come from SensorDataConsumer, faults from the
+sensor ingest. The CCU fetches its plan from /api/sampling-plan/; the plan
+version is a checksum of its content, so an unchanged plan costs a 304.
+
+Slow tiers report further apart than the fixed gap limits of energy
+integration, reconciliation and offline detection. Those use
+report_window() instead: MISSED_REPORTS of the outlet's expected interval.
+"""
+import threading
+import zlib
+from collections import Counter
+
+from decouple import config
+
+# Must match the firmware's CLOUD_SEND_INTERVAL_MS / BACKGROUND_POLL_INTERVAL_MS
+FAST_INTERVAL_SECONDS = 2
+BACKGROUND_INTERVAL_SECONDS = 30
+IDLE_INTERVAL_SECONDS = config('SAMPLING_IDLE_SECONDS', default=300, cast=float)
+# Reports an outlet may miss before its silence counts as an outage
+MISSED_REPORTS = 3
+
+_subscribers = Counter()    # device_id → open SensorDataConsumer connections
+_viewers = Counter()        # device_id → connections with the detail view open
+_faults = set()             # device_ids whose last reading was a fault
+_expected = {}              # device_id → expected seconds between reports under the last plan
+_lock = threading.Lock()
+
+
+def subscribe(device_id):
+    with _lock:
+        _subscribers[device_id.upper()] += 1
+
+
+def unsubscribe(device_id, viewing=False):
+    device_id = device_id.upper()
+    with _lock:
+        _subscribers[device_id] -= 1
+        if _subscribers[device_id] <= 0:
+            del _subscribers[device_id]
+        if viewing:
+            _set_viewing(device_id, False)
+
+
+def _set_viewing(device_id, active):
+    """Caller holds _lock."""
+    _viewers[device_id] += 1 if active else -1
+    if _viewers[device_id] <= 0:
+        del _viewers[device_id]
+
+
+def set_viewing(device_id, active):
+    with _lock:
+        _set_viewing(device_id.upper(), active)
+
+
+def note_reading(device_id, faulted):
+    with _lock:
+        if faulted:
+            _faults.add(device_id)
+        else:
+            _faults.discard(device_id)
+
+
+def plan(device_ids, focused=None):
+    """Sampling plan for one CCU's outlets (focused: the CCU's focus device, if any)."""
+    with _lock:
+        high = [d for d in device_ids if _viewers[d] or d in _faults or d == focused]
+        idle = [d for d in device_ids if d not in high and not _subscribers[d]]
+        background = [d for d in device_ids if d not in high and d not in idle]
+
+        # High outlets share the fast cycle; the rest share the round-robin slot
+        fast_every = FAST_INTERVAL_SECONDS * max(1, len(high))
+        round_robin = BACKGROUND_INTERVAL_SECONDS * max(1, len(background) + len(idle))
+        for d in high:
+            _expected[d] = fast_every
+        for d in background:
+            _expected[d] = round_robin
+        for d in idle:
+            _expected[d] = max(IDLE_INTERVAL_SECONDS, round_robin)
+
+    tiers = {'high': high, 'background': background, 'idle': idle}
+    return {
+        'version': zlib.crc32(repr(sorted(tiers.items())).encode()),
+        **tiers,
+        'fast_interval_ms': FAST_INTERVAL_SECONDS * 1000,
+        'background_interval_ms': BACKGROUND_INTERVAL_SECONDS * 1000,
+        'idle_interval_ms': int(IDLE_INTERVAL_SECONDS * 1000),
+    }
+
+
+def expected_interval(device_id):
+    """Seconds between reports the last served plan asks of this outlet (None before any plan)."""
+    with _lock:
+        return _expected.get(device_id)
+
+
+def report_window(device_id, floor):
+    """
+    Longest silence after which this outlet's last report still stands:
+    `floor`, or MISSED_REPORTS of its expected interval if that is longer.
+    """
+    expected = expected_interval(device_id)
+    return max(floor, MISSED_REPORTS * expected) if expected else floor
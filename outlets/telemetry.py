@@ -0,0 +1,254 @@
+"""
+Packed storage of every sample (TelemetryChunk), next to the row history.
+
+SensorData keeps one row per reading that outlets.history decides to keep;
+this module can keep all of them at a few bytes each. Readings are buffered
+in memory per device and window (WINDOW_SECONDS, one hour); every
+FLUSH_INTERVAL_SECONDS each buffer is encoded as one segment and appended
+to the window's TelemetryChunk in SQL (data || segment), so a flush never
+reads or rewrites what is already stored. A segment is
+
+  count uint32 | payload bytes uint32 | payload
+
+and the payload holds the segment's columns back to back, widest first so
+every column stays aligned:
+
+  outlet   dt uint32 | current_a uint16 | current_b uint16 | overload uint8
+  breaker  dt uint32 | current_ma int32
+
+dt is the ms since the previous sample (the first one: since window_start).
+Payloads are zlib-compressed unless the chunk's encoding is 'raw'. Decoding
+is np.frombuffer over each (decompressed) payload — for a chunk of one
+segment the current columns are views, not copies.
+
+Off unless TELEMETRY_CHUNKS_ENABLED is set.
+"""
+import atexit
+import threading
+import zlib
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from decouple import config
+from django.db import IntegrityError, transaction
+from django.db.models import BinaryField, F, Func, Value
+from django.utils import timezone
+
+from .models import TelemetryChunk
+
+CHUNKS_ENABLED = config('TELEMETRY_CHUNKS_ENABLED', default=False, cast=bool)
+COMPRESS = config('TELEMETRY_COMPRESS', default=True, cast=bool)
+FLUSH_INTERVAL_SECONDS = config('TELEMETRY_FLUSH_SECONDS', default=300, cast=float)
+WINDOW_SECONDS = 3600
+
+OUTLET_COLUMNS = (('dt', '<u4'), ('current_a', '<u2'), ('current_b', '<u2'), ('is_overload', 'u1'))
+BREAKER_COLUMNS = (('dt', '<u4'), ('current_ma', '<i4'))
+
+SEGMENT_HEADER = np.dtype([('count', '<u4'), ('size', '<u4')])
+
+_pending = defaultdict(list)    # (kind, pk, window_start) → [(ms since window_start, *values)]
+_last_flush = timezone.now()
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+
+
+def _columns(kind):
+    return OUTLET_COLUMNS if kind == 'outlet' else BREAKER_COLUMNS
+
+
+def _window_start(ts):
+    epoch = int(ts.timestamp()) // WINDOW_SECONDS * WINDOW_SECONDS
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+def _offset_ms(ts, window_start):
+    return int(round((ts - window_start).total_seconds() * 1000))
+
+
+# ─── Encoding ───
+
+def encode(kind, offsets, values, compress=COMPRESS):
+    """
+    Segment for samples at `offsets` (ms since window_start, sorted) with one
+    value array per non-dt column. Returns (bytes, encoding).
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    deltas = np.diff(offsets, prepend=0).astype('<u4')
+    parts = [deltas.tobytes()]
+    for (_, dtype), column in zip(_columns(kind)[1:], values):
+        parts.append(np.asarray(column).astype(dtype).tobytes())
+    payload = b''.join(parts)
+    if compress:
+        payload = zlib.compress(payload)
+    header = np.array([(len(offsets), len(payload))], dtype=SEGMENT_HEADER).tobytes()
+    return header + payload, 'zlib' if compress else 'raw'
+
+
+def _decode_segment(kind, payload, count, base_ms):
+    columns, offset = {}, 0
+    for name, dtype in _columns(kind):
+        column = np.frombuffer(payload, dtype=dtype, count=count, offset=offset)
+        offset += column.nbytes
+        columns[name] = column
+    columns['t'] = base_ms + np.cumsum(columns.pop('dt'), dtype=np.int64)
+    return columns
+
+
+def decode(chunk):
+    """
+    {'t': epoch ms (int64), column name: array, ...} for a TelemetryChunk,
+    sorted by t. For a chunk of one segment every column but 't' is a view
+    into the blob.
+    """
+    kind = 'outlet' if chunk.outlet_id else 'breaker'
+    blob = memoryview(chunk.data)   # bytes or memoryview, depending on the database driver
+    base_ms = int(chunk.window_start.timestamp() * 1000)
+    parts, position = [], 0
+    while position < len(blob):
+        header = np.frombuffer(blob, dtype=SEGMENT_HEADER, count=1, offset=position)[0]
+        position += SEGMENT_HEADER.itemsize
+        payload = blob[position:position + int(header['size'])]
+        position += int(header['size'])
+        if chunk.encoding == 'zlib':
+            payload = zlib.decompress(payload)
+        parts.append(_decode_segment(kind, payload, int(header['count']), base_ms))
+    if len(parts) == 1:
+        return parts[0]
+    return _concatenate(kind, parts)
+
+
+def _concatenate(kind, parts):
+    """One set of columns from several, sorted by t (segments can overlap when readings arrive late)."""
+    dtypes = {'t': np.int64, **dict(_columns(kind)[1:])}
+    if not parts:
+        return {name: np.empty(0, dtype=dtype) for name, dtype in dtypes.items()}
+    merged = {name: np.concatenate([p[name] for p in parts]) for name in dtypes}
+    if np.any(np.diff(merged['t']) < 0):
+        order = np.argsort(merged['t'], kind='stable')
+        merged = {name: column[order] for name, column in merged.items()}
+    return merged
+
+
+# ─── Ingest ───
+
+def _append(kind, pk, timestamp, values):
+    window = _window_start(timestamp)
+    with _lock:
+        _pending[(kind, pk, window)].append((_offset_ms(timestamp, window), *values))
+    _maybe_flush(timestamp)
+
+
+def record_outlet_reading(outlet, current_a, current_b, is_overload, timestamp):
+    if CHUNKS_ENABLED:
+        _append('outlet', outlet.pk, timestamp, (current_a, current_b, int(bool(is_overload))))
+
+
+def record_breaker_reading(ccu, current_ma, timestamp):
+    if CHUNKS_ENABLED and ccu is not None:
+        _append('breaker', ccu.pk, timestamp, (current_ma,))
+
+
+def _maybe_flush(now):
+    if (now - _last_flush).total_seconds() >= FLUSH_INTERVAL_SECONDS:
+        flush()
+
+
+class _Append(Func):
+    """data || segment: appends to a bytea in place (SQLite, used in tests, needs the result cast back)."""
+    arg_joiner = ' || '
+    template = '(%(expressions)s)'
+    output_field = BinaryField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='CAST((%(expressions)s) AS BLOB)', **extra_context)
+
+
+def _append_segment(chunks, segment, count):
+    return chunks.update(data=_Append(F('data'), Value(segment, output_field=BinaryField())),
+                         count=F('count') + count, updated_at=timezone.now())
+
+
+def _merge(kind, pk, window, samples):
+    """Append buffered samples to the window's chunk as one segment (create the chunk if missing)."""
+    owner = {'outlet_id' if kind == 'outlet' else 'ccu_id': pk}
+    new = np.array(samples, dtype=np.int64)
+    # Readings can arrive late (e.g. CCU retries); keep each segment sorted
+    new = new[np.argsort(new[:, 0], kind='stable')]
+    offsets, values = new[:, 0], [new[:, i] for i in range(1, new.shape[1])]
+
+    chunks = TelemetryChunk.objects.filter(window_start=window, **owner)
+    segment, encoding = encode(kind, offsets, values)
+    if _append_segment(chunks.filter(encoding=encoding), segment, len(offsets)):
+        return
+    existing = chunks.values_list('encoding', flat=True).first()
+    if existing is not None:
+        # TELEMETRY_COMPRESS changed since the chunk was started: keep its encoding
+        segment, _ = encode(kind, offsets, values, compress=existing == 'zlib')
+        _append_segment(chunks, segment, len(offsets))
+        return
+    with transaction.atomic():
+        TelemetryChunk.objects.create(window_start=window, count=len(offsets), encoding=encoding,
+                                      data=segment, **owner)
+
+
+def flush():
+    """Merge buffered samples into their TelemetryChunk rows."""
+    global _last_flush
+    if not _flush_lock.acquire(blocking=False):
+        return  # Another request is already flushing
+    try:
+        with _lock:
+            batch = dict(_pending)
+            _pending.clear()
+            _last_flush = timezone.now()
+
+        for (kind, pk, window), samples in batch.items():
+            try:
+                _merge(kind, pk, window, samples)
+            except IntegrityError:
+                # Another process created the chunk first (or the device was deleted)
+                try:
+                    _merge(kind, pk, window, samples)
+                except IntegrityError:
+                    pass
+    finally:
+        _flush_lock.release()
+
+
+atexit.register(flush)
+
+
+# ─── Reading back ───
+
+def _samples(kind, pk, owner, start, end):
+    names = [name for name, _ in _columns(kind)[1:]]
+    chunks = TelemetryChunk.objects.filter(window_start__gte=_window_start(start),
+                                           window_start__lte=end, **owner).order_by('window_start')
+    parts = [decode(chunk) for chunk in chunks]
+
+    with _lock:
+        buffered = [(window, samples) for (k, p, window), samples in _pending.items() if k == kind and p == pk]
+    for window, samples in buffered:
+        array = np.array(samples, dtype=np.int64)
+        array = array[np.argsort(array[:, 0], kind='stable')]
+        part = {'t': int(window.timestamp() * 1000) + array[:, 0]}
+        part.update({name: array[:, i + 1] for i, name in enumerate(names)})
+        parts.append(part)
+
+    start_ms, end_ms = int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+    # A single chunk is already sorted: slicing keeps the value columns views into the blob
+    part = parts[0] if len(parts) == 1 else _concatenate(kind, parts)
+    lo = np.searchsorted(part['t'], start_ms, side='left')
+    hi = np.searchsorted(part['t'], end_ms, side='right')
+    return {name: column[lo:hi] for name, column in part.items()}
+
+
+def outlet_samples(outlet, start, end):
+    """{'t' (epoch ms), 'current_a', 'current_b', 'is_overload'} arrays for start ≤ t ≤ end."""
+    return _samples('outlet', outlet.pk, {'outlet': outlet}, start, end)
+
+
+def breaker_samples(ccu, start, end):
+    """{'t' (epoch ms), 'current_ma'} arrays for start ≤ t ≤ end."""
+    return _samples('breaker', ccu.pk, {'ccu': ccu}, start, end)
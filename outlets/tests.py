@@ -1,3 +1,571 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.db import OperationalError
 from django.test import TestCase
+from django.utils import timezone
+
+from . import (anomaly, billing, conditioning, energy, history, liveness, reconcile, ringbuffer, sampling, telemetry,
+               usage)
+from .models import CentralControlUnit, EnergyRollup, Outlet, SensorData, TelemetryChunk
+
+
+def local(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class DeviceTestCase(TestCase):
+    """A user with one CCU (220 V, PF 1) and one outlet on it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('owner', password='secret')
+        cls.ccu = CentralControlUnit.objects.create(user=cls.user, ccu_id='01')
+        cls.outlet = Outlet.objects.create(user=cls.user, ccu=cls.ccu, name='Fan', device_id='FE')
+
+
+def reset_sampling():
+    for state in (sampling._subscribers, sampling._viewers, sampling._faults, sampling._expected):
+        state.clear()
+
+
+class EnergyTests(DeviceTestCase):
+
+    def setUp(self):
+        energy._last.clear()
+        energy._pending.clear()
+        reset_sampling()
+
+    def rollup(self, period, bucket, channel='a'):
+        row = EnergyRollup.objects.filter(outlet=self.outlet, channel=channel, period=period,
+                                          bucket_start=bucket).first()
+        return row.energy_wh if row else 0.0
+
+    def test_constant_load_integrates_to_power_times_time(self):
+        start = local(2026, 3, 2, 10, 0)
+        for step in range(61):     # 1000 mA for 30 minutes, every 30s
+            energy.record_outlet_reading(self.outlet, 1000, 0, start + timedelta(seconds=30 * step))
+        energy.flush()
+        # 1 A × 220 V × 0.5 h
+        self.assertAlmostEqual(self.rollup('hour', start), 110.0)
+        self.assertAlmostEqual(self.rollup('day', local(2026, 3, 2)), 110.0)
+        self.assertAlmostEqual(self.rollup('hour', start, channel='b'), 0.0)
+
+    def test_segment_is_split_at_the_hour_boundary(self):
+        # 0 → 1200 mA over 10:59:00-11:01:00: the current at 11:00 is 600 mA
+        energy.record_outlet_reading(self.outlet, 0, 0, local(2026, 3, 2, 10, 59))
+        energy.record_outlet_reading(self.outlet, 1200, 0, local(2026, 3, 2, 11, 1))
+        energy.flush()
+        first = 300 * 220 / 1000 * 60 / 3600      # mean 300 mA for 60s
+        second = 900 * 220 / 1000 * 60 / 3600     # mean 900 mA for 60s
+        self.assertAlmostEqual(self.rollup('hour', local(2026, 3, 2, 10)), first)
+        self.assertAlmostEqual(self.rollup('hour', local(2026, 3, 2, 11)), second)
+        self.assertAlmostEqual(self.rollup('day', local(2026, 3, 2)), first + second)
+
+    def test_round_robin_outlet_is_integrated(self):
+        # Outlets that are not focused are polled round-robin, tens of seconds apart
+        start = local(2026, 3, 2, 10, 0)
+        energy.record_outlet_reading(self.outlet, 1000, 0, start)
+        energy.record_outlet_reading(self.outlet, 1000, 0, start + timedelta(seconds=120))
+        energy.flush()
+        self.assertAlmostEqual(self.rollup('hour', start), 220 * 120 / 3600)
+
+    def test_gap_longer_than_max_gap_is_not_integrated(self):
+        start = local(2026, 3, 2, 10, 0)
+        energy.record_outlet_reading(self.outlet, 1000, 0, start)
+        energy.record_outlet_reading(self.outlet, 1000, 0, start + timedelta(seconds=energy.MAX_GAP_SECONDS + 1))
+        energy.flush()
+        self.assertEqual(self.rollup('hour', start), 0.0)
+
+    def test_idle_tier_outlet_is_integrated(self):
+        # Nobody watches the outlet: the CCU reads it once the idle interval has
+        # passed, at its next round-robin slot — further apart than MAX_GAP_SECONDS
+        sampling.plan([self.outlet.device_id])
+        interval = sampling.IDLE_INTERVAL_SECONDS + sampling.BACKGROUND_INTERVAL_SECONDS
+        self.assertGreater(interval, energy.MAX_GAP_SECONDS)
+        start = local(2026, 3, 2, 10, 0)
+        for step in range(4):
+            energy.record_outlet_reading(self.outlet, 1000, 0, start + timedelta(seconds=interval * step))
+        energy.flush()
+        self.assertAlmostEqual(self.rollup('hour', start), 220 * 3 * interval / 3600)
+
+    def test_gap_from_idle_tier_survives_promotion(self):
+        # Idle until a dashboard opens the detail view: the first fast report
+        # still closes the long idle gap
+        sampling.plan([self.outlet.device_id])
+        start = local(2026, 3, 2, 10, 0)
+        energy.record_outlet_reading(self.outlet, 1000, 0, start)
+        sampling.set_viewing(self.outlet.device_id, True)
+        sampling.plan([self.outlet.device_id])
+        energy.record_outlet_reading(self.outlet, 1000, 0, start + timedelta(seconds=330))
+        energy.flush()
+        self.assertAlmostEqual(self.rollup('hour', start), 220 * 330 / 3600)
+
+    def test_overload_sentinel_counts_as_no_load(self):
+        start = local(2026, 3, 2, 10, 0)
+        energy.record_outlet_reading(self.outlet, energy.OVERLOAD_SENTINEL, 0, start)
+        energy.record_outlet_reading(self.outlet, energy.OVERLOAD_SENTINEL, 0, start + timedelta(seconds=60))
+        energy.flush()
+        self.assertEqual(self.rollup('hour', start), 0.0)
+
+    def test_flush_increments_existing_rows(self):
+        start = local(2026, 3, 2, 10, 0)
+        energy.record_outlet_reading(self.outlet, 1000, 0, start)
+        energy.record_outlet_reading(self.outlet, 1000, 0, start + timedelta(seconds=60))
+        energy.flush()
+        energy.record_outlet_reading(self.outlet, 1000, 0, start + timedelta(seconds=120))
+        energy.flush()
+        self.assertAlmostEqual(self.rollup('hour', start), 220 * 120 / 3600)
+        self.assertEqual(EnergyRollup.objects.filter(outlet=self.outlet, channel='a', period='hour').count(), 1)
+
+
+    def test_failed_flush_keeps_unwritten_energy(self):
+        start = local(2026, 3, 2, 10, 0)
+        energy.record_outlet_reading(self.outlet, 1000, 0, start)
+        energy.record_outlet_reading(self.outlet, 1000, 0, start + timedelta(seconds=60))
+        write = energy._write
+
+        def fail_after_first(*args):
+            if EnergyRollup.objects.exists():
+                raise OperationalError('server closed the connection unexpectedly')
+            write(*args)
+        with mock.patch.object(energy, '_write', side_effect=fail_after_first):
+            with self.assertRaises(OperationalError):
+                energy.flush()
+        self.assertEqual(EnergyRollup.objects.count(), 1)
+        energy.flush()
+        self.assertAlmostEqual(self.rollup('hour', start), 220 * 60 / 3600)
+        self.assertAlmostEqual(self.rollup('day', local(2026, 3, 2)), 220 * 60 / 3600)
+        self.assertEqual(EnergyRollup.objects.filter(channel='a').count(), 2)
+
+    def test_ingest_survives_a_failed_flush(self):
+        start = local(2026, 3, 2, 10, 0)
+        energy.record_outlet_reading(self.outlet, 1000, 0, start)
+        with mock.patch.object(energy, '_write', side_effect=OperationalError('database is down')), \
+                mock.patch.object(energy, '_last_flush', start), \
+                self.assertLogs('outlets.energy', 'ERROR'):
+            energy.record_outlet_reading(self.outlet, 1000, 0, start + timedelta(seconds=60))
+        energy.flush()
+        self.assertAlmostEqual(self.rollup('hour', start), 220 * 60 / 3600)
+
+
+class BillingTests(TestCase):
+    TOU = {'name': 'TOU', 'type': 'tou', 'rate': 10.0,
+           'periods': [{'rate': 20.0, 'start_hour': 8, 'end_hour': 21, 'days': [0, 1, 2, 3, 4]}]}
+
+    def test_flat_tariff(self):
+        rates, fixed = billing.tariff_matrix([{'name': 'Flat', 'rate': 12.0, 'monthly_charge': 50}])
+        self.assertEqual(rates.shape, (1, billing.HOURS_PER_WEEK))
+        self.assertTrue((rates == 12.0).all())
+        self.assertEqual(fixed.tolist(), [50.0])
+
+    def test_time_of_use_periods(self):
+        rates, _ = billing.tariff_matrix([self.TOU])
+        self.assertEqual(rates[0, 7], 10.0)                 # Monday 07:00
+        self.assertEqual(rates[0, 8], 20.0)                 # Monday 08:00
+        self.assertEqual(rates[0, 20], 20.0)
+        self.assertEqual(rates[0, 21], 10.0)
+        self.assertEqual(rates[0, 5 * 24 + 12], 10.0)       # Saturday noon
+        self.assertEqual((rates[0] == 20.0).sum(), 5 * 13)
+
+    def test_period_wrapping_midnight(self):
+        rates, _ = billing.tariff_matrix([{'type': 'tou', 'rate': 10.0,
+                                           'periods': [{'rate': 5.0, 'start_hour': 22, 'end_hour': 6}]}])
+        self.assertEqual(rates[0, 23], 5.0)
+        self.assertEqual(rates[0, 24 + 5], 5.0)
+        self.assertEqual(rates[0, 6], 10.0)
+        self.assertEqual((rates[0] == 5.0).sum(), 7 * 8)
+
+    def test_invalid_tariffs(self):
+        for tariffs in ([], [{'rate': 'cheap'}], [{'rate': -1}], [{'type': 'block', 'rate': 1}],
+                        [{'type': 'tou', 'rate': 1, 'periods': [{'rate': 2, 'start_hour': 25}]}]):
+            with self.subTest(tariffs=tariffs), self.assertRaises(billing.TariffError):
+                billing.tariff_matrix(tariffs)
+
+    def test_estimate_costs_every_tariff_and_projects_a_month(self):
+        profile = np.zeros(billing.HOURS_PER_WEEK)
+        profile[10] = 2.0       # Monday 10:00, peak
+        profile[30] = 1.0       # Tuesday 06:00, off-peak
+        result = billing.estimate(profile, 7, [{'name': 'Flat', 'rate': 12.0, 'monthly_charge': 40}, self.TOU])
+        self.assertEqual(result['energy_kwh'], 3.0)
+        self.assertAlmostEqual(result['monthly_kwh'], round(3.0 * billing.DAYS_PER_MONTH / 7, 3))
+        flat, tou = result['tariffs']
+        self.assertEqual(flat['window_cost'], 36.0)
+        self.assertAlmostEqual(flat['monthly_cost'], round(36.0 * billing.DAYS_PER_MONTH / 7 + 40, 2))
+        self.assertEqual(tou['window_cost'], 50.0)
+
+    def test_integrate_samples_skips_long_gaps(self):
+        epochs = np.array([0.0, 60.0, 60.0 + billing.MAX_GAP_SECONDS + 1])
+        kwh = billing.integrate_samples(epochs, np.array([1000.0, 1000.0, 1000.0]), 0.22)
+        # Only the first minute: 1 A × 220 V × 60 s
+        self.assertAlmostEqual(kwh.sum(), 1000 * 0.22 * 60 / 3.6e6)
+
+
+class SamplingTests(TestCase):
+
+    def setUp(self):
+        reset_sampling()
+
+    def test_tiers_follow_demand(self):
+        sampling.subscribe('A1')
+        sampling.subscribe('A2')
+        sampling.set_viewing('A2', True)
+        sampling.note_reading('A3', faulted=True)
+        plan = sampling.plan(['A1', 'A2', 'A3', 'A4', 'A5'], focused='A4')
+        self.assertEqual(plan['high'], ['A2', 'A3', 'A4'])
+        self.assertEqual(plan['background'], ['A1'])
+        self.assertEqual(plan['idle'], ['A5'])
+        self.assertEqual(sampling.expected_interval('A2'), 3 * sampling.FAST_INTERVAL_SECONDS)
+        self.assertEqual(sampling.expected_interval('A1'), 2 * sampling.BACKGROUND_INTERVAL_SECONDS)
+        self.assertEqual(sampling.expected_interval('A5'), sampling.IDLE_INTERVAL_SECONDS)
+
+    def test_plan_version_changes_with_the_tiers(self):
+        before = sampling.plan(['A1', 'A2'])['version']
+        self.assertEqual(sampling.plan(['A1', 'A2'])['version'], before)
+        sampling.subscribe('A1')
+        self.assertNotEqual(sampling.plan(['A1', 'A2'])['version'], before)
+
+    def test_report_window(self):
+        self.assertEqual(sampling.report_window('A1', 90), 90)     # Not in any plan yet
+        sampling.plan(['A1'])
+        self.assertEqual(sampling.report_window('A1', 90),
+                         sampling.MISSED_REPORTS * sampling.IDLE_INTERVAL_SECONDS)
+        sampling.set_viewing('A1', True)
+        sampling.plan(['A1'])
+        self.assertEqual(sampling.report_window('A1', 90), 90)
+
+
+class ReconcileTests(DeviceTestCase):
+
+    def setUp(self):
+        reconcile._latest.clear()
+        reset_sampling()
+
+    def test_unaccounted_load(self):
+        now = local(2026, 3, 2, 10, 0)
+        reconcile.record_outlet_reading(self.outlet, 1200, reconcile.OVERLOAD_SENTINEL, now)
+        result = reconcile.reconcile(self.ccu, 2000, now + timedelta(seconds=5))
+        self.assertEqual(result, {'outlets_ma': 1200, 'unaccounted_ma': 800,
+                                  'outlets_counted': 1, 'outlets_stale': 0})
+        self.assertEqual(reconcile.reconcile(self.ccu, 1000, now)['unaccounted_ma'], 0)
+
+    def test_stale_outlet_is_left_out(self):
+        now = local(2026, 3, 2, 10, 0)
+        reconcile.record_outlet_reading(self.outlet, 1200, 0, now)
+        later = now + timedelta(seconds=reconcile.STALE_SECONDS + 1)
+        result = reconcile.reconcile(self.ccu, 2000, later)
+        self.assertEqual((result['outlets_counted'], result['outlets_stale']), (0, 1))
+        self.assertEqual(reconcile.outlet_loads(self.ccu, later), {})
+
+    def test_idle_tier_outlet_stays_fresh_between_reports(self):
+        sampling.plan([self.outlet.device_id])
+        now = local(2026, 3, 2, 10, 0)
+        reconcile.record_outlet_reading(self.outlet, 1200, 0, now)
+        later = now + timedelta(seconds=sampling.IDLE_INTERVAL_SECONDS + sampling.BACKGROUND_INTERVAL_SECONDS)
+        self.assertEqual(reconcile.reconcile(self.ccu, 2000, later)['outlets_counted'], 1)
+        self.assertEqual(reconcile.outlet_loads(self.ccu, later), {self.outlet.pk: 1200})
+
+
+class LivenessPushTests(DeviceTestCase):
+
+    def setUp(self):
+        # A server loop on its own thread, idle like Daphne's between requests
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.layer = get_channel_layer()
+        self.group = f'sensor_{self.outlet.device_id}'
+        self.channel = self.on_loop(self.layer.new_channel())
+        self.on_loop(self.layer.group_add(self.group, self.channel))
+
+    def tearDown(self):
+        liveness.bind_loop(None)
+        self.on_loop(self.layer.group_discard(self.group, self.channel))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def on_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout=5)
+
+    def test_status_push_from_the_watcher_thread_arrives_promptly(self):
+        liveness.bind_loop(self.loop)
+        receiving = asyncio.run_coroutine_threadsafe(self.layer.receive(self.channel), self.loop)
+        time.sleep(0.1)     # The consumer is waiting for a message
+        liveness._announce(outlet=self.outlet, online=False, timestamp=local(2026, 3, 2, 10, 0), alert=False)
+        message = receiving.result(timeout=1)
+        self.assertEqual(message['type'], 'status_update')
+        self.assertEqual(message['data']['device_id'], self.outlet.device_id)
+        self.assertFalse(message['data']['online'])
+
+
+class AnomalyTests(DeviceTestCase):
+
+    def setUp(self):
+        anomaly._channels.clear()
+        self.outlet.relay_a = True
+        self.start = local(2026, 3, 2, 10, 0)
+        self.step = 0
+
+    def feed(self, value, count=1):
+        """Readings on socket A every 10s; returns the alert types raised."""
+        raised = []
+        for _ in range(count):
+            timestamp = self.start + timedelta(seconds=10 * self.step)
+            self.step += 1
+            raised += [alert_type for alert_type, _ in anomaly.check_outlet(self.outlet, value, 0, timestamp)]
+        return raised
+
+    def warm_up(self):
+        for n in range(anomaly.WARMUP_SAMPLES):
+            self.assertEqual(self.feed(1000 + (n % 3) * 20), [])
+
+    def test_abnormal_draw(self):
+        self.warm_up()
+        self.assertEqual(self.feed(1040), [])
+        self.assertEqual(self.feed(3000), ['anomaly'])
+        self.assertEqual(self.feed(3000), [])      # Cooldown
+
+    def test_sustained_drop_to_the_noise_floor(self):
+        self.warm_up()
+        self.assertEqual(self.feed(0, anomaly.DROP_CONFIRM_SAMPLES - 1), [])
+        self.assertEqual(self.feed(0), ['sudden_drop'])
+        self.assertEqual(self.feed(0, 5), [])      # Learning restarts at the new level
+
+    def test_brief_or_partial_drop_is_not_alerted(self):
+        self.warm_up()
+        self.assertEqual(self.feed(0, anomaly.DROP_CONFIRM_SAMPLES - 1), [])
+        self.assertEqual(self.feed(1000), [])
+        self.assertEqual(self.feed(0, anomaly.DROP_CONFIRM_SAMPLES - 1), [])
+        # Well below the usual level but still drawing current
+        self.assertEqual(self.feed(self.outlet.noise_floor + 50, 10), [])
+
+    def test_no_drop_alert_with_the_relay_off(self):
+        self.warm_up()
+        self.outlet.relay_a = False
+        self.assertEqual(self.feed(0, 10), [])
+
+    def test_stuck_sensor(self):
+        readings = int(anomaly.STUCK_SECONDS // 10)
+        self.assertNotIn('stuck_sensor', self.feed(777, readings))
+        self.assertEqual(self.feed(777), ['stuck_sensor'])
+
+    def test_overload_sentinel_is_skipped(self):
+        self.warm_up()
+        self.assertEqual(self.feed(anomaly.OVERLOAD_SENTINEL), [])
+
+
+class HistoryTests(DeviceTestCase):
+
+    def setUp(self):
+        history._streams.clear()
+        self.start = local(2026, 3, 2, 10, 0)
+
+    def feed(self, mode, values, tolerance=100, seconds=10):
+        """Readings of socket A every `seconds`; returns the saved (offset seconds, current_a)."""
+        self.outlet.history_mode = mode
+        self.outlet.history_tolerance = tolerance
+        saved = []
+        for n, value in enumerate(values):
+            for row in history.outlet_rows(self.outlet, value, 0, False, self.start + timedelta(seconds=seconds * n)):
+                row.save()
+                saved.append(((row.timestamp - self.start).total_seconds(), row.current_a))
+        return saved
+
+    def test_interval_keeps_one_row_per_interval(self):
+        saved = self.feed('interval', [1000 + n for n in range(13)])
+        self.assertEqual(saved, [(0, 1000), (60, 1006), (120, 1012)])
+
+    def test_deadband_saves_the_reading_before_a_step(self):
+        saved = self.feed('deadband', [1000, 1020, 1050, 1040, 2000, 2010])
+        self.assertEqual(saved, [(0, 1000), (30, 1040), (40, 2000)])
+
+    def test_swinging_door_keeps_the_ends_of_straight_segments(self):
+        ramp = [1000 + 100 * n for n in range(6)]           # 0-50s rising
+        saved = self.feed('swinging_door', ramp + [1500] * 5, tolerance=20)
+        self.assertEqual(saved, [(0, 1000), (50, 1500)])
+
+    def test_heartbeat_and_overload_are_always_saved(self):
+        saved = self.feed('deadband', [1000] * 40, seconds=30)
+        self.assertEqual([t for t, _ in saved], [0, 300, 600, 900])
+        self.outlet.history_mode = 'deadband'
+        row, = history.outlet_rows(self.outlet, 1000, 0, True, self.start + timedelta(seconds=1205))
+        self.assertTrue(row.is_overload)
+
+    def test_flush_writes_held_readings_of_compressing_modes_only(self):
+        self.feed('interval', [1000, 1010])
+        other = Outlet.objects.create(user=self.user, ccu=self.ccu, name='Lamp', device_id='FD',
+                                      history_mode='deadband')
+        for n, value in enumerate((500, 510, 520)):
+            for row in history.outlet_rows(other, value, 0, False, self.start + timedelta(seconds=10 * n)):
+                row.save()
+        history.flush()
+        self.assertEqual(SensorData.objects.filter(outlet=self.outlet).count(), 1)
+        self.assertEqual(list(SensorData.objects.filter(outlet=other).order_by('timestamp')
+                              .values_list('current_a', flat=True)), [500, 520])
+
+    def test_reconstruct(self):
+        times, values = [0, 60, 120, 1000], [0, 600, 600, 100]
+        at = [-10, 30, 90, 500, 1000, 1400, 1500]
+        step = history.reconstruct(times, values, at, 'deadband')
+        line = history.reconstruct(times, values, at, 'swinging_door')
+        np.testing.assert_array_equal(step, [np.nan, 0, 600, np.nan, 100, 100, np.nan])
+        np.testing.assert_array_equal(line, [np.nan, 300, 600, np.nan, 100, 100, np.nan])
+
+
+@mock.patch.object(telemetry, 'CHUNKS_ENABLED', True)
+class TelemetryTests(DeviceTestCase):
+
+    def setUp(self):
+        telemetry._pending.clear()
+        self.window = local(2026, 3, 2, 10, 0)
+
+    def record(self, seconds, current_a, current_b=0, is_overload=False):
+        telemetry.record_outlet_reading(self.outlet, current_a, current_b, is_overload,
+                                        self.window + timedelta(seconds=seconds))
+
+    def test_encode_decode_round_trip(self):
+        for compress in (True, False):
+            with self.subTest(compress=compress):
+                blob, encoding = telemetry.encode('outlet', [0, 1500, 4000], [[1000, 65535, 0], [5, 6, 7], [0, 1, 0]],
+                                                  compress=compress)
+                chunk = TelemetryChunk(outlet=self.outlet, window_start=self.window, count=3,
+                                       encoding=encoding, data=blob)
+                columns = telemetry.decode(chunk)
+                base = int(self.window.timestamp() * 1000)
+                self.assertEqual(columns['t'].tolist(), [base, base + 1500, base + 4000])
+                self.assertEqual(columns['current_a'].tolist(), [1000, 65535, 0])
+                self.assertEqual(columns['current_b'].tolist(), [5, 6, 7])
+                self.assertEqual(columns['is_overload'].tolist(), [0, 1, 0])
+
+    def test_flush_appends_a_segment(self):
+        self.record(0, 1000)
+        self.record(2, 1010)
+        telemetry.flush()
+        first = bytes(TelemetryChunk.objects.get(outlet=self.outlet).data)
+        self.record(6, 1030)
+        self.record(4, 1020)        # Arrives late
+        telemetry.flush()
+
+        chunk = TelemetryChunk.objects.get(outlet=self.outlet)
+        self.assertEqual(chunk.count, 4)
+        self.assertTrue(bytes(chunk.data).startswith(first))        # Stored bytes untouched
+        columns = telemetry.decode(chunk)
+        base = int(self.window.timestamp() * 1000)
+        self.assertEqual((columns['t'] - base).tolist(), [0, 2000, 4000, 6000])
+        self.assertEqual(columns['current_a'].tolist(), [1000, 1010, 1020, 1030])
+
+    def test_samples_include_unflushed_readings(self):
+        self.record(0, 1000)
+        self.record(10, 1100, is_overload=True)
+        telemetry.flush()
+        self.record(20, 1200)
+        self.record(3600, 1300)     # Next window, still buffered
+        samples = telemetry.outlet_samples(self.outlet, self.window + timedelta(seconds=5),
+                                           self.window + timedelta(hours=2))
+        self.assertEqual(samples['current_a'].tolist(), [1100, 1200, 1300])
+        self.assertEqual(samples['is_overload'].tolist(), [1, 0, 0])
+
+    def test_breaker_samples(self):
+        telemetry.record_breaker_reading(self.ccu, 4200, self.window)
+        telemetry.flush()
+        samples = telemetry.breaker_samples(self.ccu, self.window, self.window + timedelta(minutes=1))
+        self.assertEqual(samples['current_ma'].tolist(), [4200])
+        self.assertEqual(len(telemetry.breaker_samples(self.ccu, self.window + timedelta(hours=3),
+                                                       self.window + timedelta(hours=4))['t']), 0)
+
+
+class UsageTests(DeviceTestCase):
+
+    def setUp(self):
+        usage._users.clear()
+        self.start = local(2026, 3, 2, 10, 0, 5)
+
+    def render_at(self, now):
+        with mock.patch.object(timezone, 'now', return_value=now):
+            return usage.render_context(self.user)
+
+    def test_summary_is_reused_within_a_minute(self):
+        usage.record_outlet_reading(self.outlet, 1200, 0, False, self.start)
+        text = self.render_at(self.start)
+        self.assertIn('Live usage as of 10:00', text)
+        with mock.patch.object(usage, '_build_lines', side_effect=AssertionError('re-rendered')):
+            self.assertIs(self.render_at(self.start + timedelta(seconds=30)), text)
+
+    def test_time_markers_move_without_new_readings(self):
+        usage.record_outlet_reading(self.outlet, 1200, 0, False, self.start)
+        self.assertNotIn('last report', self.render_at(self.start))
+        later = self.render_at(self.start + timedelta(seconds=usage.STALE_AFTER_SECONDS + 60))
+        self.assertIn('Live usage as of 10:03', later)
+        self.assertIn('last report 10:00', later)
+
+    def test_yesterdays_stats_are_not_shown_as_today(self):
+        usage.record_outlet_reading(self.outlet, 1200, 0, False, self.start)
+        self.assertIn('today peak 1.20 A', self.render_at(self.start))
+        self.assertNotIn('today peak', self.render_at(self.start + timedelta(days=1)))
+
+
+class ConditioningTests(DeviceTestCase):
+
+    def setUp(self):
+        conditioning._channels.clear()
+
+    def configure(self, **settings):
+        for name, value in settings.items():
+            setattr(self.outlet, name, value)
+
+    def test_defaults_only_apply_the_noise_floor(self):
+        self.assertEqual(conditioning.outlet_reading(self.outlet, 90, 1500), (0, 1500))
+        self.assertEqual(conditioning.outlet_reading(self.outlet, 65535, 0), (65535, 0))
+
+    def test_spike_window_suppresses_a_single_spike(self):
+        self.configure(spike_window=3)
+        readings = [1000, 1010, 9000, 1020, 1000]
+        live = [conditioning.outlet_reading(self.outlet, value, 0)[0] for value in readings]
+        self.assertEqual(live, [1000, 1005, 1010, 1020, 1020])
+
+    def test_calibration_is_clamped_below_the_sentinel(self):
+        self.configure(calibration_gain=2.0, calibration_offset=-50)
+        self.assertEqual(conditioning.outlet_reading(self.outlet, 1000, 40000), (1950, 65534))
+
+    def test_batch_matches_live(self):
+        rng = np.random.default_rng(7)
+        readings = rng.integers(0, 3000, 400)
+        readings[rng.integers(0, 400, 10)] = conditioning.OVERLOAD_SENTINEL
+        for settings in ({'smoothing': 0.3}, {'spike_window': 5},
+                         {'spike_window': 4, 'smoothing': 0.05, 'calibration_gain': 1.1, 'calibration_offset': -20}):
+            with self.subTest(**settings):
+                conditioning._channels.clear()
+                self.configure(calibration_gain=1.0, calibration_offset=0, spike_window=1, smoothing=1.0)
+                self.configure(**settings)
+                live = [conditioning.outlet_reading(self.outlet, int(value), 0)[0] for value in readings]
+                batch, _ = conditioning.outlet_batch(self.outlet, readings, np.zeros(400, dtype=np.int64))
+                np.testing.assert_array_equal(batch, live)
+
+
+@mock.patch.object(ringbuffer, 'CAPACITY', 4)
+class RingBufferTests(TestCase):
+
+    def setUp(self):
+        ringbuffer._rings.clear()
+
+    def test_keeps_the_latest_samples_oldest_first(self):
+        now = timezone.now()
+        for n in range(6):
+            ringbuffer.record_outlet_reading('FE', 100 * n, n, n == 5, now - timedelta(seconds=10 * (5 - n)))
+        recent = ringbuffer.outlet_history('FE')
+        self.assertEqual(recent['current_a'], [200, 300, 400, 500])
+        self.assertEqual(recent['current_b'], [2, 3, 4, 5])
+        self.assertEqual(recent['is_overload'], [False, False, False, True])
+        self.assertEqual(recent['t'], sorted(recent['t']))
 
-# Create your tests here.
+    def test_old_samples_are_not_shown(self):
+        now = timezone.now()
+        ringbuffer.record_breaker_reading('01', 5000, now - timedelta(minutes=ringbuffer.BUFFER_MINUTES + 1))
+        self.assertIsNone(ringbuffer.breaker_history('01'))
+        ringbuffer.record_breaker_reading('01', 6000, now)
+        self.assertEqual(ringbuffer.breaker_history('01')['current_ma'], [6000])
+        self.assertIsNone(ringbuffer.outlet_history('AA'))
@@ -0,0 +1,237 @@
+"""
+Per-user live usage summary for the chatbot.
+
+The ingest views push every reading and alert into record_*(), which update
+a small in-memory summary per user: latest per-outlet load, today's peak and
+average per outlet, recent alerts and breaker headroom. render_context()
+turns it into a short prompt section under a hard token budget, so answering
+"which outlet is drawing the most" costs no history queries per message.
+
+State is process-local. The first render for a user fills anything the
+process has not seen yet (e.g. after a restart) from the database once.
+"""
+import threading
+from collections import deque
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Alert, CentralControlUnit, MainBreakerReading, Outlet
+
+OVERLOAD_SENTINEL = 65535
+RECENT_ALERTS = 5
+STALE_AFTER_SECONDS = 120
+RENDER_BUCKET_SECONDS = 60     # The summary shows times to the minute
+CHARS_PER_TOKEN = 4  # Rough estimate for English prompt text
+
+ALERT_LABELS = dict(Alert.ALERT_TYPES)
+
+
+class _UserUsage:
+    __slots__ = ('outlets', 'day', 'day_stats', 'alerts', 'breakers',
+                 'loaded', 'version', 'rendered')
+
+    def __init__(self):
+        self.outlets = {}       # device_id → {name, current_a, current_b, is_overload, timestamp}
+        self.day = None
+        self.day_stats = {}     # device_id → {peak_ma, sum_ma, samples}
+        self.alerts = deque(maxlen=RECENT_ALERTS)
+        self.breakers = {}      # ccu_id → {name, current_ma, threshold, timestamp}
+        self.loaded = False
+        self.version = 0
+        self.rendered = None    # (version, time bucket, max_tokens, text)
+
+
+_users = {}
+_lock = threading.Lock()
+
+
+def _state(user_id):
+    state = _users.get(user_id)
+    if state is None:
+        state = _users[user_id] = _UserUsage()
+    return state
+
+
+def _load_ma(current_a, current_b):
+    """Real load in mA — the overload sentinel is not a current."""
+    return sum(c for c in (current_a, current_b) if c != OVERLOAD_SENTINEL)
+
+
+def record_outlet_reading(outlet, current_a, current_b, is_overload, timestamp):
+    total = _load_ma(current_a, current_b)
+    day = timezone.localdate(timestamp)
+    with _lock:
+        state = _state(outlet.user_id)
+        state.outlets[outlet.device_id] = {
+            'name': outlet.name,
+            'current_a': current_a,
+            'current_b': current_b,
+            'is_overload': is_overload,
+            'timestamp': timestamp,
+        }
+        if state.day != day:
+            state.day = day
+            state.day_stats = {}
+        stats = state.day_stats.setdefault(outlet.device_id, {'peak_ma': 0, 'sum_ma': 0, 'samples': 0})
+        stats['peak_ma'] = max(stats['peak_ma'], total)
+        stats['sum_ma'] += total
+        stats['samples'] += 1
+        state.version += 1
+
+
+def record_breaker_reading(ccu, current_ma, timestamp):
+    if ccu is None:
+        return
+    with _lock:
+        state = _state(ccu.user_id)
+        state.breakers[ccu.ccu_id] = {
+            'name': ccu.name,
+            'current_ma': current_ma,
+            'threshold': ccu.breaker_threshold,
+            'timestamp': timestamp,
+        }
+        state.version += 1
+
+
+def _alert_source(outlet=None, ccu=None):
+    return (outlet.name, f'0x{outlet.device_id}') if outlet else (f'main breaker {ccu.name}', f'CCU {ccu.ccu_id}')
+
+
+def record_alert(outlet, alert_type, timestamp, ccu=None):
+    """Outlet alert, or a main breaker alert when called with outlet=None and ccu."""
+    owner = outlet or ccu
+    with _lock:
+        state = _state(owner.user_id)
+        state.alerts.appendleft((timestamp, alert_type, *_alert_source(outlet, ccu)))
+        state.version += 1
+
+
+def _warm_up(user):
+    """Fill in what this process has not observed yet from the latest DB rows."""
+    outlets = {}
+    for outlet in Outlet.objects.filter(user=user):
+        latest = outlet.sensor_data.first()
+        outlets[outlet.device_id] = {
+            'name': outlet.name,
+            'current_a': latest.current_a if latest else 0,
+            'current_b': latest.current_b if latest else 0,
+            'is_overload': latest.is_overload if latest else False,
+            'timestamp': latest.timestamp if latest else None,
+        }
+
+    breakers = {}
+    for ccu in CentralControlUnit.objects.filter(user=user):
+        latest = MainBreakerReading.objects.filter(ccu_id=ccu.ccu_id).first()
+        breakers[ccu.ccu_id] = {
+            'name': ccu.name,
+            'current_ma': latest.current_ma if latest else 0,
+            'threshold': ccu.breaker_threshold,
+            'timestamp': latest.timestamp if latest else None,
+        }
+
+    alerts = [
+        (a.created_at, a.alert_type, *_alert_source(a.outlet, a.ccu))
+        for a in Alert.objects.filter(Q(outlet__user=user) | Q(ccu__user=user))
+        .select_related('outlet', 'ccu')[:RECENT_ALERTS]
+    ]
+
+    with _lock:
+        state = _state(user.pk)
+        for device_id, reading in outlets.items():
+            state.outlets.setdefault(device_id, reading)
+        for ccu_id, reading in breakers.items():
+            state.breakers.setdefault(ccu_id, reading)
+        if not state.alerts:
+            state.alerts.extend(alerts)
+        state.loaded = True
+        state.version += 1
+
+
+def _fmt_amps(ma):
+    return f'{ma / 1000.0:.2f} A'
+
+
+def _fmt_time(ts):
+    return timezone.localtime(ts).strftime('%H:%M')
+
+
+def _build_lines(state, now):
+    """Summary lines in priority order (most important first)."""
+    lines = [f'Live usage as of {_fmt_time(now)}:']
+
+    for ccu_id, b in sorted(state.breakers.items()):
+        if b['threshold'] > 0:
+            pct = 100.0 * b['current_ma'] / b['threshold']
+            headroom = b['threshold'] - b['current_ma']
+            lines.append(
+                f'- Main breaker {b["name"]} (CCU {ccu_id}): {_fmt_amps(b["current_ma"])} of '
+                f'{_fmt_amps(b["threshold"])} limit ({pct:.0f}% used, {_fmt_amps(headroom)} headroom)'
+            )
+        else:
+            lines.append(f'- Main breaker {b["name"]} (CCU {ccu_id}): {_fmt_amps(b["current_ma"])}')
+
+    ranked = sorted(
+        state.outlets.items(),
+        key=lambda item: _load_ma(item[1]['current_a'], item[1]['current_b']),
+        reverse=True,
+    )
+    if ranked:
+        lines.append('Outlets (highest draw first):')
+    for device_id, o in ranked:
+        if o['timestamp'] is None:
+            lines.append(f'- {o["name"]} (0x{device_id}): no readings yet')
+            continue
+        socket_a = 'OVERLOAD' if o['current_a'] == OVERLOAD_SENTINEL else f'{o["current_a"]} mA'
+        socket_b = 'OVERLOAD' if o['current_b'] == OVERLOAD_SENTINEL else f'{o["current_b"]} mA'
+        line = (f'- {o["name"]} (0x{device_id}): {_fmt_amps(_load_ma(o["current_a"], o["current_b"]))} '
+                f'(A {socket_a}, B {socket_b})')
+        if (now - o['timestamp']).total_seconds() > STALE_AFTER_SECONDS:
+            line += f', last report {_fmt_time(o["timestamp"])}'
+        stats = state.day_stats.get(device_id) if state.day == timezone.localdate(now) else None
+        if stats and stats['samples']:
+            line += (f'; today peak {_fmt_amps(stats["peak_ma"])}, '
+                     f'avg {_fmt_amps(stats["sum_ma"] / stats["samples"])}')
+        lines.append(line)
+
+    if state.alerts:
+        lines.append('Recent alerts:')
+    for ts, alert_type, name, label in state.alerts:
+        lines.append(f'- {_fmt_time(ts)} {ALERT_LABELS.get(alert_type, alert_type)} on {name} ({label})')
+
+    return lines
+
+
+def render_context(user, max_tokens=300):
+    """
+    The user's live usage summary as prompt text, at most ~max_tokens long.
+    Re-rendered when a new reading or alert has arrived, and at least once
+    per RENDER_BUCKET_SECONDS so the "as of" time and the stale-outlet
+    markers keep moving while a device is silent.
+    """
+    with _lock:
+        state = _users.get(user.pk)
+        loaded = state is not None and state.loaded
+    if not loaded:
+        _warm_up(user)
+
+    now = timezone.now()
+    bucket = int(now.timestamp() // RENDER_BUCKET_SECONDS)
+    with _lock:
+        state = _users[user.pk]
+        key = (state.version, bucket, max_tokens)
+        if state.rendered and state.rendered[:3] == key:
+            return state.rendered[3]
+
+        budget = max_tokens * CHARS_PER_TOKEN - 40  # Room for the omission marker
+        lines = _build_lines(state, now)
+        kept, used = [], 0
+        for index, line in enumerate(lines):
+            if used + len(line) + 1 > budget:
+                kept.append(f'(+{len(lines) - index} more lines omitted)')
+                break
+            kept.append(line)
+            used += len(line) + 1
+        text = '\n'.join(kept)
+        state.rendered = (*key, text)
+        return text
@@ -4,6 +4,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
 from django.http import JsonResponse
+from . import ringbuffer
 from .models import Outlet, SensorData, UserProfile, PendingCommand, MainBreakerReading, CentralControlUnit, EventLog
 
 # ============ AUTHENTICATION VIEWS ============
@@ -150,15 +151,23 @@ def dashboard(request):
 
 @login_required
 def outlet_detail(request, device_id):
-    """Detail view for a specific outlet"""
+    """Detail view for a specific outlet — recent samples come from memory (outlets.ringbuffer)"""
     outlet = get_object_or_404(Outlet, device_id=device_id, user=request.user)
-    latest_data = outlet.sensor_data.first()
-    recent_data = outlet.sensor_data.all()[:50]
+    history = ringbuffer.outlet_history(outlet.device_id)
+    if not history:
+        # Nothing buffered (e.g. right after a restart): fall back to persisted rows
+        rows = list(outlet.sensor_data.all()[:50])[::-1]
+        if rows:
+            history = {
+                't': [int(r.timestamp.timestamp() * 1000) for r in rows],
+                'current_a': [r.current_a for r in rows],
+                'current_b': [r.current_b for r in rows],
+                'is_overload': [r.is_overload for r in rows],
+            }
     
     context = {
         'outlet': outlet,
-        'latest_data': latest_data,
-        'recent_data': recent_data,
+        'history': history,
     }
     return render(request, 'outlets/outlet_detail.html', context)
 